@@ -0,0 +1,16 @@
+from .metrics import (
+    Metric,
+    LocationsVisited,
+    Trips,
+    BedsUsed,
+    TimeSleeping,
+    LocationOccupancy,
+    TimeAtLeastNLocationsWithSpecificOccupancy,
+    create_default_metrics,
+)
+from .results import KEY_COLUMN, build_row, append_row, replace_row, write_rows
+from .occupancy import OccupancyTracker, OccupancyBand
+from .columnar import EventColumns, EventColumnsBuilder, compute_stats
+from .manifest import ProcessingManifest, fingerprint
+from .correlation import pearson_matrix, correlation_chunks, strong_correlations, StreamingCorrelation
+from .store import ResultsStore, ResultsBuffer, split_columns, is_results_store
@@ -0,0 +1,418 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy
+
+from engine.logger.logger import Logger
+from .metrics import mean_sd
+
+if TYPE_CHECKING:
+    from engine.logger.chunked import ChunkedLogReader
+
+TYPE_ENTERS_LOCATION = 0
+TYPE_PRACTICE_STARTS = 1
+TYPE_PRACTICE_ENDS = 2
+
+TYPE_CODES = {
+    Logger.A_ENTITYENTERSLOCATION: TYPE_ENTERS_LOCATION,
+    Logger.A_PRACTICESTARTS: TYPE_PRACTICE_STARTS,
+    Logger.A_PRACTICEENDS: TYPE_PRACTICE_ENDS,
+}
+
+DEFAULT_OCCUPANCY_THRESHOLDS: List[Tuple[int, int, int]] = [
+    (2, 10, 1),
+    (4, 10, 1),
+    (9, 10, 1),
+    (2, 10, 2),
+    (4, 10, 2),
+    (2, 10, 3),
+]
+
+
+class _Domain:
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def id(self, name: str) -> int:
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+
+def _first_seen_ids(names: numpy.ndarray) -> Tuple[numpy.ndarray, List[str]]:
+    # Ids in order of first appearance, as _Domain hands them out, -1 where
+    # there is no name
+    ids = numpy.full(len(names), -1, dtype=numpy.int32)
+    present = numpy.flatnonzero(names != None)  # noqa: E711
+    if len(present) == 0:
+        return ids, []
+
+    uniques, first, inverse = numpy.unique(names[present].astype(str), return_index=True, return_inverse=True)
+    by_appearance = numpy.argsort(first)
+    rank = numpy.empty(len(uniques), dtype=numpy.int32)
+    rank[by_appearance] = numpy.arange(len(uniques), dtype=numpy.int32)
+    ids[present] = rank[inverse.reshape(-1)]
+    return ids, uniques[by_appearance].tolist()
+
+
+class EventColumnsBuilder:
+    def __init__(self) -> None:
+        self.__entities = _Domain()
+        self.__locations = _Domain()
+        self.__practices = _Domain()
+        self.__beds = _Domain()
+        self.__agents: Dict[int, None] = {}
+        self.__tick: List[int] = []
+        self.__type: List[int] = []
+        self.__entity: List[int] = []
+        self.__destination: List[int] = []
+        self.__practice: List[int] = []
+        self.__bed: List[int] = []
+
+    def add(self, document: Dict[str, Any]) -> None:
+        if document["type"] == Logger.A_SALIENCEVECTOR:
+            self.__agents[self.__entities.id(document["entity"])] = None
+            return
+
+        type_code = TYPE_CODES.get(document["type"])
+        if type_code is None:
+            return
+
+        self.__tick.append(document["tick"])
+        self.__type.append(type_code)
+        self.__entity.append(self.__entities.id(document["entity"]))
+
+        if type_code == TYPE_ENTERS_LOCATION:
+            self.__destination.append(self.__locations.id(document["destination"]))
+            self.__practice.append(-1)
+        else:
+            self.__destination.append(-1)
+            self.__practice.append(self.__practices.id(document["practice_label"]))
+
+        if "bed" in document:
+            self.__bed.append(self.__beds.id(document["bed"]))
+        else:
+            self.__bed.append(-1)
+
+    def build(self) -> "EventColumns":
+        return EventColumns(
+            tick=numpy.array(self.__tick, dtype=numpy.int64),
+            type=numpy.array(self.__type, dtype=numpy.int8),
+            entity=numpy.array(self.__entity, dtype=numpy.int32),
+            destination=numpy.array(self.__destination, dtype=numpy.int32),
+            practice=numpy.array(self.__practice, dtype=numpy.int32),
+            bed=numpy.array(self.__bed, dtype=numpy.int32),
+            agents=numpy.array(list(self.__agents), dtype=numpy.int32),
+            entity_names=self.__entities.names,
+            location_names=self.__locations.names,
+            practice_names=self.__practices.names,
+            bed_names=self.__beds.names,
+        )
+
+
+class EventColumns:
+    def __init__(
+        self,
+        tick: numpy.ndarray,
+        type: numpy.ndarray,
+        entity: numpy.ndarray,
+        destination: numpy.ndarray,
+        practice: numpy.ndarray,
+        bed: numpy.ndarray,
+        agents: numpy.ndarray,
+        entity_names: Sequence[str],
+        location_names: Sequence[str],
+        practice_names: Sequence[str],
+        bed_names: Sequence[str],
+    ) -> None:
+        self.tick = tick
+        self.type = type
+        self.entity = entity
+        self.destination = destination
+        self.practice = practice
+        self.bed = bed
+        self.agents = agents
+        self.entity_names = list(entity_names)
+        self.location_names = list(location_names)
+        self.practice_names = list(practice_names)
+        self.bed_names = list(bed_names)
+
+    def __len__(self) -> int:
+        return len(self.tick)
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Dict[str, Any]]) -> "EventColumns":
+        builder = EventColumnsBuilder()
+        for document in documents:
+            builder.add(document)
+        return builder.build()
+
+    @classmethod
+    def from_chunks(cls, reader: "ChunkedLogReader") -> "EventColumns":
+        # Same columns as the builder, but filled a whole chunk at a time and
+        # put back in log order afterwards, instead of one call per document
+        seqs: List[int] = []
+        types: List[int] = []
+        ticks: List[int] = []
+        entities: List[str] = []
+        destinations: List[Any] = []
+        practices: List[Any] = []
+        beds: List[Any] = []
+        agent_seqs: List[int] = []
+        agent_names: List[str] = []
+
+        for chunk in reader.chunks(types=list(TYPE_CODES) + [Logger.A_SALIENCEVECTOR]):
+            entries = reader.read_chunk(chunk)
+            if chunk.type == Logger.A_SALIENCEVECTOR:
+                agent_seqs.extend(seq for seq, _ in entries)
+                agent_names.extend(document["entity"] for _, document in entries)
+                continue
+
+            type_code = TYPE_CODES[chunk.type]
+            seqs.extend(seq for seq, _ in entries)
+            types.extend([type_code] * len(entries))
+            ticks.extend(document["tick"] for _, document in entries)
+            entities.extend(document["entity"] for _, document in entries)
+            if type_code == TYPE_ENTERS_LOCATION:
+                destinations.extend(document["destination"] for _, document in entries)
+                practices.extend([None] * len(entries))
+            else:
+                destinations.extend([None] * len(entries))
+                practices.extend(document["practice_label"] for _, document in entries)
+            beds.extend(document.get("bed") for _, document in entries)
+
+        order = numpy.argsort(numpy.array(seqs, dtype=numpy.int64), kind="stable")
+
+        # Salience vectors name entities too, the entity ids follow both
+        named = numpy.argsort(numpy.array(seqs + agent_seqs, dtype=numpy.int64), kind="stable")
+        entity_ids = numpy.empty(len(named), dtype=numpy.int32)
+        entity_ids[named], entity_names = _first_seen_ids(numpy.array(entities + agent_names, dtype=object)[named])
+        agent_ids = entity_ids[len(seqs) :][numpy.argsort(numpy.array(agent_seqs, dtype=numpy.int64), kind="stable")]
+
+        destination, location_names = _first_seen_ids(numpy.array(destinations, dtype=object)[order])
+        practice, practice_names = _first_seen_ids(numpy.array(practices, dtype=object)[order])
+        bed, bed_names = _first_seen_ids(numpy.array(beds, dtype=object)[order])
+
+        return cls(
+            tick=numpy.array(ticks, dtype=numpy.int64)[order],
+            type=numpy.array(types, dtype=numpy.int8)[order],
+            entity=entity_ids[: len(seqs)][order],
+            destination=destination,
+            practice=practice,
+            bed=bed,
+            agents=numpy.array(list(dict.fromkeys(agent_ids.tolist())), dtype=numpy.int32),
+            entity_names=entity_names,
+            location_names=location_names,
+            practice_names=practice_names,
+            bed_names=bed_names,
+        )
+
+    @classmethod
+    def from_log(cls, filepath: str) -> "EventColumns":
+        from engine.logger.reader import LogReader
+
+        reader = LogReader(filepath)
+        if reader.chunked is not None:
+            return cls.from_chunks(reader.chunked)
+        return cls.from_documents(reader.documents())
+
+    def save(self, filepath: str) -> None:
+        numpy.savez_compressed(
+            filepath,
+            tick=self.tick,
+            type=self.type,
+            entity=self.entity,
+            destination=self.destination,
+            practice=self.practice,
+            bed=self.bed,
+            agents=self.agents,
+            entity_names=numpy.array(self.entity_names, dtype=str),
+            location_names=numpy.array(self.location_names, dtype=str),
+            practice_names=numpy.array(self.practice_names, dtype=str),
+            bed_names=numpy.array(self.bed_names, dtype=str),
+        )
+
+    @classmethod
+    def load(cls, filepath: str) -> "EventColumns":
+        with numpy.load(filepath) as data:
+            return cls(
+                tick=data["tick"],
+                type=data["type"],
+                entity=data["entity"],
+                destination=data["destination"],
+                practice=data["practice"],
+                bed=data["bed"],
+                agents=data["agents"],
+                entity_names=data["entity_names"].tolist(),
+                location_names=data["location_names"].tolist(),
+                practice_names=data["practice_names"].tolist(),
+                bed_names=data["bed_names"].tolist(),
+            )
+
+    def practice_id(self, label: str) -> int:
+        if label in self.practice_names:
+            return self.practice_names.index(label)
+        return -2
+
+    def agent_mask(self) -> numpy.ndarray:
+        return numpy.isin(self.entity, self.agents)
+
+
+def _mean_sd(values: numpy.ndarray, prefix: str) -> Dict[str, float]:
+    # statistics is used on the (small) per agent vector so the results match
+    # the streaming metrics exactly
+    return mean_sd(values.tolist(), prefix)
+
+
+def _count_per_entity(entities: numpy.ndarray, size: int) -> numpy.ndarray:
+    counts = numpy.bincount(entities, minlength=size)
+    return counts[counts > 0]
+
+
+def _unique_pairs_per_entity(
+    entities: numpy.ndarray, values: numpy.ndarray, size: int
+) -> numpy.ndarray:
+    stride = int(values.max(initial=0)) + 1
+    pairs = numpy.unique(entities.astype(numpy.int64) * stride + values)
+    return _count_per_entity(pairs // stride, size)
+
+
+def locations_visited(columns: EventColumns) -> Dict[str, float]:
+    moves = (columns.type == TYPE_ENTERS_LOCATION) & columns.agent_mask()
+    values = _unique_pairs_per_entity(
+        columns.entity[moves], columns.destination[moves], len(columns.entity_names)
+    )
+    return _mean_sd(values, "locations_visited")
+
+
+def trips(columns: EventColumns) -> Dict[str, float]:
+    moves = (columns.type == TYPE_ENTERS_LOCATION) & columns.agent_mask()
+    values = _count_per_entity(columns.entity[moves], len(columns.entity_names))
+    return _mean_sd(values, "trips")
+
+
+def beds_used(columns: EventColumns) -> Dict[str, float]:
+    starts = (
+        (columns.type == TYPE_PRACTICE_STARTS)
+        & (columns.practice == columns.practice_id("Sleep"))
+        & columns.agent_mask()
+    )
+    values = _unique_pairs_per_entity(
+        columns.entity[starts], columns.bed[starts], len(columns.entity_names)
+    )
+    return _mean_sd(values, "beds_used")
+
+
+def time_sleeping(columns: EventColumns) -> Dict[str, float]:
+    sleep = columns.practice == columns.practice_id("Sleep")
+    starts = (columns.type == TYPE_PRACTICE_STARTS) & sleep & columns.agent_mask()
+    ends = (columns.type == TYPE_PRACTICE_ENDS) & sleep
+    selected = numpy.flatnonzero(starts | ends)
+
+    # Group the sleep events by entity (keeping log order) and pair every
+    # end with the latest start of the same entity
+    order = selected[numpy.argsort(columns.entity[selected], kind="stable")]
+    entity = columns.entity[order]
+    tick = columns.tick[order]
+    is_start = starts[order]
+    is_end = ends[order]
+
+    position = numpy.arange(len(order))
+    group_first = numpy.ones(len(order), dtype=bool)
+    group_first[1:] = entity[1:] != entity[:-1]
+    last_start = numpy.maximum.accumulate(
+        numpy.where(is_start | group_first, position, 0)
+    )
+
+    paired = is_end & is_start[last_start]
+    durations = tick[paired] - tick[last_start[paired]]
+
+    totals = numpy.zeros(len(columns.entity_names), dtype=numpy.int64)
+    numpy.add.at(totals, entity[paired], durations)
+    has_ended = numpy.zeros(len(columns.entity_names), dtype=bool)
+    has_ended[entity[paired]] = True
+
+    return _mean_sd(totals[has_ended], "time_sleeping")
+
+
+def location_occupancy(
+    columns: EventColumns, thresholds: Sequence[Tuple[int, int, int]]
+) -> Dict[str, float]:
+    moves = numpy.flatnonzero((columns.type == TYPE_ENTERS_LOCATION) & columns.agent_mask())
+    num_moves = len(moves)
+    tick = columns.tick[moves]
+    entity = columns.entity[moves]
+    destination = columns.destination[moves]
+
+    # Previous location of the moving agent (-1 on its first move)
+    by_entity = numpy.argsort(entity, kind="stable")
+    previous = numpy.full(num_moves, -1, dtype=numpy.int64)
+    same_entity = entity[by_entity[1:]] == entity[by_entity[:-1]]
+    previous[by_entity[1:][same_entity]] = destination[by_entity[:-1][same_entity]]
+
+    # Every move leaves the previous location and enters the destination
+    leaves = numpy.flatnonzero(previous >= 0)
+    change_event = numpy.concatenate([leaves, numpy.arange(num_moves)])
+    change_location = numpy.concatenate([previous[leaves], destination])
+    change_delta = numpy.concatenate(
+        [-numpy.ones(len(leaves), dtype=numpy.int64), numpy.ones(num_moves, dtype=numpy.int64)]
+    )
+    change_kind = numpy.concatenate(
+        [numpy.zeros(len(leaves), dtype=numpy.int8), numpy.ones(num_moves, dtype=numpy.int8)]
+    )
+
+    order = numpy.lexsort((change_kind, change_event, change_location))
+    change_event = change_event[order]
+    change_location = change_location[order]
+    change_delta = change_delta[order]
+
+    group_first = numpy.ones(len(order), dtype=bool)
+    group_first[1:] = change_location[1:] != change_location[:-1]
+    running = numpy.cumsum(change_delta)
+    group_base = (running - change_delta)[group_first]
+    occupants_after = running - numpy.repeat(
+        group_base, numpy.diff(numpy.append(numpy.flatnonzero(group_first), len(order)))
+    )
+    occupants_before = occupants_after - change_delta
+
+    # Time elapsed before every move, measured from the previous move
+    elapsed = numpy.diff(tick, prepend=0)
+    elapsed[elapsed < 0] = 0
+
+    stats = {}
+    for min_occupants, max_occupants, min_locations in thresholds:
+        inside_after = (occupants_after >= min_occupants) & (occupants_after <= max_occupants)
+        # A location only counts once it has been entered for the first time
+        inside_before = (
+            (occupants_before >= min_occupants)
+            & (occupants_before <= max_occupants)
+            & ~group_first
+        )
+        changes = numpy.bincount(
+            change_event,
+            weights=inside_after.astype(numpy.int64) - inside_before.astype(numpy.int64),
+            minlength=num_moves,
+        )
+        locations_after = numpy.cumsum(changes)
+        locations_before = numpy.concatenate([[0], locations_after[:-1]])
+
+        time = int(elapsed[locations_before >= min_locations].sum())
+        stats[
+            f"time_atleast_{min_locations}Locations_between_{min_occupants}_and_{max_occupants}_occupants"
+        ] = time
+
+    return stats
+
+
+def compute_stats(
+    columns: EventColumns,
+    thresholds: Sequence[Tuple[int, int, int]] = DEFAULT_OCCUPANCY_THRESHOLDS,
+) -> Dict[str, float]:
+    stats: Dict[str, float] = {}
+    stats.update(locations_visited(columns))
+    stats.update(trips(columns))
+    stats.update(beds_used(columns))
+    stats.update(time_sleeping(columns))
+    stats.update(location_occupancy(columns, thresholds))
+    return stats
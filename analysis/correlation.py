@@ -0,0 +1,232 @@
+import os
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy
+from scipy import stats
+
+from .store import ResultsStore
+
+
+def pearson_pvalues(r: numpy.ndarray, n: Union[int, numpy.ndarray]) -> numpy.ndarray:
+    # Two sided p-value under the exact distribution of r, as in
+    # scipy.stats.pearsonr; n is one count for every pair or a count per pair
+    if numpy.ndim(n) == 0:
+        if n < 3:
+            return numpy.full(r.shape, numpy.nan)
+        distribution = stats.beta(n / 2 - 1, n / 2 - 1, loc=-1, scale=2)
+        return 2 * distribution.sf(numpy.abs(r))
+
+    n = numpy.broadcast_to(n, r.shape)
+    p = numpy.full(r.shape, numpy.nan)
+    valid = n >= 3
+    shape = n[valid] / 2 - 1
+    p[valid] = 2 * stats.beta(shape, shape, loc=-1, scale=2).sf(numpy.abs(r[valid]))
+    return p
+
+
+def standardize(values: numpy.ndarray) -> numpy.ndarray:
+    centered = values - values.mean(axis=0)
+    norms = numpy.linalg.norm(centered, axis=0)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return centered / norms
+
+
+def pearson_matrix(
+    features: numpy.ndarray, metrics: numpy.ndarray
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    r = numpy.clip(standardize(features).T @ standardize(metrics), -1.0, 1.0)
+    return r, pearson_pvalues(r, features.shape[0])
+
+
+def present_means(values: numpy.ndarray) -> numpy.ndarray:
+    # Column means over the values present, 0 for columns without any
+    present = ~numpy.isnan(values)
+    return numpy.where(present, values, 0.0).sum(axis=0) / numpy.maximum(present.sum(axis=0), 1)
+
+
+def pairwise_sums(
+    features: numpy.ndarray,
+    metrics: numpy.ndarray,
+    shift_features: numpy.ndarray,
+    shift_metrics: numpy.ndarray,
+) -> List[numpy.ndarray]:
+    # Feature x metric sums over the rows where both values are present
+    # (NaN is missing): counts, sums of each side, sums of squares of each
+    # side and sums of products. Values are shifted by a guess of their mean
+    # first, which keeps the sums of squares from cancelling.
+    present_features = ~numpy.isnan(features)
+    present_metrics = ~numpy.isnan(metrics)
+    x = numpy.where(present_features, features - shift_features, 0.0)
+    y = numpy.where(present_metrics, metrics - shift_metrics, 0.0)
+    present_features = present_features.astype(numpy.float64)
+    present_metrics = present_metrics.astype(numpy.float64)
+    return [
+        present_features.T @ present_metrics,
+        x.T @ present_metrics,
+        present_features.T @ y,
+        (x**2).T @ present_metrics,
+        present_features.T @ (y**2),
+        x.T @ y,
+    ]
+
+
+def pairwise_pearson(sums: Sequence[numpy.ndarray]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    # r over pairwise complete observations, and the number of them
+    counts, sum_features, sum_metrics, squares_features, squares_metrics, products = sums
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        covariance = products - sum_features * sum_metrics / counts
+        variance_features = squares_features - sum_features**2 / counts
+        variance_metrics = squares_metrics - sum_metrics**2 / counts
+        r = covariance / numpy.sqrt(variance_features * variance_metrics)
+    return numpy.clip(r, -1.0, 1.0), counts
+
+
+def column_values(data, columns: Sequence[str]) -> numpy.ndarray:
+    # Rows x columns block of a DataFrame, or of a ResultsStore read from its
+    # memory mapped columns
+    if isinstance(data, ResultsStore):
+        return data.matrix(columns)
+    return data[list(columns)].to_numpy(dtype=numpy.float64)
+
+
+def correlation_chunks(
+    data, features: Sequence[str], metrics: Sequence[str], chunk_size: int = 1024
+) -> Iterator[Tuple[List[str], numpy.ndarray, numpy.ndarray]]:
+    # Features are standardized and correlated chunk_size columns at a time,
+    # so besides the metrics only one (rows x chunk_size) block is
+    # materialized at once when data is a ResultsStore; a DataFrame is
+    # already in memory. Chunks with missing values are correlated over
+    # pairwise complete rows, as StreamingCorrelation does.
+    metrics_values = column_values(data, metrics)
+    metrics_missing = numpy.isnan(metrics_values).any()
+    metrics_standardized = standardize(metrics_values)
+    n = len(data)
+
+    for start in range(0, len(features), chunk_size):
+        chunk = list(features[start : start + chunk_size])
+        features_values = column_values(data, chunk)
+        if metrics_missing or numpy.isnan(features_values).any():
+            r, counts = pairwise_pearson(
+                pairwise_sums(
+                    features_values,
+                    metrics_values,
+                    present_means(features_values),
+                    present_means(metrics_values),
+                )
+            )
+            yield chunk, r, pearson_pvalues(r, counts)
+            continue
+
+        r = numpy.clip(standardize(features_values).T @ metrics_standardized, -1.0, 1.0)
+        yield chunk, r, pearson_pvalues(r, n)
+
+
+def strong_correlations(
+    chunks: Iterator[Tuple[List[str], numpy.ndarray, numpy.ndarray]],
+    metrics: Sequence[str],
+    threshold: float = 0.9,
+) -> Iterator[Tuple[str, str, float, float]]:
+    for chunk, r, p in chunks:
+        rows, columns = numpy.nonzero(numpy.abs(r) > threshold)
+        for row, column in zip(rows, columns):
+            yield chunk[row], metrics[column], r[row, column], p[row, column]
+
+
+class StreamingCorrelation:
+    # Feature x metric sums over pairwise complete rows (see pairwise_sums),
+    # added batch by batch. The shifts are the means of the first batch.
+    # Memory depends on the number of columns only, never on the number of
+    # rows.
+
+    def __init__(self, features: Sequence[str], metrics: Sequence[str]) -> None:
+        self.__features: List[str] = list(features)
+        self.__metrics: List[str] = list(metrics)
+        self.__n: int = 0
+        self.__shift_features: Optional[numpy.ndarray] = None
+        self.__shift_metrics: Optional[numpy.ndarray] = None
+        self.__sums: List[numpy.ndarray] = [
+            numpy.zeros((len(self.__features), len(self.__metrics))) for _ in range(6)
+        ]
+        # Rows already folded in per source (e.g. results file), saved with
+        # the sums so sources that grow are resumed where they were left
+        self.__consumed: Dict[str, int] = {}
+
+    @property
+    def features(self) -> List[str]:
+        return self.__features
+
+    @property
+    def metrics(self) -> List[str]:
+        return self.__metrics
+
+    @property
+    def n(self) -> int:
+        # Rows folded in, complete or not
+        return self.__n
+
+    def consumed(self, source: str) -> int:
+        return self.__consumed.get(source, 0)
+
+    def mark_consumed(self, source: str, rows: int) -> None:
+        self.__consumed[source] = rows
+
+    def update(self, features: numpy.ndarray, metrics: numpy.ndarray) -> None:
+        batch_n = features.shape[0]
+        if batch_n == 0:
+            return
+
+        if self.__shift_features is None or self.__shift_metrics is None:
+            self.__shift_features = present_means(features)
+            self.__shift_metrics = present_means(metrics)
+
+        batch = pairwise_sums(features, metrics, self.__shift_features, self.__shift_metrics)
+        for total, batch_sum in zip(self.__sums, batch):
+            total += batch_sum
+        self.__n += batch_n
+
+    def update_frame(self, data) -> int:
+        # Columns a frame lacks count as missing in all of its rows
+        frame = data.reindex(columns=self.__features + self.__metrics)
+        self.update(
+            frame[self.__features].to_numpy(dtype=numpy.float64),
+            frame[self.__metrics].to_numpy(dtype=numpy.float64),
+        )
+        return len(frame)
+
+    def chunks(
+        self, chunk_size: int = 1024
+    ) -> Iterator[Tuple[List[str], numpy.ndarray, numpy.ndarray]]:
+        for start in range(0, len(self.__features), chunk_size):
+            end = start + chunk_size
+            r, counts = pairwise_pearson([total[start:end] for total in self.__sums])
+            yield self.__features[start:end], r, pearson_pvalues(r, counts)
+
+    def save(self, filepath: str) -> None:
+        temporary_file = f"{filepath}.tmp"
+        with open(temporary_file, "wb") as file:
+            numpy.savez(
+                file,
+                features=numpy.array(self.__features, dtype=str),
+                metrics=numpy.array(self.__metrics, dtype=str),
+                n=numpy.array(self.__n),
+                shift_features=self.__shift_features if self.__shift_features is not None else numpy.zeros(0),
+                shift_metrics=self.__shift_metrics if self.__shift_metrics is not None else numpy.zeros(0),
+                sums=numpy.array(self.__sums),
+                sources=numpy.array(list(self.__consumed), dtype=str),
+                consumed=numpy.array(list(self.__consumed.values()), dtype=numpy.int64),
+            )
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_file, filepath)
+
+    @classmethod
+    def load(cls, filepath: str) -> "StreamingCorrelation":
+        with numpy.load(filepath) as data:
+            correlation = cls(data["features"].tolist(), data["metrics"].tolist())
+            correlation.__n = int(data["n"])
+            if correlation.__n > 0:
+                correlation.__shift_features = data["shift_features"]
+                correlation.__shift_metrics = data["shift_metrics"]
+                correlation.__sums = list(data["sums"])
+            correlation.__consumed = dict(zip(data["sources"].tolist(), data["consumed"].tolist()))
+        return correlation
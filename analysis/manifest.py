@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+
+
+def file_hash(filepath: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(filepath: str) -> Dict[str, Any]:
+    # Taken before a log is read, so a log that changes while it is processed
+    # no longer matches and is processed again
+    stat = os.stat(filepath)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_hash(filepath)}
+
+
+class ProcessingManifest:
+    # Remembers which logs have already been processed, keyed by path and
+    # identified by size, modification time and content hash. The hash is only
+    # recomputed when size or mtime changed, so unchanged logs are skipped
+    # without reading them. Changes are only written by save(), once per batch
+    # of logs.
+
+    def __init__(self, filepath: str) -> None:
+        self.__filepath: str = filepath
+        self.__entries: Dict[str, Dict[str, Any]] = {}
+
+        if os.path.isfile(filepath):
+            with open(filepath, "r") as file:
+                self.__entries = json.load(file)
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        return self.__entries
+
+    def key(self, filepath: str) -> str:
+        return os.path.abspath(filepath)
+
+    def is_recorded(self, filepath: str) -> bool:
+        # Processed before, possibly in an older version
+        return self.key(filepath) in self.__entries
+
+    def is_processed(self, filepath: str) -> bool:
+        entry: Optional[Dict[str, Any]] = self.__entries.get(self.key(filepath))
+        if entry is None:
+            return False
+
+        stat = os.stat(filepath)
+        if stat.st_size != entry["size"]:
+            return False
+
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+
+        # Touched but possibly unchanged
+        if file_hash(filepath) != entry["sha256"]:
+            return False
+
+        entry["mtime_ns"] = stat.st_mtime_ns
+        return True
+
+    def mark_processed(self, filepath: str, footprint: Dict[str, Any]) -> None:
+        # footprint is the fingerprint taken before the log was processed
+        self.__entries[self.key(filepath)] = footprint
+
+    def save(self) -> None:
+        temporary_file = f"{self.__filepath}.tmp"
+        with open(temporary_file, "w") as file:
+            json.dump(self.__entries, file, indent=1)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_file, self.__filepath)
@@ -0,0 +1,140 @@
+from abc import abstractmethod
+from typing import Dict, List, Set, Tuple
+import statistics
+
+from engine.logger.logger import LogEntry, LogSink
+from .occupancy import OccupancyTracker
+
+def mean_sd(values: List[float], prefix: str) -> Dict[str, float]:
+    # NaN when there are too few values, e.g. no agent slept in a short run
+    return {
+        f"{prefix}_mean": statistics.mean(values) if values else float("nan"),
+        f"{prefix}_sd": statistics.stdev(values) if len(values) > 1 else float("nan"),
+    }
+
+class Metric(LogSink):
+    @abstractmethod
+    def stats(self) -> Dict[str, float]:
+        pass
+
+class LocationsVisited(Metric):
+    def __init__(self, agents: Set[str] ) -> None:
+        self.__agents_names = agents
+        self.__agents_locations_visited: Dict[str, Set[str]] = {}
+    
+    def new_entry(self, new_entry: LogEntry) -> None:
+        if new_entry.type == "WORLD_EVENT" and new_entry.subtype == "ENTITY_ENTERS_LOCATION":
+            if new_entry.properties['entity'] not in self.__agents_names:
+                return
+            if new_entry.properties['entity'] not in self.__agents_locations_visited:
+                self.__agents_locations_visited[new_entry.properties['entity']] = {new_entry.properties['destination']}
+            else:
+                self.__agents_locations_visited[new_entry.properties['entity']].add(new_entry.properties['destination'])
+        
+    def stats(self) -> Dict[str, float]:
+        values = [len(locations) for locations in self.__agents_locations_visited.values()] 
+        return mean_sd(values, 'locations_visited')
+
+
+class Trips(Metric):
+    def __init__(self, agents: Set[str] ) -> None:
+        self.__agents_names = agents
+        self.__agents_trips: Dict[str, int] = {}
+    
+    def new_entry(self, new_entry: LogEntry) -> None:
+        if new_entry.type == "WORLD_EVENT" and new_entry.subtype == "ENTITY_ENTERS_LOCATION":
+            if new_entry.properties['entity'] not in self.__agents_names:
+                return
+            if new_entry.properties['entity'] not in self.__agents_trips:
+                self.__agents_trips[new_entry.properties['entity']] = 1
+            else:
+                self.__agents_trips[new_entry.properties['entity']] += 1
+        
+    def stats(self) -> Dict[str, float]:
+        values = [trips for trips in self.__agents_trips.values()] 
+        return mean_sd(values, 'trips')
+
+class BedsUsed(Metric):
+    def __init__(self, agents: Set[str] ) -> None:
+        self.__agents_names = agents
+        self.__agents_beds_used: Dict[str, Set[str]] = {}
+    
+    def new_entry(self, new_entry: LogEntry) -> None:
+        if new_entry.type == "WORLD_EVENT" and new_entry.subtype == "PRACTICE_STARTS" and new_entry.properties['practice_label'] == "Sleep":
+            if new_entry.properties['entity'] not in self.__agents_names:
+                return
+            if new_entry.properties['entity'] not in self.__agents_beds_used:
+                self.__agents_beds_used[new_entry.properties['entity']] = {new_entry.properties['bed']}
+            else:
+                self.__agents_beds_used[new_entry.properties['entity']].add(new_entry.properties['bed'])
+        
+    def stats(self) -> Dict[str, float]:
+        values = [len(beds) for beds in self.__agents_beds_used.values()] 
+        return mean_sd(values, 'beds_used')
+
+class TimeSleeping(Metric):
+    def __init__(self, agents: Set[str] ) -> None:
+        self.__agents_names = agents
+        self.__agents_time_sleeping: Dict[str, float] = {}
+        self.__agent_last_sleeping_start: Dict[str, int] = {}
+    
+    def new_entry(self, new_entry: LogEntry) -> None:
+        if new_entry.type == "WORLD_EVENT" and new_entry.subtype == "PRACTICE_STARTS" and new_entry.properties['practice_label'] == "Sleep":
+            
+            if new_entry.properties['entity'] not in self.__agents_names:
+                return
+            
+            self.__agent_last_sleeping_start[new_entry.properties['entity']] = new_entry.tick
+
+
+        if new_entry.type == "WORLD_EVENT" and new_entry.subtype == "PRACTICE_ENDS" and new_entry.properties['practice_label'] == "Sleep":
+            if new_entry.properties['entity'] not in self.__agents_time_sleeping:
+                self.__agents_time_sleeping[new_entry.properties['entity']] = new_entry.tick - self.__agent_last_sleeping_start[new_entry.properties['entity']]
+            else:
+                self.__agents_time_sleeping[new_entry.properties['entity']] += new_entry.tick - self.__agent_last_sleeping_start[new_entry.properties['entity']]
+        
+    def stats(self) -> Dict[str, float]:
+        values = [sleeping_time for sleeping_time in self.__agents_time_sleeping.values()] 
+        return mean_sd(values, 'time_sleeping')
+
+
+class LocationOccupancy(Metric):
+    def __init__(self, agents: Set[str], thresholds: List[Tuple[int, int, int]]) -> None:
+        self.__agents_names = agents
+        self.__tracker = OccupancyTracker()
+        for min_occupants, max_occupants, min_locations in thresholds:
+            self.__tracker.add_band(min_occupants, max_occupants, min_locations)
+
+    def new_entry(self, new_entry: LogEntry) -> None:
+        if new_entry.type == "WORLD_EVENT" and new_entry.subtype == "ENTITY_ENTERS_LOCATION":
+            agent = new_entry.properties['entity']
+
+            if agent not in self.__agents_names:
+                return
+
+            self.__tracker.advance(new_entry.tick)
+            self.__tracker.move(agent, new_entry.properties['destination'])
+
+    def stats(self) -> Dict[str, float]:
+        return {f'time_atleast_{band.min_locations}Locations_between_{band.min_occupants}_and_{band.max_occupants}_occupants': band.time for band in self.__tracker.bands}
+
+class TimeAtLeastNLocationsWithSpecificOccupancy(LocationOccupancy):
+    def __init__(self, agents: Set[str], min_occupants: int, max_occupants: int, min_locations: int) -> None:
+        super().__init__(agents, [(min_occupants, max_occupants, min_locations)])
+
+
+def create_default_metrics(agents: Set[str]) -> List[Metric]:
+    metrics : List[Metric] = []
+    metrics.append(LocationsVisited(agents=agents))
+    metrics.append(Trips(agents=agents))
+    metrics.append(BedsUsed(agents=agents))
+    metrics.append(TimeSleeping(agents=agents))
+    metrics.append(LocationOccupancy(agents=agents, thresholds=[
+        (2, 10, 1),
+        (4, 10, 1),
+        (9, 10, 1),
+        (2, 10, 2),
+        (4, 10, 2),
+        (2, 10, 3),
+    ]))
+    return metrics
@@ -0,0 +1,87 @@
+from typing import Dict, List, Optional
+
+
+class OccupancyBand:
+    def __init__(self, min_occupants: int, max_occupants: int, min_locations: int) -> None:
+        self.min_occupants: int = min_occupants
+        self.max_occupants: int = max_occupants
+        self.min_locations: int = min_locations
+        self.locations: int = 0
+        self.time: int = 0
+
+    def contains(self, occupants: int) -> bool:
+        return self.min_occupants <= occupants <= self.max_occupants
+
+
+class OccupancyTracker:
+    # Keeps the number of occupants per location and a histogram of how many
+    # locations have each occupancy. Every band keeps a running count of the
+    # locations inside it, so a move costs O(bands) and queries are O(1).
+
+    def __init__(self) -> None:
+        self.__agent_location: Dict[str, str] = {}
+        self.__occupancy: Dict[str, int] = {}
+        self.__locations_per_occupancy: Dict[int, int] = {}
+        self.__bands: List[OccupancyBand] = []
+        self.__last_tick: int = 0
+
+    @property
+    def bands(self) -> List[OccupancyBand]:
+        return self.__bands
+
+    def add_band(self, min_occupants: int, max_occupants: int, min_locations: int) -> OccupancyBand:
+        band = OccupancyBand(min_occupants, max_occupants, min_locations)
+        for occupants, locations in self.__locations_per_occupancy.items():
+            if band.contains(occupants):
+                band.locations += locations
+        self.__bands.append(band)
+        return band
+
+    def occupancy(self, location: str) -> int:
+        return self.__occupancy.get(location, 0)
+
+    def locations_with_occupancy(self, min_occupants: int, max_occupants: int) -> int:
+        return sum(
+            locations
+            for occupants, locations in self.__locations_per_occupancy.items()
+            if min_occupants <= occupants <= max_occupants
+        )
+
+    def advance(self, tick: int) -> None:
+        if tick <= self.__last_tick:
+            return
+
+        delta = tick - self.__last_tick
+        for band in self.__bands:
+            if band.locations >= band.min_locations:
+                band.time += delta
+        self.__last_tick = tick
+
+    def move(self, agent: str, location: str) -> None:
+        previous_location: Optional[str] = self.__agent_location.get(agent)
+        if previous_location is not None:
+            self.__change(previous_location, -1)
+
+        if location not in self.__occupancy:
+            self.__occupancy[location] = 0
+            self.__locations_per_occupancy[0] = self.__locations_per_occupancy.get(0, 0) + 1
+            for band in self.__bands:
+                if band.contains(0):
+                    band.locations += 1
+
+        self.__change(location, 1)
+        self.__agent_location[agent] = location
+
+    def __change(self, location: str, delta: int) -> None:
+        before = self.__occupancy[location]
+        after = before + delta
+        self.__occupancy[location] = after
+
+        self.__locations_per_occupancy[before] -= 1
+        self.__locations_per_occupancy[after] = self.__locations_per_occupancy.get(after, 0) + 1
+
+        for band in self.__bands:
+            was_inside = band.contains(before)
+            is_inside = band.contains(after)
+            if was_inside != is_inside:
+                band.locations += 1 if is_inside else -1
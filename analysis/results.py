@@ -0,0 +1,80 @@
+import csv
+import os
+from typing import Dict, Iterable, List
+
+from .metrics import Metric
+
+# Column naming the log a row was computed from, in results appended across
+# runs
+KEY_COLUMN = "log"
+
+
+def build_row(
+    agent_practices: Iterable[Dict[str, Dict[str, float]]], metrics: Iterable[Metric]
+) -> Dict[str, float]:
+    row = {}
+
+    for agent_id, practices in enumerate(agent_practices):
+        prefix = f"A{agent_id}"
+        for practice in practices.values():
+            for label, weight in practice.items():
+                row[f"{prefix}_{label}"] = weight
+
+    for metric in metrics:
+        row.update(metric.stats())
+
+    return row
+
+
+def read_header(output_file: str) -> List[str]:
+    if not os.path.isfile(output_file):
+        return []
+
+    with open(output_file, "r", newline="") as csvfile:
+        return next(csv.reader(csvfile), [])
+
+
+def append_row(output_file: str, row: Dict[str, float]) -> None:
+    header = read_header(output_file)
+
+    if header and any(name not in header for name in row.keys()):
+        # New columns: rewrite the file once with the extended header
+        with open(output_file, "r", newline="") as csvfile:
+            rows = list(csv.DictReader(csvfile))
+        write_rows(output_file, rows + [row])
+        return
+
+    with open(output_file, "a", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=header or list(row.keys()))
+
+        if not header:
+            writer.writeheader()
+
+        writer.writerow(row)
+        csvfile.flush()
+        os.fsync(csvfile.fileno())
+
+
+def replace_row(output_file: str, row: Dict[str, float]) -> None:
+    # Rewrites the file with row in place of the rows under the same key
+    if not os.path.isfile(output_file):
+        append_row(output_file, row)
+        return
+
+    with open(output_file, "r", newline="") as csvfile:
+        rows = [old for old in csv.DictReader(csvfile) if old.get(KEY_COLUMN) != row[KEY_COLUMN]]
+    write_rows(output_file, rows + [row])
+
+
+def write_rows(output_file: str, rows: List[Dict[str, float]]) -> None:
+    field_names: Dict[str, None] = {}
+    for row in rows:
+        for name in row.keys():
+            field_names[name] = None
+
+    temporary_file = f"{output_file}.tmp"
+    with open(temporary_file, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(field_names))
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temporary_file, output_file)
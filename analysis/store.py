@@ -0,0 +1,285 @@
+import json
+import os
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy
+
+from .results import KEY_COLUMN
+
+STORE_VERSION = 1
+SCHEMA_FILE = "schema.json"
+KEYS_FILE = "keys.jsonl"
+
+# Every append touches every column file, rows are buffered and appended
+# this many at a time
+ROWS_PER_APPEND = 64
+SECONDS_PER_APPEND = 60.0
+
+# Salience columns are A{agent}_{practice}_{feature}_{weight|bias}, every
+# other column but the row key is a metric
+FEATURE_COLUMN = re.compile(r"A\d+_")
+
+
+def split_columns(columns: Sequence[str]) -> Tuple[List[str], List[str]]:
+    features = [column for column in columns if FEATURE_COLUMN.match(column)]
+    metrics = [column for column in columns if not FEATURE_COLUMN.match(column) and column != KEY_COLUMN]
+    return features, metrics
+
+
+def is_results_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, SCHEMA_FILE))
+
+
+class ResultsStore:
+    # Result rows as a directory of float64 column files plus schema.json
+    # holding the column names and the number of rows. Rows are appended in
+    # batches; a column first seen in a batch is created with NaN for the
+    # rows before it, and a row missing a column gets NaN. The schema is
+    # replaced after the columns are written, so an interrupted append leaves
+    # the store at its previous rows. One writer at a time.
+    # Rows can be appended under a key (e.g. the log they were computed from);
+    # a row appended under a key already stored replaces that row in place.
+    # keys.jsonl holds the [row, key] pairs in append order, what an
+    # interrupted append left past the stored rows is ignored. An interrupted
+    # replacement can leave a row mixing old and new values until the row is
+    # appended again. Rows replaced after a StreamingCorrelation folded them
+    # keep their old values in its state.
+
+    def __init__(self, path: str) -> None:
+        self.__path: str = path
+        self.__columns: List[str] = []
+        self.__index: Dict[str, int] = {}
+        self.__rows: int = 0
+        self.__keys: Dict[str, int] = {}
+        self.__keys_size: int = 0
+
+        if is_results_store(path):
+            with open(os.path.join(path, SCHEMA_FILE), "r") as file:
+                schema = json.load(file)
+            if schema["version"] != STORE_VERSION:
+                raise Exception(f"Unsupported results store version {schema['version']}")
+            self.__columns = schema["columns"]
+            self.__index = {column: i for i, column in enumerate(self.__columns)}
+            self.__rows = schema["rows"]
+            self.__load_keys()
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.__save_schema()
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def columns(self) -> List[str]:
+        return self.__columns
+
+    def __len__(self) -> int:
+        return self.__rows
+
+    def __column_file(self, index: int) -> str:
+        # Column names hold spaces and location names, files are numbered
+        return os.path.join(self.__path, f"{index}.f64")
+
+    def __load_keys(self) -> None:
+        filepath = os.path.join(self.__path, KEYS_FILE)
+        if not os.path.isfile(filepath):
+            return
+        with open(filepath, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                row, key = json.loads(line)
+                if row >= self.__rows:
+                    break
+                self.__keys[key] = row
+                self.__keys_size += len(line)
+
+    def __save_schema(self) -> None:
+        temporary_file = os.path.join(self.__path, f"{SCHEMA_FILE}.tmp")
+        with open(temporary_file, "w") as file:
+            json.dump({"version": STORE_VERSION, "rows": self.__rows, "columns": self.__columns}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_file, os.path.join(self.__path, SCHEMA_FILE))
+
+    # Writing
+
+    def append(self, rows: Iterable[Dict[str, Any]], keys: Optional[Sequence[Optional[str]]] = None) -> None:
+        rows = list(rows)
+        if not rows:
+            return
+        keys = [None] * len(rows) if keys is None else list(keys)
+        if len(keys) != len(rows):
+            raise Exception("Appending results rows with a different number of keys")
+
+        # Row each row goes to: a new row, or the stored row with its key.
+        # Later rows with the same key win.
+        targets: List[int] = []
+        new_keys: List[Optional[str]] = []
+        added: Dict[str, int] = {}
+        for key in keys:
+            if key is not None and key in self.__keys:
+                targets.append(self.__keys[key])
+            elif key is not None and key in added:
+                targets.append(added[key])
+            else:
+                targets.append(self.__rows + len(new_keys))
+                new_keys.append(key)
+                if key is not None:
+                    added[key] = targets[-1]
+
+        # Nothing changes on the store until the batch is built, a row that
+        # fails to convert leaves it as it was
+        columns = list(self.__columns)
+        positions = dict(self.__index)
+        for row in rows:
+            for column in row:
+                if column not in positions:
+                    positions[column] = len(columns)
+                    columns.append(column)
+
+        replaced = sorted({target for target in targets if target < self.__rows})
+        replaced_index = {target: j for j, target in enumerate(replaced)}
+        batch = numpy.full((len(columns), len(new_keys)), numpy.nan)
+        replacements = numpy.full((len(columns), len(replaced)), numpy.nan)
+        for target, row in zip(targets, rows):
+            if target < self.__rows:
+                values, j = replacements, replaced_index[target]
+            else:
+                values, j = batch, target - self.__rows
+            values[:, j] = numpy.nan
+            for column, value in row.items():
+                values[positions[column], j] = value
+
+        for index in range(len(columns)):
+            filepath = self.__column_file(index)
+            # Cuts what an interrupted append left behind; columns new in
+            # this batch start empty and are padded with NaN
+            kept = self.__rows if index < len(self.__columns) else 0
+            with open(filepath, "r+b" if os.path.exists(filepath) else "wb") as file:
+                file.truncate(min(os.path.getsize(filepath), kept * batch.itemsize))
+                file.seek(0, os.SEEK_END)
+                numpy.full(self.__rows - file.tell() // batch.itemsize, numpy.nan).tofile(file)
+                batch[index].tofile(file)
+
+            if replaced:
+                column = numpy.memmap(filepath, dtype=numpy.float64, mode="r+", shape=(self.__rows,))
+                column[replaced] = replacements[index]
+                column.flush()
+                del column
+
+        if added:
+            with open(os.path.join(self.__path, KEYS_FILE), "ab") as file:
+                file.truncate(self.__keys_size)
+                for key, row in added.items():
+                    line = (json.dumps([row, key]) + "\n").encode()
+                    file.write(line)
+                    self.__keys_size += len(line)
+
+        self.__columns = columns
+        self.__index = positions
+        self.__rows += len(new_keys)
+        self.__keys.update(added)
+        self.__save_schema()
+
+    # Reading
+
+    def column(self, name: str) -> numpy.ndarray:
+        # Read only memory map, no copy until the values are used
+        if name not in self.__index:
+            raise Exception(f"Unknown results column {name}")
+        if self.__rows == 0:
+            return numpy.empty(0)
+        return numpy.memmap(
+            self.__column_file(self.__index[name]), dtype=numpy.float64, mode="r", shape=(self.__rows,)
+        )
+
+    def matrix(self, columns: Optional[Sequence[str]] = None, start: int = 0, stop: Optional[int] = None) -> numpy.ndarray:
+        # Rows x columns copy of a slice of the rows
+        columns = self.__columns if columns is None else columns
+        stop = self.__rows if stop is None else min(stop, self.__rows)
+        matrix = numpy.empty((max(stop - start, 0), len(columns)))
+        for i, column in enumerate(columns):
+            matrix[:, i] = self.column(column)[start:stop]
+        return matrix
+
+    def chunks(self, rows_per_chunk: int, columns: Optional[Sequence[str]] = None, start: int = 0) -> Iterator[numpy.ndarray]:
+        for chunk_start in range(start, self.__rows, rows_per_chunk):
+            yield self.matrix(columns, chunk_start, chunk_start + rows_per_chunk)
+
+    def to_frame(self, columns: Optional[Sequence[str]] = None, start: int = 0, stop: Optional[int] = None):
+        import pandas
+
+        columns = list(self.__columns if columns is None else columns)
+        return pandas.DataFrame(self.matrix(columns, start, stop), columns=columns)
+
+    def frames(self, rows_per_chunk: int, columns: Optional[Sequence[str]] = None, start: int = 0):
+        for chunk_start in range(start, self.__rows, rows_per_chunk):
+            yield self.to_frame(columns, chunk_start, chunk_start + rows_per_chunk)
+
+
+class ResultsBuffer:
+    # Rows waiting to be appended to a store together: flushed once
+    # rows_per_append rows are waiting, once the oldest has waited
+    # seconds_per_append, and on exit. A row added under a key is stored
+    # under it, replacing the row stored under that key. on_flush gets the
+    # keys of the added batches once their rows are stored (e.g. to mark logs
+    # as processed).
+
+    def __init__(
+        self,
+        store: ResultsStore,
+        rows_per_append: int = ROWS_PER_APPEND,
+        seconds_per_append: float = SECONDS_PER_APPEND,
+        on_flush: Optional[Callable[[List[Optional[str]]], None]] = None,
+    ) -> None:
+        self.__store: ResultsStore = store
+        self.__rows_per_append: int = rows_per_append
+        self.__seconds_per_append: float = seconds_per_append
+        self.__on_flush: Optional[Callable[[List[Optional[str]]], None]] = on_flush
+        self.__rows: List[Dict[str, Any]] = []
+        self.__row_keys: List[Optional[str]] = []
+        self.__keys: List[Optional[str]] = []
+        self.__oldest: float = 0.0
+
+    @property
+    def store(self) -> ResultsStore:
+        return self.__store
+
+    def __len__(self) -> int:
+        return len(self.__rows)
+
+    def add(self, rows: Iterable[Dict[str, Any]], key: Optional[str] = None) -> None:
+        rows = list(rows)
+        if key is not None and len(rows) != 1:
+            raise Exception("Adding several results rows under one key")
+        if not self.__rows:
+            self.__oldest = time.monotonic()
+        self.__rows.extend(rows)
+        self.__row_keys.extend([key] * len(rows))
+        self.__keys.append(key)
+
+        if (
+            len(self.__rows) >= self.__rows_per_append
+            or time.monotonic() - self.__oldest >= self.__seconds_per_append
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.__rows:
+            return
+        self.__store.append(self.__rows, self.__row_keys)
+        keys = self.__keys
+        self.__rows, self.__row_keys, self.__keys = [], [], []
+        if self.__on_flush is not None:
+            self.__on_flush(keys)
+
+    def __enter__(self) -> "ResultsBuffer":
+        return self
+
+    def __exit__(self, exception_type, exception, traceback) -> None:
+        # Rows already computed are kept on errors and interrupts too
+        self.flush()
@@ -0,0 +1,2 @@
+from .scenarios import Scenario, SCENARIOS, get_scenario
+from .golden import check_golden, compute_traces
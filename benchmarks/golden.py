@@ -0,0 +1,71 @@
+import contextlib
+import hashlib
+import io
+import json
+import os
+import tempfile
+from typing import Any, Dict
+
+from engine.logger import Logger, ChunkedLogWriter, LogReader
+from experiment import run_world
+from utils.simulation_context import SimulationContext
+from .scenarios import get_scenario
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden.json")
+GOLDEN_SEED = 7
+GOLDEN_TICKS = 4000
+
+
+def _hash_documents(filepath: str) -> str:
+    digest = hashlib.sha256()
+    for document in LogReader(filepath).documents():
+        digest.update(json.dumps(document, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _hash_row(row: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(row, sort_keys=True).encode()).hexdigest()
+
+
+def compute_traces() -> Dict[str, Dict[str, str]]:
+    # Fixed seeds, so any change in the hashes is a change in behaviour
+    traces = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, f"experiment{ChunkedLogWriter.EXTENSION}")
+        logger = Logger(filepath)
+        with contextlib.redirect_stdout(io.StringIO()):
+            row = run_world(GOLDEN_TICKS, SimulationContext.from_seed(logger, GOLDEN_SEED))
+        logger.close()
+        traces["experiment"] = {"log": _hash_documents(filepath), "row": _hash_row(row)}
+
+        scenario = get_scenario("small")
+        filepath = os.path.join(directory, f"small{ChunkedLogWriter.EXTENSION}")
+        logger = Logger(filepath)
+        world, _ = scenario.build(SimulationContext.from_seed(logger, GOLDEN_SEED))
+        for _ in range(GOLDEN_TICKS):
+            world.tick()
+        logger.close()
+        traces["small"] = {"log": _hash_documents(filepath)}
+
+    return traces
+
+
+def check_golden(update: bool = False) -> bool:
+    traces = compute_traces()
+
+    if update or not os.path.isfile(GOLDEN_FILE):
+        with open(GOLDEN_FILE, "w", encoding="utf-8") as file:
+            json.dump(traces, file, indent=2, sort_keys=True)
+        print(f"Golden traces written to {GOLDEN_FILE}")
+        return True
+
+    with open(GOLDEN_FILE, "r", encoding="utf-8") as file:
+        golden = json.load(file)
+
+    matches = True
+    for name, hashes in traces.items():
+        if golden.get(name) != hashes:
+            print(f"Golden trace {name} changed: {golden.get(name)} != {hashes}")
+            matches = False
+    return matches
@@ -0,0 +1,298 @@
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from engine.agents import Agent, ContextRegistry, Interaction, MoveToLocation
+from engine.agents.p_basic import Idle
+from engine.entities import Object
+from engine.generator import WorldGenerator
+from engine.logger import Logger, ChunkedLogWriter, LogReader
+from engine.world import LandmarkPathfinder, Location, World
+from engine.world.pathfinding import movement_cost
+from experiment import run_world
+from process_data import process_file, process_file_columnar
+from utils.simulation_context import SimulationContext
+from .scenarios import Scenario
+
+# Milliseconds a pathfinding query may take
+QUERY_BUDGET_MS = 1.0
+
+
+def measure(function: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    times: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"best": min(times), "median": statistics.median(times)}
+
+
+def bench_world_tick(scenario: Scenario) -> Dict[str, Any]:
+    world, _ = scenario.build(SimulationContext.from_seed(Logger(None), scenario.seed))
+
+    start = time.perf_counter()
+    for _ in range(scenario.num_ticks):
+        world.tick()
+    seconds = time.perf_counter() - start
+
+    return {
+        "seconds": seconds,
+        "ms_per_tick": seconds * 1000 / scenario.num_ticks,
+    }
+
+
+def bench_agent_decision(scenario: Scenario, repeat: int = 5) -> Dict[str, Any]:
+    # Agents without a practice decide on their first tick, so every
+    # repetition times one decision per agent on a fresh world
+    times: List[float] = []
+    for i in range(repeat):
+        _, agents = scenario.build(SimulationContext.from_seed(Logger(None), scenario.seed + i))
+
+        start = time.perf_counter()
+        for agent in agents:
+            agent.tick()
+        times.append(time.perf_counter() - start)
+
+    best = min(times)
+    return {
+        "seconds": best,
+        "us_per_decision": best * 1e6 / scenario.num_agents,
+    }
+
+
+def bench_salience(scenario: Scenario, iterations: int = 10000) -> Dict[str, Any]:
+    world, agents = scenario.build(SimulationContext.from_seed(Logger(None), scenario.seed))
+    agent = agents[0]
+    location = world.get_entity_location(agent)
+    weight_vector = agent.get_practice_and_weights()[MoveToLocation]
+    features = {
+        "Time": 0.5,
+        "CurrentLocation": location,
+        "NumberNearbyAgent": 1,
+        "TargetEntity": None,
+        "TargetLocation": world.locations[0],
+    }
+
+    def run() -> None:
+        for _ in range(iterations):
+            weight_vector.calculate_salience(features)
+
+    timing = measure(run, 3)
+    return {
+        "seconds": timing["best"],
+        "us_per_call": timing["best"] * 1e6 / iterations,
+    }
+
+
+def bench_logger_commit(num_entries: int = 50000) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    entity = Object("Bench")
+
+    for extension in (ChunkedLogWriter.EXTENSION, ".db"):
+        with tempfile.TemporaryDirectory() as directory:
+            logger = Logger(os.path.join(directory, f"bench{extension}"))
+
+            start = time.perf_counter()
+            for i in range(num_entries):
+                logger.register_entry(i, Logger.A_ENTITYENTERSLOCATION, entity, {"destination": f"Location{i % 50}"})
+            registered = time.perf_counter()
+            logger.commit()
+            committed = time.perf_counter()
+            logger.close()
+
+        results[extension.lstrip(".")] = {
+            "register_seconds": registered - start,
+            "commit_seconds": committed - registered,
+            "entries_per_second": num_entries / (committed - start),
+        }
+
+    return results
+
+
+def bench_process_data(num_ticks: int = 6000, seed: int = 0) -> Dict[str, Any]:
+    # A log of the experiment map, long enough for sleeps to finish so that
+    # every metric has values
+    results: Dict[str, Any] = {"ticks": num_ticks}
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, f"run{ChunkedLogWriter.EXTENSION}")
+        logger = Logger(filepath)
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_world(num_ticks, SimulationContext.from_seed(logger, seed))
+        logger.close()
+
+        num_documents = sum(1 for _ in LogReader(filepath).documents())
+        results["documents"] = num_documents
+
+        for name, function in (("streaming", process_file), ("columnar", process_file_columnar)):
+            timing = measure(lambda: function(filepath), 3)
+            results[name] = {
+                "seconds": timing["best"],
+                "documents_per_second": num_documents / timing["best"],
+            }
+
+    return results
+
+
+def bench_generator(num_locations: int = 10000, num_agents: int = 10000, num_own_agents: int = 1000, seed: int = 0) -> Dict[str, Any]:
+    # num_agents share 8 weight profiles, num_own_agents have their own
+    # weight vectors, which grow with the number of locations
+    side = int(num_locations ** 0.5)
+    families = {
+        "grid": lambda generator: generator.grid(side, side),
+        "random_geometric": lambda generator: generator.random_geometric(num_locations),
+        "town": lambda generator: generator.town(max(num_locations // 300, 1), 100),
+    }
+
+    results: Dict[str, Any] = {}
+    for name, build in families.items():
+        generator = WorldGenerator(seed)
+        start = time.perf_counter()
+        template = build(generator)
+        generated = time.perf_counter()
+        generator.populate(template, num_agents, SimulationContext.from_seed(Logger(None), seed), num_profiles=8)
+        populated = time.perf_counter()
+        generator.populate(template, num_own_agents, SimulationContext.from_seed(Logger(None), seed))
+        populated_own = time.perf_counter()
+
+        results[name] = {
+            "locations": len(template.locations),
+            "generate_seconds": generated - start,
+            "populate_seconds": populated - generated,
+            "populate_own_weights_seconds": populated_own - populated,
+        }
+
+    return results
+
+
+def with_parallel_corridors(graph, rng, share: float = 0.3):
+    # Copy of the graph where a share of the connections get a second route
+    # through a new is_path location, so core locations are joined by
+    # parallel corridors of different costs
+    graph = graph.copy()
+    edges = list(graph.edges)
+    for i in rng.choice(len(edges), size=int(len(edges) * share), replace=False).tolist():
+        locationS, locationT = edges[i]
+        detour = Location(f"Detour{i}", int(rng.randint(1, 50)), True)
+        graph.add_edge(locationS, detour)
+        graph.add_edge(detour, locationT)
+    return graph
+
+
+def bench_pathfinding(
+    num_locations: int = 10000,
+    num_queries: int = 100,
+    num_landmarks: int = 8,
+    seed: int = 0,
+    budget_ms: float = QUERY_BUDGET_MS,
+) -> Dict[str, Any]:
+    # Landmark pathfinder against the plain networkx A* of World.get_path_to,
+    # on random pairs of non path locations. Path costs of the A* sample are
+    # checked against networkx Dijkstra with the same movement costs. Only
+    # maps made mostly of corridors are expected within the query budget.
+    import networkx as nx
+
+    side = int(num_locations ** 0.5)
+    families = {
+        "grid": lambda generator: generator.grid(side, side).graph,
+        "random_geometric": lambda generator: generator.random_geometric(num_locations).graph,
+        "town": lambda generator: generator.town(max(num_locations // 300, 1), 100).graph,
+        "parallel_corridors": lambda generator: with_parallel_corridors(
+            generator.town(max(num_locations // 300, 1), 100).graph, generator.rng
+        ),
+    }
+
+    def weight(locationS, locationT, _) -> float:
+        return movement_cost(locationS, locationT)
+
+    results: Dict[str, Any] = {}
+    for name, build in families.items():
+        generator = WorldGenerator(seed)
+        graph = build(generator)
+        places = [location for location in graph.nodes if not location.is_path]
+        pairs = [
+            (places[i], places[j])
+            for i, j in generator.rng.randint(0, len(places), size=(num_queries, 2)).tolist()
+        ]
+
+        start = time.perf_counter()
+        pathfinder = LandmarkPathfinder(graph, num_landmarks)
+        built = time.perf_counter()
+        for origin, destination in pairs:
+            pathfinder.get_path(origin, destination)
+        queried = time.perf_counter()
+        for origin, destination in pairs[: max(num_queries // 10, 1)]:
+            nx.astar_path(graph, origin, destination)
+        astar = time.perf_counter()
+
+        mismatches = 0
+        for origin, destination in pairs[: max(num_queries // 10, 1)]:
+            path = pathfinder.get_path(origin, destination)
+            expected = nx.dijkstra_path_length(graph, origin, destination, weight=weight)
+            if abs(pathfinder.path_cost(path) - expected) > 1e-6:
+                mismatches += 1
+
+        results[name] = {
+            "locations": graph.number_of_nodes(),
+            "core_locations": pathfinder.num_core_locations,
+            "build_seconds": built - start,
+            "ms_per_query": (queried - built) * 1000 / num_queries,
+            "astar_ms_per_query": (astar - queried) * 1000 / max(num_queries // 10, 1),
+            "cost_mismatches": mismatches,
+            "budget_ms_per_query": budget_ms,
+            "within_budget": (queried - built) * 1000 / num_queries <= budget_ms,
+        }
+
+    return results
+
+
+def bench_interactions(num_agents: int = 2000, num_ticks: int = 20, seed: int = 0) -> Dict[str, Any]:
+    # Every agent in one location, all of them able to interact; the weight
+    # vectors are shared to keep the TargetEntity weights of a crowd small
+    world = World(SimulationContext.from_seed(Logger(None), seed))
+    square = Location("Square", 10, False)
+    world.register_location(square)
+
+    agents = [Agent(f"Agent{i}", world) for i in range(num_agents)]
+    for agent in agents:
+        world.register_entity(agent)
+        world.place_entity(agent, square)
+
+    context_registry = ContextRegistry()
+    context_registry.registerScalarFeature("Time")
+    context_registry.registerScalarFeature("NumberNearbyAgent")
+    context_registry.registerCategoricalFeature("CurrentLocation", [square])
+    context_registry.registerCategoricalFeature("TargetLocation", [square])
+    context_registry.registerCategoricalFeature("TargetEntity", agents)
+
+    def weight_vector(bias: float):
+        weight_vector = context_registry.createEmptyWeightVector()
+        weight_vector.registerScalarFeatureWeights("Time", 0, 0)
+        weight_vector.registerScalarFeatureWeights("NumberNearbyAgent", 0, 0)
+        weight_vector.registerCategorialFeatureWeights("CurrentLocation", square, 0, 0)
+        weight_vector.registerCategorialFeatureWeights("TargetLocation", square, 0, 0)
+        for agent in agents:
+            weight_vector.registerCategorialFeatureWeights("TargetEntity", agent, 0, bias)
+        return weight_vector
+
+    idle, interaction = weight_vector(0), weight_vector(1)
+    for agent in agents:
+        agent.add_weight_vector(Idle, idle)
+        agent.add_weight_vector(Interaction, interaction)
+
+    start = time.perf_counter()
+    for _ in range(num_ticks):
+        world.tick()
+    seconds = time.perf_counter() - start
+
+    interacting = sum(1 for agent in agents if isinstance(agent.current_practice, Interaction))
+    return {
+        "agents": num_agents,
+        "ticks": num_ticks,
+        "tick_seconds": seconds / num_ticks,
+        "interacting": interacting,
+    }
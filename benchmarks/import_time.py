@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+ENGINE_MODULES = ["engine.world", "engine.agents", "engine.logger"]
+
+# Optional dependencies that importing the engine must not load
+LAZY_MODULES = ["matplotlib", "networkx", "tinydb"]
+
+IMPORT_BUDGET = 0.5
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _time_import(code: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=REPOSITORY, check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def bench_import_time(repeat: int = 5, budget: float = IMPORT_BUDGET) -> Dict[str, Any]:
+    # Every measurement is a fresh interpreter; the interpreter start up
+    # itself is measured separately and subtracted
+    code = f"import {', '.join(ENGINE_MODULES)}"
+    interpreter = min(_time_import("pass") for _ in range(repeat))
+    seconds = min(_time_import(code) for _ in range(repeat)) - interpreter
+
+    check = (
+        f"import json, sys\n{code}\n"
+        f"print(json.dumps([name for name in {LAZY_MODULES!r} if name in sys.modules]))"
+    )
+    loaded: List[str] = json.loads(
+        subprocess.run(
+            [sys.executable, "-c", check], cwd=REPOSITORY, check=True, capture_output=True, text=True
+        ).stdout
+    )
+
+    return {
+        "seconds": seconds,
+        "budget_seconds": budget,
+        "eagerly_loaded": loaded,
+        "within_budget": seconds <= budget and not loaded,
+    }
+
+
+if __name__ == "__main__":
+    results = bench_import_time(budget=float(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_BUDGET)
+    print(json.dumps(results, indent=2))
+    if not results["within_budget"]:
+        print(f"Importing the engine took {results['seconds']:.3f}s (budget {results['budget_seconds']}s), eagerly loaded: {results['eagerly_loaded']}")
+        sys.exit(1)
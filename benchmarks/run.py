@@ -0,0 +1,167 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .golden import check_golden
+from .import_time import IMPORT_BUDGET, bench_import_time
+from .hot_paths import (
+    bench_agent_decision,
+    bench_generator,
+    bench_interactions,
+    bench_logger_commit,
+    bench_pathfinding,
+    bench_process_data,
+    bench_salience,
+    bench_world_tick,
+)
+from .scenarios import SCENARIOS, Scenario
+
+SCENARIO_BENCHMARKS = {
+    "world_tick": bench_world_tick,
+    "agent_decision": bench_agent_decision,
+    "salience": bench_salience,
+}
+GLOBAL_BENCHMARKS = ["logger_commit", "process_data", "generator", "pathfinding", "interactions", "import_time"]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(
+    scenarios: List[Scenario],
+    benchmarks: List[str],
+    log_entries: int,
+    process_ticks: int,
+    import_budget: float = IMPORT_BUDGET,
+) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "scenarios": {scenario.name: scenario.parameters() for scenario in scenarios},
+        "results": {},
+    }
+
+    for name in benchmarks:
+        if name == "logger_commit":
+            print(f"{name}...")
+            report["results"][name] = bench_logger_commit(log_entries)
+            continue
+        if name == "process_data":
+            print(f"{name}...")
+            report["results"][name] = bench_process_data(process_ticks)
+            continue
+        if name == "generator":
+            print(f"{name}...")
+            report["results"][name] = bench_generator()
+            continue
+        if name == "pathfinding":
+            print(f"{name}...")
+            report["results"][name] = bench_pathfinding()
+            continue
+        if name == "interactions":
+            print(f"{name}...")
+            report["results"][name] = bench_interactions()
+            continue
+        if name == "import_time":
+            print(f"{name}...")
+            report["results"][name] = bench_import_time(budget=import_budget)
+            continue
+
+        report["results"][name] = {}
+        for scenario in scenarios:
+            print(f"{name} [{scenario.name}]...")
+            report["results"][name][scenario.name] = SCENARIO_BENCHMARKS[name](scenario)
+
+    return report
+
+
+def _timings(results: Any, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _timings(value, f"{prefix}{key}/")
+        elif key.endswith("seconds"):
+            yield f"{prefix}{key}", value
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+    before = dict(_timings(previous["results"]))
+    print(f"Compared with {previous['revision']}")
+    for key, seconds in _timings(current["results"]):
+        if key in before and before[key] > 0:
+            print(f"{key}: {before[key]:.4f}s -> {seconds:.4f}s ({seconds / before[key]:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", nargs="*", default=None, help="names of the scenarios to run (default: all)")
+    parser.add_argument("--benchmark", nargs="*", default=None, choices=list(SCENARIO_BENCHMARKS) + GLOBAL_BENCHMARKS)
+    parser.add_argument("--agents", type=int, default=None, help="run a custom scenario with this many agents")
+    parser.add_argument("--houses", type=int, default=10)
+    parser.add_argument("--beds-per-house", type=int, default=2)
+    parser.add_argument("--ticks", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-entries", type=int, default=50000)
+    parser.add_argument("--process-ticks", type=int, default=6000, help="length of the log processed by the process_data benchmark")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET, help="seconds importing the engine may take")
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run to compare with")
+    parser.add_argument("--golden", action="store_true", help="only check the golden traces")
+    parser.add_argument("--update-golden", action="store_true", help="record the current traces as golden")
+    args = parser.parse_args()
+
+    if args.golden or args.update_golden:
+        if not check_golden(args.update_golden):
+            sys.exit(1)
+        print("Golden traces match")
+        sys.exit(0)
+
+    if args.agents is not None:
+        scenarios = [Scenario("custom", args.agents, args.houses, args.beds_per_house, args.ticks, args.seed)]
+    elif args.scenario is not None:
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in args.scenario]
+    else:
+        scenarios = SCENARIOS
+
+    benchmarks = args.benchmark if args.benchmark is not None else list(SCENARIO_BENCHMARKS) + GLOBAL_BENCHMARKS
+    report = run_benchmarks(scenarios, benchmarks, args.log_entries, args.process_ticks, args.import_budget)
+    report["golden"] = check_golden()
+
+    output_file = args.output
+    if output_file is None:
+        output_file = f"benchmark_{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.json"
+    with open(output_file, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output_file}")
+
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            compare(json.load(file), report)
+
+    if not report["golden"]:
+        sys.exit(1)
+
+    # Known to miss on maps that are nearly all core locations, reported
+    # without failing the run
+    for family, results in report["results"].get("pathfinding", {}).items():
+        if not results["within_budget"]:
+            print(
+                f"Pathfinding on {family} took {results['ms_per_query']:.2f} ms per query "
+                f"(budget {results['budget_ms_per_query']} ms, {results['core_locations']} of {results['locations']} locations in the core)"
+            )
+
+    import_time = report["results"].get("import_time")
+    if import_time is not None and not import_time["within_budget"]:
+        print(f"Importing the engine exceeded its budget: {import_time}")
+        sys.exit(1)
@@ -0,0 +1,77 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from engine.agents import Agent
+from engine.world import World, WorldTemplate
+from experiment import add_random_weights_to_practices, create_base_agent
+from utils.simulation_context import SimulationContext
+
+
+@dataclass
+class Scenario:
+    # A town of houses, each linked to a central square by its own path
+    name: str
+    num_agents: int
+    num_houses: int
+    beds_per_house: int
+    num_ticks: int
+    seed: int = 0
+
+    @property
+    def num_locations(self) -> int:
+        return 2 * self.num_houses + 1
+
+    def parameters(self) -> Dict[str, Any]:
+        return {
+            "agents": self.num_agents,
+            "houses": self.num_houses,
+            "locations": self.num_locations,
+            "beds_per_house": self.beds_per_house,
+            "ticks": self.num_ticks,
+            "seed": self.seed,
+        }
+
+    def build_template(self) -> WorldTemplate:
+        template = WorldTemplate()
+        square = template.add_location("Square", min_time_inside=50, is_path=False)
+
+        for i in range(1, self.num_houses + 1):
+            house = template.add_location(f"House{i}", min_time_inside=10, is_path=False)
+            path = template.add_location(f"Path{i}", min_time_inside=2, is_path=True)
+            template.connect(house, path)
+            template.connect(path, square)
+
+            for j in range(1, self.beds_per_house + 1):
+                template.add_bed(f"Bed {i}.{j}", house)
+
+        return template.compile()
+
+    def build(self, context: SimulationContext) -> Tuple[World, List[Agent]]:
+        template = self.build_template()
+        world = template.instantiate(context)
+
+        agents = []
+        agents_name = set()
+        for i in range(self.num_agents):
+            home = template.get_location(f"House{i % self.num_houses + 1}")
+            agents.append(create_base_agent(f"Agent{i + 1}", world, home, agents_name))
+
+        context_registry = template.create_context_registry(world)
+        for agent in agents:
+            add_random_weights_to_practices(agent, context_registry)
+
+        return world, agents
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("small", num_agents=9, num_houses=4, beds_per_house=2, num_ticks=2000),
+    Scenario("medium", num_agents=100, num_houses=25, beds_per_house=4, num_ticks=500),
+    Scenario("large", num_agents=400, num_houses=50, beds_per_house=8, num_ticks=50),
+]
+
+
+def get_scenario(name: str) -> Scenario:
+    for scenario in SCENARIOS:
+        if scenario.name == name:
+            return scenario
+    raise Exception(f"Unknown scenario {name}")
@@ -1,4 +1,4 @@
-from contextvars import Context
 from .context_registry import ContextRegistry, WeightVector
 from .agent import Agent
 from .p_movement import MoveToLocation
+from .p_interaction import Interaction, InteractionMatcher
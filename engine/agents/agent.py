@@ -1,17 +1,15 @@
 from __future__ import annotations
 
-from utils import DependencyManager
-
-from ..logger import Logger
-from typing import Dict, Type
+from ..logger import Logger, encode_weights
+from typing import Dict, Optional, Type
 from engine.agents.context_registry import WeightVector
 from engine.agents.practice import Practice
 from ..entities import Entity, Object
 from ..world import World
 from .p_movement import MoveToLocation
 from .p_basic import Sleep, Idle
+from .p_interaction import Interaction, InteractionMatcher
 
-import numpy
 import math
 
 
@@ -34,6 +32,10 @@ class Agent(Entity):
     def world(self):
         return self.__world
 
+    @property
+    def current_practice(self) -> Optional[Practice]:
+        return self.__current_practice
+
     def __str__(self) -> str:
         return f"{self.__name}"
 
@@ -42,34 +44,39 @@ class Agent(Entity):
     ) -> None:
         self.__weight_vector_by_practice[practice_type] = weight_vector
 
-        serialized_vector = {}
-        for (
-            feature_label,
-            feature_weight,
-        ) in weight_vector.get_scalar_features().items():
-            serialized_vector[
-                f"{practice_type.label}_{feature_label}_weight"
-            ] = feature_weight.weight
-            serialized_vector[
-                f"{practice_type.label}_{feature_label}_bias"
-            ] = feature_weight.bias
-        for (
-            feature_label,
-            feature_weight,
-        ) in weight_vector.get_categorical_features().items():
-            serialized_vector[
-                f"{practice_type.label}_{feature_label[0]}_{feature_label[1]}_weight"
-            ] = feature_weight.weight
-            serialized_vector[
-                f"{practice_type.label}_{feature_label[0]}_{feature_label[1]}_bias"
-            ] = feature_weight.bias
-
-        DependencyManager.instance().get_logger().register_entry(-1, Logger.A_SALIENCEVECTOR, self, {'practice_label': practice_type.label, 'practice_weight_vector':serialized_vector})
+        # Encoding large vectors is expensive, skip it when nothing is recorded
+        logger = self.__world.context.logger
+        if not logger.is_recording:
+            return
+
+        schema_id = logger.register_schema(weight_vector.schema())
+        logger.register_entry(-1, Logger.A_SALIENCEVECTOR, self, {'practice_label': practice_type.label, 'schema_id': schema_id, 'weights': encode_weights(weight_vector.to_array())})
 
     def get_practice_and_weights(self) -> Dict[Type[Practice], WeightVector]:
         return self.__weight_vector_by_practice
 
+    def restore_state(
+        self,
+        weight_vector_by_practice: Dict[Type[Practice], WeightVector],
+        current_practice: Optional[Practice],
+    ) -> None:
+        # Used by snapshots, the weight vectors were logged by the original run
+        self.__weight_vector_by_practice = dict(weight_vector_by_practice)
+        self.__current_practice = current_practice
+
+    def join(self, practice: Practice) -> None:
+        # Starts a practice another agent selected for this one, such as the
+        # partner side of an Interaction
+        if self.__current_practice is not None:
+            raise Exception("Agent joining a practice while doing another")
+
+        self.__current_practice = practice
+        self.__current_practice.enter()
+
     def tick(self) -> None:
+        profiler = self.__world.context.profiler
+        if profiler is not None:
+            mark = profiler.now()
 
         # Inspect the world
         day_time = (self.__world.time % 24000) / 24000
@@ -91,20 +98,31 @@ class Agent(Entity):
                 practices.append(MoveToLocation(self, self.__world, location))
 
         ## Generate sleeping practice
-        for entity in self.__world.get_entities_at_location(self, current_location):
+        for entity in self.__world.get_entities_at_location(self, current_location, Object):
             if (
-                isinstance(entity, Object)
-                and "bed" in entity.attributes
+                "bed" in entity.attributes
                 and "occupied" in entity.attributes
                 and not entity.attributes["occupied"]
             ):
                 practices.append(Sleep(self, self.__world, entity, 2000))
 
+        ## Generate interaction practice, with the partner matched this tick
+        if self.__current_practice is None and Interaction in self.__weight_vector_by_practice:
+            partner = InteractionMatcher.of(self.__world).partner_for(self)
+            if partner is not None:
+                practices.append(Interaction(self, self.__world, partner))
+
+        if profiler is not None:
+            mark = profiler.lap("agent.generate", mark)
+
         ## Generate Context
         features = {} 
         features["Time"] = day_time
         features["CurrentLocation"] = current_location
-        features["NumberNearbyAgent"] = len(list(filter(lambda entity: isinstance(entity, Agent), self.__world.get_entities_at_location(self, current_location))))
+        features["NumberNearbyAgent"] = self.__world.count_occupants(current_location, Agent)
+
+        if profiler is not None:
+            mark = profiler.lap("agent.context", mark)
 
         if self.__current_practice is not None:
             if self.__current_practice.has_ended():
@@ -112,6 +130,9 @@ class Agent(Entity):
                 self.__current_practice = None
             else:
                 self.__current_practice.tick()
+
+            if profiler is not None:
+                profiler.lap("agent.practice", mark)
         else:
 
             practice_saliences = {}
@@ -133,10 +154,21 @@ class Agent(Entity):
                     practice_saliences[practice], sum_saliences
                 )
 
-            selected_practice = numpy.random.choice(
+            if profiler is not None:
+                mark = profiler.lap("agent.salience", mark)
+
+            selected_practice = self.__world.context.rng.choice(
                 list(practice_saliences.keys()), p=list(practice_saliences.values())
             )
 
+            if profiler is not None:
+                mark = profiler.lap("agent.choice", mark)
+
             if selected_practice is not None:
                 self.__current_practice = selected_practice
                 self.__current_practice.enter()
+
+            if profiler is not None:
+                profiler.lap("agent.enter", mark)
+                profiler.count("decisions")
+                profiler.count("candidates", len(practices))
@@ -1,6 +1,9 @@
+import math
+from array import array
 from typing import List, Any, Dict, Tuple, Optional
 from abc import abstractmethod, abstractproperty
-from xml.sax.handler import feature_external_ges
+
+from ..logger.salience import SchemaColumn
 
 
 class FeatureWeight:
@@ -53,6 +56,7 @@ class CategoricalFeature(FeatureDefinition):
     def __init__(self, label: str, possible_values: List[Any]) -> None:
         super().__init__(label)
         self.__values: List[Any] = possible_values
+        self.__index: Optional[Dict[Any, int]] = None
 
     def calculateValue(self, featureWeight: FeatureWeight, value: Any) -> float:
         return 1 * featureWeight.weight + featureWeight.bias
@@ -61,12 +65,24 @@ class CategoricalFeature(FeatureDefinition):
     def possible_values(self) -> List[Any]:
         return self.__values
 
+    @property
+    def index(self) -> Dict[Any, int]:
+        # Position of every value, shared by the weight vectors of a registry
+        if self.__index is None:
+            self.__index = {value: i for i, value in enumerate(self.__values)}
+        return self.__index
+
 
 class WeightVector:
+    # Categorical weights are kept as one weight and one bias array per
+    # feature, in the order of its possible values, NaN for values without
+    # weights: 16 bytes per value instead of an object, so vectors over maps
+    # with tens of thousands of locations stay small.
+
     def __init__(self, features: Dict[str, FeatureDefinition]) -> None:
         self.__feature_definitions: Dict[str, FeatureDefinition] = features
         self.__scalar_feature_weight: Dict[str, FeatureWeight] = {}
-        self.__categorical_feature_weight: Dict[Tuple[str, Any], FeatureWeight] = {}
+        self.__categorical_feature_weight: Dict[str, Tuple[array, array]] = {}
 
     def registerScalarFeatureWeights(
         self, label: str, weight: float, bias: float
@@ -79,18 +95,46 @@ class WeightVector:
 
         self.__scalar_feature_weight[label] = FeatureWeight(weight, bias)
 
-    def registerCategorialFeatureWeights(
-        self, label: str, value: Any, weight: float, bias: float
-    ) -> None:
+    def __categorical_feature(self, label: str) -> CategoricalFeature:
         if label not in self.__feature_definitions:
             raise Exception(
                 "Attempting to register weights for feature not registered..."
             )
 
-        if not isinstance(self.__feature_definitions[label], CategoricalFeature):
+        feature_definition = self.__feature_definitions[label]
+        if not isinstance(feature_definition, CategoricalFeature):
             raise Exception("Attempting to register weights on non categorical feature")
+        return feature_definition
 
-        self.__categorical_feature_weight[(label, value)] = FeatureWeight(weight, bias)
+    def registerCategorialFeatureWeights(
+        self, label: str, value: Any, weight: float, bias: float
+    ) -> None:
+        feature_definition = self.__categorical_feature(label)
+        index = feature_definition.index.get(value)
+        if index is None:
+            raise Exception("Attempting to register weights for value not possible...")
+
+        if label not in self.__categorical_feature_weight:
+            missing = array("d", [float("nan")]) * len(feature_definition.possible_values)
+            self.__categorical_feature_weight[label] = (missing, array("d", missing))
+        weights, biases = self.__categorical_feature_weight[label]
+        weights[index] = weight
+        biases[index] = bias
+
+    def registerCategorialFeatureWeightArray(
+        self, label: str, weights: array, biases: array, values: Optional[List[Any]] = None
+    ) -> None:
+        # Weights of several values at once, every possible value in order
+        # by default
+        if values is not None:
+            for value, weight, bias in zip(values, weights, biases):
+                self.registerCategorialFeatureWeights(label, value, weight, bias)
+            return
+
+        feature_definition = self.__categorical_feature(label)
+        if len(weights) != len(feature_definition.possible_values) or len(biases) != len(weights):
+            raise Exception("Registering a different number of weights than values")
+        self.__categorical_feature_weight[label] = (array("d", weights), array("d", biases))
 
     def calculate_salience(self, features_values: Dict[str, Any]) -> float:
         for label in features_values.keys():
@@ -109,26 +153,76 @@ class WeightVector:
             elif isinstance(feature_defintion, CategoricalFeature):
                 if features_values[label] is None:
                     continue
-                
+
+                # A value the vector has no weights for (e.g. a bed outside
+                # the home of a generated agent) counts as absent too
+                weights, biases = self.__categorical_feature_weight.get(label, ((), ()))
+                index = feature_defintion.index.get(features_values[label])
+                if index is None or index >= len(weights) or math.isnan(weights[index]):
+                    continue
+
                 sum += feature_defintion.calculateValue(
-                    self.__categorical_feature_weight[label, features_values[label]],
-                    features_values[label],
+                    FeatureWeight(weights[index], biases[index]), features_values[label]
                 )
 
         return sum
 
+    @property
+    def feature_definitions(self) -> Dict[str, FeatureDefinition]:
+        return self.__feature_definitions
+
     def get_scalar_features(self) -> Dict[str, FeatureWeight]:
         return self.__scalar_feature_weight
 
     def get_categorical_features(self) -> Dict[Tuple[str, Any], FeatureWeight]:
+        # Built on demand from the weight arrays
+        features: Dict[Tuple[str, Any], FeatureWeight] = {}
+        for label, (weights, biases) in self.__categorical_feature_weight.items():
+            for value, weight, bias in zip(self.__feature_definitions[label].possible_values, weights, biases):
+                if not math.isnan(weight):
+                    features[(label, value)] = FeatureWeight(weight, bias)
+        return features
+
+    def get_categorical_arrays(self) -> Dict[str, Tuple[array, array]]:
         return self.__categorical_feature_weight
 
+    def schema(self) -> List[SchemaColumn]:
+        columns: List[SchemaColumn] = []
+        for label, feature_definition in self.__feature_definitions.items():
+            if isinstance(feature_definition, ScalarFeature):
+                columns.append((label, None, "weight"))
+                columns.append((label, None, "bias"))
+            elif isinstance(feature_definition, CategoricalFeature):
+                for value in feature_definition.possible_values:
+                    columns.append((label, str(value), "weight"))
+                    columns.append((label, str(value), "bias"))
+        return columns
+
+    def to_array(self) -> array:
+        values = array("d")
+        missing = FeatureWeight(float("nan"), float("nan"))
+        for label, feature_definition in self.__feature_definitions.items():
+            if isinstance(feature_definition, ScalarFeature):
+                feature_weight = self.__scalar_feature_weight.get(label, missing)
+                values.append(feature_weight.weight)
+                values.append(feature_weight.bias)
+            elif isinstance(feature_definition, CategoricalFeature):
+                if label not in self.__categorical_feature_weight:
+                    values.extend(array("d", [float("nan")]) * (2 * len(feature_definition.possible_values)))
+                    continue
+                weights, biases = self.__categorical_feature_weight[label]
+                pairs = array("d", bytes(16 * len(weights)))
+                pairs[0::2] = weights
+                pairs[1::2] = biases
+                values.extend(pairs)
+        return values
+
     def __str__(self) -> str:
         res = ""
         for label, value in self.__scalar_feature_weight.items():
             res += f"[{label} => b:{value.bias} w:{value.weight}]"
 
-        for label, value in self.__categorical_feature_weight.items():
+        for label, value in self.get_categorical_features().items():
             res += f"[{label[0]}, {label[1]} => b:{value.bias} w:{value.weight}]"
         return res
 
@@ -149,6 +243,11 @@ class ContextRegistry:
     ) -> None:
         self.__feature_definitions[label] = CategoricalFeature(label, possible_values)
 
+    def copy(self) -> "ContextRegistry":
+        context_registry = ContextRegistry()
+        context_registry.__feature_definitions = dict(self.__feature_definitions)
+        return context_registry
+
     def createEmptyWeightVector(self) -> WeightVector:
         return WeightVector(self.__feature_definitions)
 
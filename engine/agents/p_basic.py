@@ -1,5 +1,5 @@
 from .practice import Practice
-from ..world import World
+from ..world import Location, World
 from typing import Dict, Any, Optional
 from ..entities import Entity
 
@@ -37,6 +37,26 @@ class Sleep(Practice):
     def targetEntity(self) -> Optional[Entity]:
         return self.__bed
 
+    def state(self) -> Dict[str, Any]:
+        return {
+            "bed": self.__bed.name,
+            "min_sleeping_time": self.__min_sleeping_time,
+            "timer": self.__timer,
+        }
+
+    @classmethod
+    def from_state(
+        cls,
+        owner,
+        world: World,
+        state: Dict[str, Any],
+        entities: Dict[str, Entity],
+        locations: Dict[str, Location],
+    ) -> "Sleep":
+        practice = cls(owner, world, entities[state["bed"]], state["min_sleeping_time"])
+        practice.__timer = state["timer"]
+        return practice
+
 
 class Idle(Practice):
 
@@ -62,3 +82,19 @@ class Idle(Practice):
 
     def properties(self) -> Dict[str, Any]:
         return super().properties()
+
+    def state(self) -> Dict[str, Any]:
+        return {"min_idle_time": self.__min_idle_time, "timer": self.__timer}
+
+    @classmethod
+    def from_state(
+        cls,
+        owner,
+        world: World,
+        state: Dict[str, Any],
+        entities: Dict[str, Entity],
+        locations: Dict[str, Location],
+    ) -> "Idle":
+        practice = cls(owner, world, state["min_idle_time"])
+        practice.__timer = state["timer"]
+        return practice
@@ -0,0 +1,160 @@
+from .practice import Practice
+from ..world import Location, World
+from typing import Dict, Any, List, Optional, Set
+from ..entities import Entity
+
+INTERACTION_TIME = 20
+
+
+class Interaction(Practice):
+
+    label: str = "Interaction"
+
+    # Two agents at the same location doing something together. The agent
+    # that selects it starts the partner side of the interaction, which ends
+    # for both when either side ends or leaves.
+
+    def __init__(
+        self, owner, world: World, partner: Entity, min_interaction_time: int = INTERACTION_TIME
+    ) -> None:
+        super().__init__(owner, world)
+        self.__partner: Entity = partner
+        self.__min_interaction_time = min_interaction_time
+        self.__timer = 0
+
+    @property
+    def partner(self) -> Entity:
+        return self.__partner
+
+    def enter(self) -> None:
+        super().enter()
+        self.__timer = 0
+
+        matcher = InteractionMatcher.of(self._world)
+        if not matcher.is_reserved(self._owner):
+            # Selected by the owner: claim the pair and start the partner side
+            if not matcher.reserve(self._owner, self.__partner):
+                raise Exception("Starting interaction with agent not available")
+            self.__partner.join(
+                Interaction(self.__partner, self._world, self._owner, self.__min_interaction_time)
+            )
+
+    def has_ended(self) -> bool:
+        if self.__timer > self.__min_interaction_time:
+            return True
+
+        partner_practice = self.__partner.current_practice
+        if not isinstance(partner_practice, Interaction) or partner_practice.partner is not self._owner:
+            return True
+
+        return self._world.get_entity_location(self.__partner) != self._world.get_entity_location(self._owner)
+
+    def tick(self) -> None:
+        self.__timer += 1
+
+    def exit(self) -> None:
+        super().exit()
+
+    def properties(self) -> Dict[str, Any]:
+        return super().properties() | {"partner": str(self.__partner)}
+
+    def targetEntity(self) -> Optional[Entity]:
+        return self.__partner
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "partner": self.__partner.name,
+            "min_interaction_time": self.__min_interaction_time,
+            "timer": self.__timer,
+        }
+
+    @classmethod
+    def from_state(
+        cls,
+        owner,
+        world: World,
+        state: Dict[str, Any],
+        entities: Dict[str, Entity],
+        locations: Dict[str, Location],
+    ) -> "Interaction":
+        practice = cls(owner, world, entities[state["partner"]], state["min_interaction_time"])
+        practice.__timer = state["timer"]
+        return practice
+
+
+class InteractionMatcher:
+    # Pairs the agents willing to interact at a location once per tick: the
+    # agents without a practice that have a weight vector for Interaction are
+    # shuffled and paired in consecutive order, so every agent is offered one
+    # partner and a location costs O(agents) instead of one candidate per
+    # other agent. Pairs are reserved when an interaction starts; an offer is
+    # only valid while neither side is reserved or busy, which resolves
+    # partners that picked something else earlier in the tick.
+
+    def __init__(self, world: World) -> None:
+        self.__world: World = world
+        self.__time: Optional[int] = None
+        self.__matched: Set[Location] = set()
+        self.__partners: Dict[Entity, Entity] = {}
+        self.__reserved: Set[Entity] = set()
+
+    @staticmethod
+    def of(world: World) -> "InteractionMatcher":
+        # One matcher per world, created on first use
+        if world.interactions is None:
+            world.set_interactions(InteractionMatcher(world))
+        return world.interactions
+
+    def __start_tick(self) -> None:
+        if self.__time != self.__world.time:
+            self.__time = self.__world.time
+            self.__matched.clear()
+            self.__partners.clear()
+            self.__reserved.clear()
+
+    def __is_available(self, agent) -> bool:
+        return agent not in self.__reserved and agent.current_practice is None
+
+    def __match(self, location: Location) -> None:
+        from .agent import Agent
+
+        willing: List[Entity] = [
+            agent
+            for agent in self.__world.occupants(location, Agent)
+            if self.__is_available(agent) and Interaction in agent.get_practice_and_weights()
+        ]
+        order = self.__world.context.rng.permutation(len(willing))
+        for i in range(0, len(order) - 1, 2):
+            first, second = willing[order[i]], willing[order[i + 1]]
+            self.__partners[first] = second
+            self.__partners[second] = first
+        self.__matched.add(location)
+
+    def partner_for(self, agent) -> Optional[Entity]:
+        self.__start_tick()
+
+        location = self.__world.get_entity_location(agent)
+        if location is None:
+            raise Exception("Matching agent not yet placed in the world")
+
+        if location not in self.__matched:
+            self.__match(location)
+
+        partner = self.__partners.get(agent)
+        if partner is None or not self.__is_available(partner):
+            return None
+        if self.__world.get_entity_location(partner) != location:
+            return None
+        return partner
+
+    def is_reserved(self, agent) -> bool:
+        self.__start_tick()
+        return agent in self.__reserved
+
+    def reserve(self, agent, partner) -> bool:
+        self.__start_tick()
+        if agent in self.__reserved or partner in self.__reserved:
+            return False
+        self.__reserved.add(agent)
+        self.__reserved.add(partner)
+        return True
@@ -1,6 +1,7 @@
 from .practice import Practice
 from ..world import Location, World
 from typing import List, Dict, Any, Optional
+from ..entities import Entity
 
 
 class MoveToLocation(Practice):
@@ -55,3 +56,22 @@ class MoveToLocation(Practice):
 
     def targetLocation(self) -> Optional[Location]:
         return self.__destination
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "destination": self.__destination.name,
+            "path": [location.name for location in self.__path],
+        }
+
+    @classmethod
+    def from_state(
+        cls,
+        owner,
+        world: World,
+        state: Dict[str, Any],
+        entities: Dict[str, Entity],
+        locations: Dict[str, Location],
+    ) -> "MoveToLocation":
+        practice = cls(owner, world, locations[state["destination"]])
+        practice.__path = [locations[name] for name in state["path"]]
+        return practice
@@ -1,11 +1,10 @@
 from __future__ import annotations
 from abc import abstractmethod
-from utils import DependencyManager
 from engine.world.location import Location
 from ..world import World
 from ..logger import Logger
-from typing import Any, Dict, Optional
-from ..entities import Object
+from typing import Any, Dict, Optional, Type
+from ..entities import Entity, Object
 
 
 class Practice:
@@ -21,11 +20,11 @@ class Practice:
 
     @abstractmethod
     def enter(self) -> None:
-        DependencyManager.instance().get_logger().register_entry(self._world.time, Logger.A_PRACTICESTARTS, self._owner, {'practice_label': self.label} | self.properties())
+        self._world.context.logger.register_entry(self._world.time, Logger.A_PRACTICESTARTS, self._owner, {'practice_label': self.label} | self.properties())
         
     @abstractmethod
     def exit(self) -> None:
-        DependencyManager.instance().get_logger().register_entry(self._world.time, Logger.A_PRACTICEENDS, self._owner, {'practice_label': self.label})
+        self._world.context.logger.register_entry(self._world.time, Logger.A_PRACTICEENDS, self._owner, {'practice_label': self.label})
 
     @abstractmethod
     def has_ended(self) -> bool:
@@ -34,6 +33,36 @@ class Practice:
     def properties(self) -> Dict[str, Any]:
         return {}
 
+    # Snapshots: state() holds the progress of the practice with entities and
+    # locations referenced by name, from_state() rebuilds it in a world
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"label": self.label} | self.state()
+
+    def state(self) -> Dict[str, Any]:
+        return {}
+
+    @classmethod
+    def from_state(
+        cls,
+        owner,
+        world: World,
+        state: Dict[str, Any],
+        entities: Dict[str, Entity],
+        locations: Dict[str, Location],
+    ) -> "Practice":
+        raise Exception(f"Practice {cls.label} cannot be restored from a snapshot")
+
+    @staticmethod
+    def find(label: str) -> Type["Practice"]:
+        pending = list(Practice.__subclasses__())
+        while pending:
+            practice_type = pending.pop()
+            if practice_type.label == label:
+                return practice_type
+            pending.extend(practice_type.__subclasses__())
+        raise Exception(f"Unknown practice {label}")
+
     def targetLocation(self) -> Optional[Location]:
         return None
 
@@ -0,0 +1,145 @@
+import sys
+import tracemalloc
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+
+if TYPE_CHECKING:
+    from .logger import Logger
+    from .world import World
+
+
+def deep_getsizeof(obj: Any, exclude: Optional[Set[int]] = None) -> int:
+    # Approximate size of obj and everything it references, each object
+    # counted once; objects whose id is in exclude (and what they reference)
+    # are not counted
+    seen: Set[int] = set(exclude) if exclude is not None else set()
+    size = 0
+    stack = [obj]
+
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, "__dict__"):
+            stack.append(vars(current))
+
+    return size
+
+
+class MemoryDiagnostics:
+    # Approximate memory per subsystem of a running simulation, plus
+    # optional tracemalloc snapshots diffed between calls of trace()
+
+    def __init__(self, world: "World", logger: Optional["Logger"] = None) -> None:
+        self.__world: "World" = world
+        self.__logger: "Logger" = logger if logger is not None else world.context.logger
+        self.__snapshot: Optional[tracemalloc.Snapshot] = None
+        # Tracing started elsewhere (e.g. python -X tracemalloc) is left on
+        self.__started_tracing: bool = False
+
+    def __shared(self) -> Set[int]:
+        # The world, entities and locations are referenced everywhere, they
+        # are only counted by the entities and graph reports
+        shared = {id(self.__world), id(self.__world.context), id(self.__logger)}
+        shared.update(id(entity) for entity in self.__world.entities)
+        shared.update(id(location) for location in self.__world.locations)
+        return shared
+
+    def entities(self) -> Dict[str, Any]:
+        from .agents import Agent
+        from .entities import Object
+
+        agents = [entity for entity in self.__world.entities if isinstance(entity, Agent)]
+        objects = [entity for entity in self.__world.entities if isinstance(entity, Object)]
+        return {
+            "count": len(self.__world.entities),
+            "agents": len(agents),
+            "objects": len(objects),
+            "object_attributes_bytes": sum(deep_getsizeof(entity.attributes) for entity in objects),
+            "details_bytes": deep_getsizeof(self.__world.entity_details, self.__shared()),
+        }
+
+    def weight_vectors(self) -> Dict[str, Any]:
+        from .agents import Agent
+
+        shared = self.__shared()
+        per_agent = {}
+        for entity in self.__world.entities:
+            if isinstance(entity, Agent):
+                per_agent[entity.name] = sum(
+                    deep_getsizeof(
+                        [weight_vector.get_scalar_features(), weight_vector.get_categorical_arrays()],
+                        shared,
+                    )
+                    for weight_vector in entity.get_practice_and_weights().values()
+                )
+
+        return {"bytes": sum(per_agent.values()), "per_agent": per_agent}
+
+    def practices(self) -> Dict[str, Any]:
+        from .agents import Agent
+
+        shared = self.__shared()
+        active = [
+            entity.current_practice
+            for entity in self.__world.entities
+            if isinstance(entity, Agent) and entity.current_practice is not None
+        ]
+        return {
+            "active": len(active),
+            "bytes": sum(deep_getsizeof(practice, shared) for practice in active),
+        }
+
+    def logger(self) -> Dict[str, Any]:
+        return {
+            "buffered_entries": self.__logger.buffered_entries,
+            "buffered_bytes": self.__logger.buffered_bytes(),
+            "sinks": len(self.__logger.sinks),
+        }
+
+    def graph(self) -> Dict[str, Any]:
+        graph = self.__world.graph
+        return {
+            "nodes": graph.number_of_nodes(),
+            "edges": graph.number_of_edges(),
+            "bytes": deep_getsizeof(graph, {id(entity) for entity in self.__world.entities}),
+        }
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "tick": self.__world.time,
+            "entities": self.entities(),
+            "weight_vectors": self.weight_vectors(),
+            "practices": self.practices(),
+            "logger": self.logger(),
+            "graph": self.graph(),
+        }
+
+    def start_tracing(self, frames: int = 1) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self.__started_tracing = True
+        self.__snapshot = tracemalloc.take_snapshot()
+
+    def trace(self, limit: int = 10) -> List[str]:
+        # Largest allocation changes since the previous call
+        if self.__snapshot is None:
+            raise Exception("Memory tracing not started")
+
+        snapshot = tracemalloc.take_snapshot()
+        differences = snapshot.compare_to(self.__snapshot, "lineno")
+        self.__snapshot = snapshot
+        return [str(difference) for difference in differences[:limit]]
+
+    def stop_tracing(self) -> None:
+        self.__snapshot = None
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
@@ -0,0 +1,367 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import networkx as nx
+import numpy
+
+from ..agents.p_basic import Idle, Sleep
+from ..agents.p_movement import MoveToLocation
+from ..entities import Object
+from ..logger import Logger, encode_weights
+from ..logger.salience import SchemaColumn
+from ..world import Location, WorldTemplate
+
+# Practice codes, in the order experiment.py assigns their weight vectors
+MOVE = 0
+SLEEP = 1
+IDLE = 2
+NO_PRACTICE = -1
+
+PRACTICES = [MoveToLocation, Sleep, Idle]
+
+IDLE_TIME = 5
+SLEEP_TIME = 2000
+
+# Salience columns, in the order of the template context registry
+TIME = 0
+NEARBY = 1
+CURRENT_LOCATION = 2
+
+
+class EnsembleWorld:
+    # K independent copies of the same world advanced in lockstep. Every
+    # agent state is a (K x agents) array and each tick runs the Agent.tick
+    # rules for one agent at a time, vectorized over the K worlds. Candidate
+    # practices, salience sums and sampling follow Agent.tick, so with K = 1
+    # the random stream is consumed exactly like a single World.
+
+    def __init__(
+        self,
+        template: WorldTemplate,
+        agents: Sequence[Tuple[str, Location]],
+        size: int,
+        rng: Any = numpy.random,
+        loggers: Optional[List[Logger]] = None,
+    ) -> None:
+        if loggers is not None and len(loggers) != size:
+            raise Exception("An ensemble needs one logger per world")
+
+        self.__size: int = size
+        self.__rng: Any = rng
+        self.__loggers: Optional[List[Logger]] = loggers
+        self.__time: int = 0
+
+        locations = template.locations
+        self.__locations: List[Location] = locations
+        location_index = {location: i for i, location in enumerate(locations)}
+        num_locations = len(locations)
+
+        self.__min_time_inside = numpy.array(
+            [location.min_time_inside for location in locations], dtype=numpy.int64
+        )
+        self.__destinations = numpy.array(
+            [i for i, location in enumerate(locations) if not location.is_path],
+            dtype=numpy.int64,
+        )
+
+        # Entities are registered as in run_world: objects first, then agents
+        objects = template.objects
+        self.__objects: List[Object] = [Object(entry.name) for entry in objects]
+        self.__object_locations = numpy.array(
+            [location_index[entry.location] for entry in objects], dtype=numpy.int64
+        )
+        beds = [
+            i
+            for i, entry in enumerate(objects)
+            if "bed" in entry.attributes and "occupied" in entry.attributes
+        ]
+        self.__beds = numpy.array(beds, dtype=numpy.int64)
+        self.__bed_locations = self.__object_locations[self.__beds]
+
+        self.__agents: List[Object] = [Object(name) for name, _ in agents]
+        num_agents = len(agents)
+
+        self.__schema: List[SchemaColumn] = self.__create_schema()
+        self.__target_location: int = CURRENT_LOCATION + num_locations
+        self.__target_entity: int = CURRENT_LOCATION + 2 * num_locations
+
+        # Every shortest path is computed once for the shared topology
+        self.__paths = self.__create_paths(template.graph, location_index)
+
+        self.__location = numpy.array(
+            [[location_index[location] for _, location in agents]] * size, dtype=numpy.int64
+        ).reshape(size, num_agents)
+        self.__time_since_last_movement = numpy.zeros((size, num_agents), dtype=numpy.int64)
+        self.__practice = numpy.full((size, num_agents), NO_PRACTICE, dtype=numpy.int8)
+        self.__timer = numpy.zeros((size, num_agents), dtype=numpy.int64)
+        self.__target = numpy.zeros((size, num_agents), dtype=numpy.int64)
+        self.__path = numpy.zeros((size, num_agents), dtype=numpy.int64)
+        self.__path_position = numpy.zeros((size, num_agents), dtype=numpy.int64)
+        self.__occupied = numpy.zeros((size, len(beds)), dtype=bool)
+        self.__occupancy = numpy.zeros((size, num_locations), dtype=numpy.int64)
+        for agent in range(num_agents):
+            self.__occupancy[:, self.__location[0, agent]] += 1
+
+        self.__log_placements()
+        self.__weights = self.__create_random_weights()
+        self.__log_weights()
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    @property
+    def time(self) -> int:
+        return self.__time
+
+    @property
+    def locations(self) -> List[Location]:
+        return self.__locations
+
+    @property
+    def schema(self) -> List[SchemaColumn]:
+        return self.__schema
+
+    @property
+    def weights(self) -> numpy.ndarray:
+        # (practice, world, agent, column, weight | bias)
+        return self.__weights
+
+    def weight_vectors(self, world: int, agent: int) -> Dict[str, numpy.ndarray]:
+        return {
+            practice_type.label: self.__weights[practice, world, agent].reshape(-1)
+            for practice, practice_type in enumerate(PRACTICES)
+        }
+
+    def agent_locations(self, world: int) -> Dict[str, str]:
+        return {
+            agent.name: self.__locations[location].name
+            for agent, location in zip(self.__agents, self.__location[world])
+        }
+
+    # Setup
+
+    def __create_schema(self) -> List[SchemaColumn]:
+        columns: List[SchemaColumn] = []
+        for label in ("Time", "NumberNearbyAgent"):
+            columns.append((label, None, "weight"))
+            columns.append((label, None, "bias"))
+        for label in ("CurrentLocation", "TargetLocation"):
+            for location in self.__locations:
+                columns.append((label, str(location), "weight"))
+                columns.append((label, str(location), "bias"))
+        for entity in self.__objects + self.__agents:
+            columns.append(("TargetEntity", str(entity), "weight"))
+            columns.append(("TargetEntity", str(entity), "bias"))
+        return columns
+
+    def __create_paths(
+        self, graph: nx.Graph, location_index: Dict[Location, int]
+    ) -> numpy.ndarray:
+        num_locations = len(self.__locations)
+        paths: Dict[Tuple[int, int], List[int]] = {}
+        for origin, location in enumerate(self.__locations):
+            for destination in self.__destinations.tolist():
+                path = nx.astar_path(graph, location, self.__locations[destination])
+                paths[(origin, destination)] = [location_index[step] for step in path]
+
+        length = max(len(path) for path in paths.values())
+        table = numpy.full((num_locations * num_locations, length), -1, dtype=numpy.int64)
+        for (origin, destination), path in paths.items():
+            table[origin * num_locations + destination, : len(path)] = path
+        return table
+
+    def __create_random_weights(self) -> numpy.ndarray:
+        # Drawn in the order of create_random_weight_vector: Time,
+        # CurrentLocation, TargetLocation, TargetEntity, NumberNearbyAgent
+        num_agents = len(self.__agents)
+        num_columns = len(self.__schema) // 2
+        draws = self.__rng.uniform(
+            -1, 1, size=(self.__size, num_agents, len(PRACTICES), num_columns, 2)
+        )
+        order = [TIME] + list(range(CURRENT_LOCATION, num_columns)) + [NEARBY]
+        weights = numpy.empty_like(draws)
+        weights[:, :, :, order] = draws
+        return numpy.ascontiguousarray(weights.transpose(2, 0, 1, 3, 4))
+
+    def __log_placements(self) -> None:
+        if self.__loggers is None:
+            return
+        for logger in self.__loggers:
+            for entity, location in zip(self.__objects, self.__object_locations):
+                logger.register_entry(0, Logger.A_ENTITYENTERSLOCATION, entity, {"destination": self.__locations[location].name})
+            for entity, location in zip(self.__agents, self.__location[0]):
+                logger.register_entry(0, Logger.A_ENTITYENTERSLOCATION, entity, {"destination": self.__locations[location].name})
+
+    def __log_weights(self) -> None:
+        if self.__loggers is None:
+            return
+        for world, logger in enumerate(self.__loggers):
+            schema_id = logger.register_schema(self.__schema)
+            for agent, entity in enumerate(self.__agents):
+                for practice, practice_type in enumerate(PRACTICES):
+                    weights = self.__weights[practice, world, agent].reshape(-1)
+                    logger.register_entry(-1, Logger.A_SALIENCEVECTOR, entity, {'practice_label': practice_type.label, 'schema_id': schema_id, 'weights': encode_weights(weights)})
+
+    # Simulation
+
+    def tick(self) -> None:
+        self.__time += 1
+        day_time = (self.__time % 24000) / 24000
+
+        for agent in range(len(self.__agents)):
+            self.__tick_agent(agent, day_time)
+
+    def __tick_agent(self, agent: int, day_time: float) -> None:
+        self.__time_since_last_movement[:, agent] += 1
+
+        location = self.__location[:, agent].copy()
+        practice = self.__practice[:, agent].copy()
+        timer = self.__timer[:, agent]
+
+        has_ended = (
+            ((practice == IDLE) & (timer > IDLE_TIME))
+            | ((practice == SLEEP) & (timer > SLEEP_TIME))
+            | ((practice == MOVE) & (location == self.__target[:, agent]))
+        )
+        running = (practice != NO_PRACTICE) & ~has_ended
+
+        ending = numpy.flatnonzero(has_ended)
+        if len(ending) > 0:
+            sleeping = ending[practice[ending] == SLEEP]
+            self.__occupied[sleeping, self.__target[sleeping, agent]] = False
+            self.__practice[ending, agent] = NO_PRACTICE
+            self.__log_practices(Logger.A_PRACTICEENDS, ending, agent, practice[ending])
+
+        self.__timer[running & (practice != MOVE), agent] += 1
+
+        moving = numpy.flatnonzero(
+            running
+            & (practice == MOVE)
+            & (self.__time_since_last_movement[:, agent] > self.__min_time_inside[location])
+        )
+        if len(moving) > 0:
+            self.__move(moving, agent, location[moving])
+
+        deciding = numpy.flatnonzero(practice == NO_PRACTICE)
+        if len(deciding) > 0:
+            self.__decide(deciding, agent, location[deciding], day_time)
+
+    def __move(self, worlds: numpy.ndarray, agent: int, origin: numpy.ndarray) -> None:
+        position = self.__path_position[worlds, agent] + 1
+        destination = self.__paths[self.__path[worlds, agent], position]
+
+        self.__occupancy[worlds, origin] -= 1
+        self.__occupancy[worlds, destination] += 1
+        self.__location[worlds, agent] = destination
+        self.__path_position[worlds, agent] = position
+        self.__time_since_last_movement[worlds, agent] = 0
+
+        if self.__loggers is not None:
+            entity = self.__agents[agent]
+            for world, location in zip(worlds.tolist(), destination.tolist()):
+                self.__loggers[world].register_entry(self.__time, Logger.A_ENTITYENTERSLOCATION, entity, {"destination": self.__locations[location].name})
+
+    def __base_salience(
+        self,
+        practice: int,
+        worlds: numpy.ndarray,
+        agent: int,
+        location: numpy.ndarray,
+        nearby: numpy.ndarray,
+        day_time: float,
+    ) -> numpy.ndarray:
+        # Summed in the same order as WeightVector.calculate_salience
+        weights = self.__weights[practice, worlds, agent]
+        rows = numpy.arange(len(worlds))
+        salience = weights[:, TIME, 0] * day_time + weights[:, TIME, 1]
+        salience = salience + (weights[:, NEARBY, 0] * nearby + weights[:, NEARBY, 1])
+        current = weights[rows, CURRENT_LOCATION + location]
+        salience = salience + (current[:, 0] + current[:, 1])
+        return salience
+
+    def __decide(
+        self, worlds: numpy.ndarray, agent: int, location: numpy.ndarray, day_time: float
+    ) -> None:
+        nearby = self.__occupancy[worlds, location]
+
+        # Candidates: Idle, MoveToLocation per destination, Sleep per bed
+        idle = self.__base_salience(IDLE, worlds, agent, location, nearby, day_time)
+
+        move_weights = self.__weights[MOVE, worlds, agent][:, self.__target_location + self.__destinations]
+        move = self.__base_salience(MOVE, worlds, agent, location, nearby, day_time)[:, None] + (
+            move_weights[:, :, 0] + move_weights[:, :, 1]
+        )
+        move_valid = self.__destinations[None, :] != location[:, None]
+
+        bed_weights = self.__weights[SLEEP, worlds, agent][:, self.__target_entity + self.__beds]
+        sleep = self.__base_salience(SLEEP, worlds, agent, location, nearby, day_time)[:, None] + (
+            bed_weights[:, :, 0] + bed_weights[:, :, 1]
+        )
+        sleep_valid = (self.__bed_locations[None, :] == location[:, None]) & ~self.__occupied[worlds]
+
+        saliences = numpy.concatenate([idle[:, None], move, sleep], axis=1)
+        valid = numpy.concatenate(
+            [numpy.ones((len(worlds), 1), dtype=bool), move_valid, sleep_valid], axis=1
+        )
+
+        # Softmax over the valid candidates, sampled like numpy's choice
+        exp_saliences = numpy.where(valid, numpy.exp(numpy.where(valid, saliences, 0)), 0)
+        exp_sum = numpy.cumsum(exp_saliences, axis=1)[:, -1:]
+        cdf = numpy.cumsum(exp_saliences / exp_sum, axis=1)
+        cdf /= cdf[:, -1:]
+        samples = self.__rng.uniform(size=len(worlds))
+        selected = (cdf <= samples[:, None]).sum(axis=1)
+
+        num_destinations = len(self.__destinations)
+        self.__enter_idle(worlds[selected == 0], agent)
+        moving = (selected >= 1) & (selected <= num_destinations)
+        self.__enter_move(worlds[moving], agent, location[moving], self.__destinations[selected[moving] - 1])
+        sleeping = selected > num_destinations
+        self.__enter_sleep(worlds[sleeping], agent, selected[sleeping] - 1 - num_destinations)
+
+        if self.__loggers is not None:
+            self.__log_decisions(worlds, agent, selected)
+
+    def __enter_idle(self, worlds: numpy.ndarray, agent: int) -> None:
+        self.__practice[worlds, agent] = IDLE
+        self.__timer[worlds, agent] = 0
+
+    def __enter_move(
+        self, worlds: numpy.ndarray, agent: int, origin: numpy.ndarray, destination: numpy.ndarray
+    ) -> None:
+        self.__practice[worlds, agent] = MOVE
+        self.__target[worlds, agent] = destination
+        self.__path[worlds, agent] = origin * len(self.__locations) + destination
+        self.__path_position[worlds, agent] = 0
+
+    def __enter_sleep(self, worlds: numpy.ndarray, agent: int, bed: numpy.ndarray) -> None:
+        self.__practice[worlds, agent] = SLEEP
+        self.__target[worlds, agent] = bed
+        self.__timer[worlds, agent] = 0
+        self.__occupied[worlds, bed] = True
+
+    # Logging
+
+    def __log_practices(
+        self, type: str, worlds: numpy.ndarray, agent: int, practices: numpy.ndarray
+    ) -> None:
+        if self.__loggers is None:
+            return
+        entity = self.__agents[agent]
+        for world, practice in zip(worlds.tolist(), practices.tolist()):
+            self.__loggers[world].register_entry(self.__time, type, entity, {'practice_label': PRACTICES[practice].label})
+
+    def __log_decisions(self, worlds: numpy.ndarray, agent: int, selected: numpy.ndarray) -> None:
+        assert self.__loggers is not None
+        entity = self.__agents[agent]
+        num_destinations = len(self.__destinations)
+        for world, candidate in zip(worlds.tolist(), selected.tolist()):
+            if candidate == 0:
+                properties: Dict[str, Any] = {'practice_label': Idle.label}
+            elif candidate <= num_destinations:
+                destination = self.__locations[self.__destinations[candidate - 1]]
+                properties = {'practice_label': MoveToLocation.label, "destination": str(destination)}
+            else:
+                bed = self.__objects[self.__beds[candidate - 1 - num_destinations]]
+                properties = {'practice_label': Sleep.label, "bed": str(bed)}
+            self.__loggers[world].register_entry(self.__time, Logger.A_PRACTICESTARTS, entity, properties)
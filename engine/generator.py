@@ -0,0 +1,254 @@
+from array import array
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import networkx as nx
+import numpy
+
+from utils.simulation_context import SimulationContext
+from .agents import Agent, ContextRegistry, MoveToLocation, WeightVector
+from .agents.p_basic import Idle, Sleep
+from .agents.practice import Practice
+from .entities import Entity
+from .world import Location, World, WorldTemplate
+
+HOUSE = 0
+PLACE = 1
+CORRIDOR = 2
+
+PRACTICES: List[Type[Practice]] = [MoveToLocation, Sleep, Idle]
+
+
+class WorldGenerator:
+    # Synthetic worlds for scale testing. Every random choice is drawn from
+    # one RandomState, so the same seed and the same sequence of calls give
+    # the same worlds and weights.
+
+    def __init__(
+        self,
+        seed: int,
+        beds_per_house: int = 2,
+        house_ratio: float = 0.3,
+        place_ratio: float = 0.1,
+    ) -> None:
+        self.__rng = numpy.random.RandomState(seed)
+        self.__beds_per_house: int = beds_per_house
+        self.__house_ratio: float = house_ratio
+        self.__place_ratio: float = place_ratio
+
+    @property
+    def rng(self) -> numpy.random.RandomState:
+        return self.__rng
+
+    # Graph families
+
+    def grid(self, width: int, height: int) -> WorldTemplate:
+        # Cells connected to their 4 neighbours; houses, places and
+        # corridors are spread at random
+        edges = []
+        for y in range(height):
+            for x in range(width):
+                site = y * width + x
+                if x + 1 < width:
+                    edges.append((site, site + 1))
+                if y + 1 < height:
+                    edges.append((site, site + width))
+
+        return self.__build(self.__random_roles(width * height), edges)
+
+    def random_geometric(self, num_locations: int, radius: Optional[float] = None) -> WorldTemplate:
+        # Sites uniform in the unit square, linked when closer than radius;
+        # components left apart are linked to their nearest site of the
+        # largest component
+        if radius is None:
+            radius = 1.5 * numpy.sqrt(numpy.log(max(num_locations, 2)) / (numpy.pi * num_locations))
+
+        positions = self.__rng.uniform(0, 1, size=(num_locations, 2))
+        edges = _close_pairs(positions, radius)
+
+        graph = nx.Graph()
+        graph.add_nodes_from(range(num_locations))
+        graph.add_edges_from(edges)
+        components = sorted(nx.connected_components(graph), key=lambda component: (-len(component), min(component)))
+        main = numpy.array(sorted(components[0]))
+        for component in components[1:]:
+            site = min(component)
+            distances = ((positions[main] - positions[site]) ** 2).sum(axis=1)
+            edges.append((site, int(main[numpy.argmin(distances)])))
+
+        return self.__build(self.__random_roles(num_locations), edges)
+
+    def town(
+        self,
+        num_hubs: int,
+        houses_per_hub: int,
+        places_per_hub: int = 1,
+        corridor_length: int = 2,
+    ) -> WorldTemplate:
+        # Squares in a ring, every house and place linked to its square by a
+        # corridor of is_path locations
+        roles: List[int] = []
+        edges: List[Tuple[int, int]] = []
+
+        def add(role: int) -> int:
+            roles.append(role)
+            return len(roles) - 1
+
+        def link(site: int, other: int) -> None:
+            previous = site
+            for _ in range(corridor_length):
+                corridor = add(CORRIDOR)
+                edges.append((previous, corridor))
+                previous = corridor
+            edges.append((previous, other))
+
+        hubs = [add(PLACE) for _ in range(num_hubs)]
+        for i, hub in enumerate(hubs):
+            if num_hubs > 1 and (i + 1 < num_hubs or num_hubs > 2):
+                link(hub, hubs[(i + 1) % num_hubs])
+            for _ in range(houses_per_hub):
+                link(add(HOUSE), hub)
+            for _ in range(places_per_hub):
+                link(add(PLACE), hub)
+
+        return self.__build(roles, edges)
+
+    def __random_roles(self, num_sites: int) -> List[int]:
+        draws = self.__rng.uniform(0, 1, size=num_sites)
+        roles = numpy.full(num_sites, CORRIDOR)
+        roles[draws < self.__house_ratio + self.__place_ratio] = PLACE
+        roles[draws < self.__house_ratio] = HOUSE
+        return roles.tolist()
+
+    def __build(self, roles: List[int], edges: List[Tuple[int, int]]) -> WorldTemplate:
+        template = WorldTemplate()
+        min_times = self.__rng.randint(1, 6, size=len(roles))
+
+        counters = {HOUSE: 0, PLACE: 0, CORRIDOR: 0}
+        locations: List[Location] = []
+        for role, min_time in zip(roles, min_times.tolist()):
+            counters[role] += 1
+            if role == HOUSE:
+                locations.append(template.add_location(f"House{counters[role]}", min_time_inside=10, is_path=False))
+            elif role == PLACE:
+                locations.append(template.add_location(f"Place{counters[role]}", min_time_inside=10 * min_time, is_path=False))
+            else:
+                locations.append(template.add_location(f"Path{counters[role]}", min_time_inside=min_time, is_path=True))
+
+        for site, other in edges:
+            template.connect(locations[site], locations[other])
+
+        for location, role in zip(locations, roles):
+            if role == HOUSE:
+                for j in range(1, self.__beds_per_house + 1):
+                    template.add_bed(f"Bed {location.name}.{j}", location)
+
+        return template.compile()
+
+    # Agents
+
+    def random_weight_vector(
+        self, context_registry: ContextRegistry, restricted: Optional[Dict[str, List[Any]]] = None
+    ) -> WeightVector:
+        # One draw for the whole vector, in feature order. Categorical
+        # features in restricted only get weights for the values listed there.
+        weight_vector = context_registry.createEmptyWeightVector()
+
+        labels = context_registry.feature_labels
+        label_values = [restricted.get(label) if restricted is not None else None for label in labels]
+        sizes = [
+            len(values if values is not None else context_registry.getFeatureValues(label))
+            for label, values in zip(labels, label_values)
+        ]
+        draws = self.__rng.uniform(-1, 1, size=(sum(sizes), 2))
+
+        position = 0
+        for label, values, size in zip(labels, label_values, sizes):
+            weights = array("d", draws[position : position + size, 0].tobytes())
+            biases = array("d", draws[position : position + size, 1].tobytes())
+            position += size
+            if values is None and context_registry.getFeatureValues(label) == [None]:
+                weight_vector.registerScalarFeatureWeights(label, weights[0], biases[0])
+            else:
+                weight_vector.registerCategorialFeatureWeightArray(label, weights, biases, values)
+
+        return weight_vector
+
+    def populate(
+        self,
+        template: WorldTemplate,
+        num_agents: int,
+        context: Optional[SimulationContext] = None,
+        num_profiles: Optional[int] = None,
+    ) -> Tuple[World, List[Agent]]:
+        # Agents live in random houses. Only beds can be the TargetEntity of
+        # a practice, so the feature is restricted to them, which keeps the
+        # weight vectors independent of the number of agents. An agent with
+        # its own weight vectors only has TargetEntity weights for the beds of
+        # its home, other beds add nothing to its salience. With
+        # num_profiles, agents share that many weight vectors instead of
+        # having their own, with weights for every bed.
+        world = template.instantiate(context)
+        beds = list(world.entities)
+        context_registry = template.create_context_registry(world, beds)
+
+        houses = []
+        house_beds: Dict[Location, List[Entity]] = {}
+        for bed in beds:
+            location = world.get_entity_location(bed)
+            if not houses or houses[-1] is not location:
+                houses.append(location)
+            house_beds.setdefault(location, []).append(bed)
+        if not houses:
+            raise Exception("Populating a world without houses")
+
+        profiles: List[Dict[Type[Practice], WeightVector]] = []
+        assigned_profiles: List[int] = []
+        if num_profiles is not None:
+            profiles = [self.__random_weights(context_registry) for _ in range(num_profiles)]
+            assigned_profiles = self.__rng.randint(0, num_profiles, size=num_agents).tolist()
+
+        homes = self.__rng.randint(0, len(houses), size=num_agents).tolist()
+        agents = []
+        for i in range(num_agents):
+            agent = Agent(f"Agent{i + 1}", world)
+            world.register_entity(agent)
+            world.place_entity(agent, houses[homes[i]])
+
+            if num_profiles is not None:
+                weights = profiles[assigned_profiles[i]]
+            else:
+                weights = self.__random_weights(context_registry, {"TargetEntity": house_beds[houses[homes[i]]]})
+            for practice_type, weight_vector in weights.items():
+                agent.add_weight_vector(practice_type, weight_vector)
+
+            agents.append(agent)
+
+        return world, agents
+
+    def __random_weights(
+        self, context_registry: ContextRegistry, restricted: Optional[Dict[str, List[Any]]] = None
+    ) -> Dict[Type[Practice], WeightVector]:
+        return {practice_type: self.random_weight_vector(context_registry, restricted) for practice_type in PRACTICES}
+
+
+def _close_pairs(positions: numpy.ndarray, radius: float) -> List[Tuple[int, int]]:
+    # Pairs closer than radius, comparing only sites in neighbouring cells of
+    # a radius sized grid
+    cells: Dict[Tuple[int, int], List[int]] = {}
+    for site, (x, y) in enumerate((positions // radius).astype(int).tolist()):
+        cells.setdefault((x, y), []).append(site)
+
+    pairs = []
+    radius_squared = radius * radius
+    for (x, y), sites in cells.items():
+        same_cell = numpy.array(sites)
+        neighbours = []
+        for dx, dy in ((1, -1), (1, 0), (1, 1), (0, 1)):
+            neighbours.extend(cells.get((x + dx, y + dy), []))
+        neighbours_array = numpy.array(neighbours, dtype=int)
+
+        for site in sites:
+            others = numpy.concatenate([same_cell[same_cell > site], neighbours_array])
+            distances = ((positions[others] - positions[site]) ** 2).sum(axis=1)
+            pairs.extend((site, int(other)) for other in others[distances < radius_squared])
+    return pairs
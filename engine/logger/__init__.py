@@ -1 +1,4 @@
-from .logger import Logger
+from .logger import Logger, LogEntry, LogSink
+from .chunked import ChunkedLogWriter, ChunkedLogReader
+from .salience import encode_weights, decode_weights, expand_salience_vector
+from .reader import LogReader, LogState
@@ -0,0 +1,269 @@
+import heapq
+import json
+import lzma
+import os
+import struct
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# File layout:
+#   MAGIC | chunk 0 | chunk 1 | ... | index | TRAILER
+# Every chunk is an independently compressed block of JSON lines holding
+# documents of a single event type. The index is a compressed JSON document
+# describing every chunk (offset, length, type, tick range and the sequence
+# number of its first document). The trailer points at the index and is
+# rewritten after every flush, so a file is readable after each commit.
+
+MAGIC = b"SCLOG\x00\x01\n"
+TRAILER = struct.Struct("<QQ8s")
+TRAILER_MAGIC = b"SCLOGIDX"
+
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+class ChunkInfo:
+    def __init__(
+        self,
+        offset: int,
+        length: int,
+        type: str,
+        first_seq: int,
+        count: int,
+        min_tick: int,
+        max_tick: int,
+    ) -> None:
+        self.offset = offset
+        self.length = length
+        self.type = type
+        self.first_seq = first_seq
+        self.count = count
+        self.min_tick = min_tick
+        self.max_tick = max_tick
+
+    def overlaps(self, min_tick: Optional[int], max_tick: Optional[int]) -> bool:
+        if min_tick is not None and self.max_tick < min_tick:
+            return False
+        if max_tick is not None and self.min_tick > max_tick:
+            return False
+        return True
+
+    def toDocument(self) -> Dict[str, Any]:
+        return {
+            "offset": self.offset,
+            "length": self.length,
+            "type": self.type,
+            "first_seq": self.first_seq,
+            "count": self.count,
+            "min_tick": self.min_tick,
+            "max_tick": self.max_tick,
+        }
+
+    @classmethod
+    def fromDocument(cls, document: Dict[str, Any]) -> "ChunkInfo":
+        return cls(
+            document["offset"],
+            document["length"],
+            document["type"],
+            document["first_seq"],
+            document["count"],
+            document["min_tick"],
+            document["max_tick"],
+        )
+
+
+class ChunkedLogWriter:
+    EXTENSION: str = ".clog"
+
+    def __init__(
+        self, filepath: str, codec: str = "zlib", max_chunk_entries: int = 4096
+    ) -> None:
+        if codec not in CODECS:
+            raise Exception(f"Unknown log codec -{codec}-")
+
+        self.__filepath: str = filepath
+        self.__codec: str = codec
+        self.__compress = CODECS[codec][0]
+        self.__max_chunk_entries: int = max_chunk_entries
+        self.__chunks: List[ChunkInfo] = []
+        self.__next_seq: int = 0
+
+        if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+            reader = ChunkedLogReader(filepath)
+            if reader.codec != codec:
+                raise Exception(
+                    f"Appending {codec} chunks to a {reader.codec} log is not supported"
+                )
+            self.__chunks = reader.chunks()
+            self.__next_seq = sum(chunk.count for chunk in self.__chunks)
+            self.__data_end: int = reader.data_end
+            self.__file = open(filepath, "r+b")
+        else:
+            self.__file = open(filepath, "w+b")
+            self.__file.write(MAGIC)
+            self.__data_end = len(MAGIC)
+            self.__write_index()
+
+    @property
+    def filepath(self) -> str:
+        return self.__filepath
+
+    @property
+    def chunks(self) -> List[ChunkInfo]:
+        return self.__chunks
+
+    @property
+    def next_seq(self) -> int:
+        return self.__next_seq
+
+    def insert_multiple(self, documents: Iterable[Dict[str, Any]]) -> None:
+        by_type: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+        for document in documents:
+            by_type.setdefault(document["type"], []).append(
+                (self.__next_seq, document)
+            )
+            self.__next_seq += 1
+
+        if not by_type:
+            return
+
+        self.__file.seek(self.__data_end)
+        self.__file.truncate()
+
+        for type, entries in by_type.items():
+            for start in range(0, len(entries), self.__max_chunk_entries):
+                self.__write_chunk(type, entries[start : start + self.__max_chunk_entries])
+
+        self.__write_index()
+
+    def __write_chunk(self, type: str, entries: List[Tuple[int, Dict[str, Any]]]) -> None:
+        # Documents of a single type are buffered in sequence order, but the
+        # sequence is not contiguous, so each line carries its own number.
+        lines = [
+            json.dumps([seq, document], separators=(",", ":")) for seq, document in entries
+        ]
+        payload = self.__compress("\n".join(lines).encode("utf-8"))
+        ticks = [document["tick"] for _, document in entries]
+
+        self.__file.write(payload)
+        self.__chunks.append(
+            ChunkInfo(
+                self.__data_end,
+                len(payload),
+                type,
+                entries[0][0],
+                len(entries),
+                min(ticks),
+                max(ticks),
+            )
+        )
+        self.__data_end += len(payload)
+
+    def __write_index(self) -> None:
+        index = {
+            "codec": self.__codec,
+            "chunks": [chunk.toDocument() for chunk in self.__chunks],
+        }
+        payload = zlib.compress(json.dumps(index, separators=(",", ":")).encode("utf-8"))
+
+        self.__file.seek(self.__data_end)
+        self.__file.write(payload)
+        self.__file.write(TRAILER.pack(self.__data_end, len(payload), TRAILER_MAGIC))
+        self.__file.truncate()
+        self.__file.flush()
+
+    def close(self) -> None:
+        self.__file.close()
+
+
+class ChunkedLogReader:
+    def __init__(self, filepath: str) -> None:
+        self.__filepath: str = filepath
+
+        with open(filepath, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise Exception(f"File {filepath} is not a chunked log")
+
+            file.seek(-TRAILER.size, os.SEEK_END)
+            index_offset, index_length, trailer_magic = TRAILER.unpack(
+                file.read(TRAILER.size)
+            )
+            if trailer_magic != TRAILER_MAGIC:
+                raise Exception(f"Chunked log {filepath} has no valid index")
+
+            file.seek(index_offset)
+            index = json.loads(zlib.decompress(file.read(index_length)))
+
+        self.__data_end: int = index_offset
+        self.__codec: str = index["codec"]
+        self.__decompress = CODECS[self.__codec][1]
+        self.__chunks: List[ChunkInfo] = [
+            ChunkInfo.fromDocument(document) for document in index["chunks"]
+        ]
+
+    @property
+    def codec(self) -> str:
+        return self.__codec
+
+    @property
+    def data_end(self) -> int:
+        return self.__data_end
+
+    def chunks(
+        self,
+        min_tick: Optional[int] = None,
+        max_tick: Optional[int] = None,
+        types: Optional[Iterable[str]] = None,
+    ) -> List[ChunkInfo]:
+        type_filter = None if types is None else set(types)
+        return [
+            chunk
+            for chunk in self.__chunks
+            if (type_filter is None or chunk.type in type_filter)
+            and chunk.overlaps(min_tick, max_tick)
+        ]
+
+    def read_chunk(self, chunk: ChunkInfo) -> List[Tuple[int, Dict[str, Any]]]:
+        with open(self.__filepath, "rb") as file:
+            file.seek(chunk.offset)
+            payload = self.__decompress(file.read(chunk.length))
+
+        # Decoded as a single JSON array, much faster than line by line
+        lines = payload.decode("utf-8").replace("\n", ",")
+        return [tuple(entry) for entry in json.loads(f"[{lines}]")]  # type: ignore
+
+    def entries(
+        self,
+        min_tick: Optional[int] = None,
+        max_tick: Optional[int] = None,
+        types: Optional[Iterable[str]] = None,
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        # Chunks of different types interleave in the stream, so they are
+        # merged back in sequence order one chunk at a time per type.
+        streams: Dict[str, List[ChunkInfo]] = {}
+        for chunk in self.chunks(min_tick, max_tick, types):
+            streams.setdefault(chunk.type, []).append(chunk)
+
+        def stream(chunks: List[ChunkInfo]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+            for chunk in chunks:
+                for seq, document in self.read_chunk(chunk):
+                    if min_tick is not None and document["tick"] < min_tick:
+                        continue
+                    if max_tick is not None and document["tick"] > max_tick:
+                        continue
+                    yield seq, document
+
+        yield from heapq.merge(
+            *[stream(chunks) for chunks in streams.values()], key=lambda entry: entry[0]
+        )
+
+    def documents(
+        self,
+        min_tick: Optional[int] = None,
+        max_tick: Optional[int] = None,
+        types: Optional[Iterable[str]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        for _, document in self.entries(min_tick, max_tick, types):
+            yield document
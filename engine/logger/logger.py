@@ -1,9 +1,14 @@
-from enum import Enum
-from tinydb import TinyDB, Query
-from typing import List, Dict
-import json
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, List, Dict, Optional, Tuple, Union
 
 from engine.entities.entity import Entity
+from .chunked import ChunkedLogWriter
+from .salience import SchemaColumn
+
+if TYPE_CHECKING:
+    from tinydb import TinyDB
+    from utils.profiler import Profiler
 
 class Entry:
     def __init__(self, tick: str, type: str, entity: str,  data: Dict[str, str]) -> None:
@@ -20,27 +25,135 @@ class Entry:
         document = document | self.__data
         return document
 
+@dataclass
+class LogEntry:
+    tick: int
+    type: str
+    subtype: str
+    properties: Dict[str, Any]
+
+    @classmethod
+    def fromDocument(cls, document: Dict[str, Any]) -> "LogEntry":
+        return cls(document['tick'], type="WORLD_EVENT", subtype=document['type'], properties=document)
+
+class LogSink(ABC):
+    @abstractmethod
+    def new_entry(self, new_entry: LogEntry) -> None:
+        pass
+
 class Logger:
     _instance = None
     A_PRACTICESTARTS: str = 'PRACTICE_STARTS'
     A_PRACTICEENDS:str = 'PRACTICE_ENDS'
     A_ENTITYENTERSLOCATION:str = 'ENTITY_ENTERS_LOCATION'
     A_SALIENCEVECTOR:str = 'SALIENCE_VECTOR'
+    A_SALIENCESCHEMA:str = 'SALIENCE_SCHEMA'
+    A_KEYFRAME:str = 'KEYFRAME'
 
-    def __init__(self, filepath:str) -> None:
-        self.__buffer = []
-        self.__db = TinyDB(filepath)
+    def __init__(self, filepath: Optional[str], codec: str = "zlib", keyframe_every: Optional[int] = None) -> None:
+        self.__buffer: List[Dict[str, Any]] = []
+        # Position in the stored event stream of the next document
+        self.__next_seq: int = 0
+        self.__keyframe_every: Optional[int] = keyframe_every
+        self.__schemas: Dict[Tuple[SchemaColumn, ...], int] = {}
+        self.__sinks: List[LogSink] = []
+        self.__profiler: Optional["Profiler"] = None
+        self.__db: Union["TinyDB", ChunkedLogWriter, None]
+        if filepath is None:
+            self.__db = None
+        elif filepath.endswith(ChunkedLogWriter.EXTENSION):
+            self.__db = ChunkedLogWriter(filepath, codec=codec)
+            self.__next_seq = self.__db.next_seq
+        else:
+            from tinydb import TinyDB
+
+            self.__db = TinyDB(filepath)
+            self.__next_seq = len(self.__db)
+
+    def add_sink(self, sink: LogSink) -> None:
+        self.__sinks.append(sink)
+
+    @property
+    def sinks(self) -> List[LogSink]:
+        return self.__sinks
+
+    @property
+    def is_recording(self) -> bool:
+        # False when every entry would be discarded (no storage and no sinks)
+        return self.__db is not None or len(self.__sinks) > 0
+
+    def set_profiler(self, profiler: Optional["Profiler"]) -> None:
+        self.__profiler = profiler
+
+    def __record(self, entry: Entry) -> None:
+        profiler = self.__profiler
+        if profiler is not None:
+            mark = profiler.now()
+
+        document = entry.toDocument()
+
+        if self.__sinks:
+            log_entry = LogEntry.fromDocument(document)
+            for sink in self.__sinks:
+                sink.new_entry(log_entry)
+
+        if self.__db is not None:
+            self.__buffer.append(document)
+            self.__next_seq += 1
+
+        if profiler is not None:
+            profiler.lap("logger.record", mark)
 
     def register_entry(self, tick: int, type: str, entity: Entity, data: Dict[str, str]) -> None:
-        self.__buffer.append(Entry(tick, type, entity.name, data))
+        self.__record(Entry(tick, type, entity.name, data))
+
+    def register_schema(self, schema: List[SchemaColumn]) -> int:
+        key = tuple(schema)
+        if key not in self.__schemas:
+            self.__schemas[key] = len(self.__schemas)
+            self.__record(Entry(-1, Logger.A_SALIENCESCHEMA, "", {'schema_id': self.__schemas[key], 'columns': [list(column) for column in schema]}))
+        return self.__schemas[key]
+
+    @property
+    def keyframe_every(self) -> Optional[int]:
+        # Ticks between keyframes, None when no keyframes are written
+        return self.__keyframe_every if self.__db is not None else None
+
+    def register_keyframe(
+        self, tick: int, locations: Dict[str, Optional[str]], practices: Dict[str, Optional[Dict[str, Any]]]
+    ) -> None:
+        # Full state of the world at the end of a tick, so readers can replay
+        # from here instead of from the start. Only stored, sinks see events.
+        if self.__db is None:
+            return
+        self.__buffer.append({'tick': tick, 'type': Logger.A_KEYFRAME, 'entity': "", 'seq': self.__next_seq, 'locations': locations, 'practices': practices})
+        self.__next_seq += 1
+
+    @property
+    def buffered_entries(self) -> int:
+        return len(self.__buffer)
+
+    def buffered_bytes(self) -> int:
+        from engine.diagnostics import deep_getsizeof
+
+        return deep_getsizeof(self.__buffer)
 
     def commit(self) -> None:
-        docs = []
-        for entry in self.__buffer:
-            docs.append(entry.toDocument())
-        self.__db.insert_multiple(docs)        
+        if self.__db is None:
+            return
+        profiler = self.__profiler
+        if profiler is not None:
+            mark = profiler.now()
+        self.__db.insert_multiple(self.__buffer)
         self.__buffer = []
+        if profiler is not None:
+            profiler.lap("logger.commit", mark)
+
+    def close(self) -> None:
+        self.commit()
+        if self.__db is not None:
+            self.__db.close()
 
     @property
-    def database(self) -> TinyDB:
+    def database(self) -> Union["TinyDB", ChunkedLogWriter, None]:
         return self.__db
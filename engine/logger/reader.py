@@ -0,0 +1,199 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from .chunked import ChunkedLogReader, ChunkedLogWriter
+from .logger import LogEntry, Logger
+
+# Event types that change the state kept by keyframes
+STATE_TYPES = [Logger.A_ENTITYENTERSLOCATION, Logger.A_PRACTICESTARTS, Logger.A_PRACTICEENDS]
+
+
+@dataclass
+class LogState:
+    # Location of every entity and active practice of every agent at the end
+    # of a tick, practices as logged by PRACTICE_STARTS
+    tick: int
+    locations: Dict[str, Optional[str]]
+    practices: Dict[str, Optional[Dict[str, Any]]]
+
+    @classmethod
+    def fromKeyframe(cls, tick: int, keyframe: Optional[Dict[str, Any]]) -> "LogState":
+        if keyframe is None:
+            return cls(tick, {}, {})
+        return cls(tick, dict(keyframe["locations"]), dict(keyframe["practices"]))
+
+    def apply(self, document: Dict[str, Any]) -> None:
+        if document["type"] == Logger.A_ENTITYENTERSLOCATION:
+            self.locations[document["entity"]] = document["destination"]
+        elif document["type"] == Logger.A_PRACTICESTARTS:
+            self.practices[document["entity"]] = {
+                key: value for key, value in document.items() if key not in ("tick", "type", "entity")
+            }
+        elif document["type"] == Logger.A_PRACTICEENDS:
+            self.practices[document["entity"]] = None
+
+
+class _TinyDBStream:
+    # Incremental parser for the TinyDB JSON layout
+    #   {"<table>": {"<doc id>": {...}, ...}, ...}
+    # that holds at most one document of the requested table in memory.
+
+    def __init__(self, file: TextIO, table: str, block_size: int) -> None:
+        self.__file: TextIO = file
+        self.__table: str = table
+        self.__block_size: int = block_size
+        self.__decoder = json.JSONDecoder()
+        self.__buffer: str = ""
+        self.__position: int = 0
+        self.__eof: bool = False
+
+    def __fill(self) -> bool:
+        if self.__eof:
+            return False
+
+        block = self.__file.read(self.__block_size)
+        if not block:
+            self.__eof = True
+            return False
+
+        self.__buffer = self.__buffer[self.__position :] + block
+        self.__position = 0
+        return True
+
+    def __peek(self) -> str:
+        while True:
+            while self.__position < len(self.__buffer):
+                if not self.__buffer[self.__position].isspace():
+                    return self.__buffer[self.__position]
+                self.__position += 1
+            if not self.__fill():
+                raise Exception("Unexpected end of log file")
+
+    def __expect(self, char: str) -> None:
+        if self.__peek() != char:
+            raise Exception(f"Malformed log file, expected '{char}'")
+        self.__position += 1
+
+    def __value(self) -> Any:
+        self.__peek()
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(self.__buffer, self.__position)
+            except json.JSONDecodeError:
+                if not self.__fill():
+                    raise
+                continue
+            self.__position = end
+            return value
+
+    def documents(self) -> Iterator[Dict[str, Any]]:
+        self.__expect("{")
+        if self.__peek() == "}":
+            return
+
+        while True:
+            name = self.__value()
+            self.__expect(":")
+
+            if name == self.__table:
+                self.__expect("{")
+                if self.__peek() != "}":
+                    while True:
+                        self.__value()
+                        self.__expect(":")
+                        yield self.__value()
+                        if self.__peek() != ",":
+                            break
+                        self.__position += 1
+                self.__expect("}")
+            else:
+                self.__value()
+
+            if self.__peek() != ",":
+                break
+            self.__position += 1
+
+        self.__expect("}")
+
+
+class LogReader:
+    def __init__(
+        self, filepath: str, table: str = "_default", block_size: int = 1 << 16
+    ) -> None:
+        self.__filepath: str = filepath
+        self.__table: str = table
+        self.__block_size: int = block_size
+        self.__chunked: Optional[ChunkedLogReader] = None
+
+        if filepath.endswith(ChunkedLogWriter.EXTENSION):
+            self.__chunked = ChunkedLogReader(filepath)
+
+    @property
+    def filepath(self) -> str:
+        return self.__filepath
+
+    @property
+    def chunked(self) -> Optional[ChunkedLogReader]:
+        return self.__chunked
+
+    def documents(self, types: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        if self.__chunked is not None:
+            yield from self.__chunked.documents(types=types)
+            return
+
+        with open(self.__filepath, "r", encoding="utf-8") as file:
+            if not file.read(1):
+                return
+            file.seek(0)
+            for document in _TinyDBStream(file, self.__table, self.__block_size).documents():
+                if types is None or document["type"] in types:
+                    yield document
+
+    def entries(self) -> Iterator[LogEntry]:
+        for document in self.documents():
+            yield LogEntry.fromDocument(document)
+
+    def keyframes(self) -> List[Tuple[int, int]]:
+        # (tick, seq) of every keyframe in the log
+        if self.__chunked is not None:
+            documents = self.__chunked.documents(types=[Logger.A_KEYFRAME])
+        else:
+            documents = (document for document in self.documents() if document["type"] == Logger.A_KEYFRAME)
+        return [(document["tick"], document["seq"]) for document in documents]
+
+    def state_at(self, tick: int) -> LogState:
+        # State at the end of tick, replayed from the closest keyframe before
+        # it; without keyframes the whole log is replayed
+        if self.__chunked is None:
+            return self.__scan_state_at(tick)
+
+        keyframe = None
+        chunks = self.__chunked.chunks(max_tick=tick, types=[Logger.A_KEYFRAME])
+        # Keyframe ticks grow with the stream, the last chunks hold the closest
+        for chunk in reversed(chunks):
+            candidates = [document for _, document in self.__chunked.read_chunk(chunk) if document["tick"] <= tick]
+            if candidates:
+                keyframe = candidates[-1]
+                break
+
+        state = LogState.fromKeyframe(tick, keyframe)
+        after = keyframe["seq"] if keyframe is not None else -1
+        since = keyframe["tick"] if keyframe is not None else None
+        for seq, document in self.__chunked.entries(since, tick, STATE_TYPES):
+            if seq > after:
+                state.apply(document)
+        return state
+
+    def __scan_state_at(self, tick: int) -> LogState:
+        # TinyDB logs can only be read in order, the keyframes just reset
+        # the state that is replayed
+        state = LogState.fromKeyframe(tick, None)
+        for document in self.documents():
+            if document["tick"] > tick:
+                break
+            if document["type"] == Logger.A_KEYFRAME:
+                state = LogState.fromKeyframe(tick, document)
+            else:
+                state.apply(document)
+        return state
@@ -0,0 +1,44 @@
+import base64
+import sys
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# A salience vector is logged as a dense array of float64 values (little
+# endian, base64 encoded) whose columns are described once per log by a
+# schema record: column index -> (feature, value, "weight" | "bias").
+
+SchemaColumn = Tuple[str, Optional[str], str]
+
+
+def encode_weights(values: Sequence[float]) -> str:
+    packed = array("d", values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+
+def decode_weights(encoded: str) -> array:
+    values = array("d")
+    values.frombytes(base64.b64decode(encoded))
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def column_name(practice_label: str, column: Sequence[Any]) -> str:
+    feature, value, kind = column
+    if value is None:
+        return f"{practice_label}_{feature}_{kind}"
+    return f"{practice_label}_{feature}_{value}_{kind}"
+
+
+def expand_salience_vector(
+    practice_label: str, schema: List[SchemaColumn], weights: Sequence[float]
+) -> Dict[str, float]:
+    if len(schema) != len(weights):
+        raise Exception("Salience vector does not match the size of its schema")
+
+    return {
+        column_name(practice_label, column): weight
+        for column, weight in zip(schema, weights)
+    }
@@ -0,0 +1,286 @@
+import copy
+import math
+import os
+import pickle
+import zlib
+from array import array
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import numpy
+
+from utils.simulation_context import SimulationContext
+from .agents import Agent, ContextRegistry, WeightVector
+from .agents.context_registry import CategoricalFeature
+from .agents.practice import Practice
+from .entities import Entity, Object
+from .logger import Logger
+from .world import Location, World
+
+SNAPSHOT_VERSION = 1
+
+
+def _encode_value(value: Any) -> Tuple[str, Any]:
+    if isinstance(value, Location):
+        return ("location", value.name)
+    if isinstance(value, Entity):
+        return ("entity", value.name)
+    return ("value", value)
+
+
+def _decode_value(
+    encoded: Tuple[str, Any], entities: Dict[str, Entity], locations: Dict[str, Location]
+) -> Any:
+    kind, value = encoded
+    if kind == "location":
+        return locations[value]
+    if kind == "entity":
+        return entities[value]
+    return value
+
+
+def _rng_state(rng: Any) -> Optional[Tuple[str, Any]]:
+    if hasattr(rng, "get_state"):
+        return ("legacy", rng.get_state())
+    if hasattr(rng, "bit_generator"):
+        return ("generator", rng.bit_generator.state)
+    return None
+
+
+def _set_rng_state(rng: Any, state: Tuple[str, Any]) -> None:
+    kind, value = state
+    if kind == "legacy" and hasattr(rng, "set_state"):
+        rng.set_state(value)
+    elif kind == "generator" and hasattr(rng, "bit_generator"):
+        rng.bit_generator.state = value
+    else:
+        raise Exception("The snapshot random state does not fit the context random generator")
+
+
+class WorldSnapshot:
+    # The complete state of a World as plain data: time, topology, entities
+    # in registration order with their location, timer and attributes, the
+    # weight vectors and current practice of every agent, and the random
+    # state of the context. Entities and locations are referenced by name.
+    # The logger and its sinks are not part of a snapshot.
+
+    def __init__(self, state: Dict[str, Any]) -> None:
+        if state.get("version") != SNAPSHOT_VERSION:
+            raise Exception(f"Unsupported snapshot version {state.get('version')}")
+        self.__state: Dict[str, Any] = state
+
+    @property
+    def state(self) -> Dict[str, Any]:
+        return self.__state
+
+    @property
+    def time(self) -> int:
+        return self.__state["time"]
+
+    @classmethod
+    def capture(cls, world: World) -> "WorldSnapshot":
+        registries: Dict[int, int] = {}
+        registry_states: List[List[Tuple[str, Optional[List[Tuple[str, Any]]]]]] = []
+        weight_vectors: Dict[int, int] = {}
+        weight_vector_states: List[Dict[str, Any]] = []
+
+        def registry_index(weight_vector: WeightVector) -> int:
+            feature_definitions = weight_vector.feature_definitions
+            if id(feature_definitions) not in registries:
+                registries[id(feature_definitions)] = len(registry_states)
+                registry_states.append(
+                    [
+                        (label, [_encode_value(value) for value in definition.possible_values])
+                        if isinstance(definition, CategoricalFeature)
+                        else (label, None)
+                        for label, definition in feature_definitions.items()
+                    ]
+                )
+            return registries[id(feature_definitions)]
+
+        def weight_vector_index(weight_vector: WeightVector) -> int:
+            # Vectors shared between agents are stored once
+            if id(weight_vector) not in weight_vectors:
+                weight_vectors[id(weight_vector)] = len(weight_vector_states)
+                weight_vector_states.append(
+                    {"registry": registry_index(weight_vector), "values": weight_vector.to_array()}
+                )
+            return weight_vectors[id(weight_vector)]
+
+        entities = []
+        for entity in world.entities:
+            details = world.entity_details[entity]
+            entry: Dict[str, Any] = {
+                "name": entity.name,
+                "location": details.location.name if details.location is not None else None,
+                "time_since_last_movement": details.time_since_last_movement,
+            }
+
+            if isinstance(entity, Agent):
+                practice = entity.current_practice
+                entry["kind"] = "agent"
+                entry["weights"] = {
+                    practice_type.label: weight_vector_index(weight_vector)
+                    for practice_type, weight_vector in entity.get_practice_and_weights().items()
+                }
+                entry["practice"] = practice.snapshot() if practice is not None else None
+            elif isinstance(entity, Object):
+                entry["kind"] = "object"
+                entry["attributes"] = copy.deepcopy(entity.attributes)
+            else:
+                raise Exception(f"Cannot snapshot entity {entity} of type {type(entity).__name__}")
+
+            entities.append(entry)
+
+        return cls(
+            {
+                "version": SNAPSHOT_VERSION,
+                "time": world.time,
+                "locations": [
+                    (location.name, location.min_time_inside, location.is_path)
+                    for location in world.locations
+                ],
+                "connections": [
+                    (locationS.name, locationT.name) for locationS, locationT in world.graph.edges()
+                ],
+                "entities": entities,
+                "registries": registry_states,
+                "weight_vectors": weight_vector_states,
+                "rng": _rng_state(world.context.rng),
+            }
+        )
+
+    def restore(
+        self,
+        context: Optional[SimulationContext] = None,
+        topology: Optional[World] = None,
+        restore_rng: bool = True,
+    ) -> World:
+        # With topology, the new world shares the locations and graph of that
+        # world instead of building its own
+        state = self.__state
+
+        if context is None:
+            context = SimulationContext(Logger(None), numpy.random.RandomState())
+        if restore_rng and state["rng"] is not None:
+            _set_rng_state(context.rng, state["rng"])
+
+        world = World(context)
+        if topology is not None:
+            locations = {location.name: location for location in topology.locations}
+            world.use_topology(topology.locations, topology.graph)
+            world.set_pathfinder(topology.pathfinder)
+        else:
+            import networkx as nx
+
+            locations = {
+                name: Location(name, min_time_inside=min_time_inside, is_path=is_path)
+                for name, min_time_inside, is_path in state["locations"]
+            }
+            graph = nx.Graph()
+            graph.add_nodes_from(locations.values())
+            graph.add_edges_from(
+                (locations[locationS], locations[locationT])
+                for locationS, locationT in state["connections"]
+            )
+            world.use_topology(list(locations.values()), graph)
+
+        world.restore_time(state["time"])
+
+        entities: Dict[str, Entity] = {}
+        for entry in state["entities"]:
+            if entry["kind"] == "agent":
+                entity: Entity = Agent(entry["name"], world)
+            else:
+                entity = Object(entry["name"])
+                for label, value in copy.deepcopy(entry["attributes"]).items():
+                    entity.add_attribute(label, value)
+
+            location = locations[entry["location"]] if entry["location"] is not None else None
+            world.restore_entity(entity, location, entry["time_since_last_movement"])
+            entities[entry["name"]] = entity
+
+        registries = [
+            self.__restore_registry(registry, entities, locations) for registry in state["registries"]
+        ]
+        weight_vectors = [
+            self.__restore_weight_vector(registries[weight_vector["registry"]], weight_vector["values"])
+            for weight_vector in state["weight_vectors"]
+        ]
+
+        # Practices reference other entities, so they are restored last
+        for entry in state["entities"]:
+            if entry["kind"] != "agent":
+                continue
+
+            agent = entities[entry["name"]]
+            weight_vector_by_practice: Dict[Type[Practice], WeightVector] = {
+                Practice.find(label): weight_vectors[index] for label, index in entry["weights"].items()
+            }
+
+            practice = None
+            if entry["practice"] is not None:
+                practice = Practice.find(entry["practice"]["label"]).from_state(
+                    agent, world, entry["practice"], entities, locations
+                )
+
+            assert isinstance(agent, Agent)
+            agent.restore_state(weight_vector_by_practice, practice)
+
+        return world
+
+    @staticmethod
+    def __restore_registry(
+        registry: List[Tuple[str, Optional[List[Tuple[str, Any]]]]],
+        entities: Dict[str, Entity],
+        locations: Dict[str, Location],
+    ) -> ContextRegistry:
+        context_registry = ContextRegistry()
+        for label, values in registry:
+            if values is None:
+                context_registry.registerScalarFeature(label)
+            else:
+                context_registry.registerCategoricalFeature(
+                    label, [_decode_value(value, entities, locations) for value in values]
+                )
+        return context_registry
+
+    @staticmethod
+    def __restore_weight_vector(context_registry: ContextRegistry, values: array) -> WeightVector:
+        # Values follow WeightVector.to_array, NaN marks a missing weight
+        weight_vector = context_registry.createEmptyWeightVector()
+        position = 0
+        for label in context_registry.feature_labels:
+            for value in context_registry.getFeatureValues(label):
+                weight, bias = values[position], values[position + 1]
+                position += 2
+                if math.isnan(weight) and math.isnan(bias):
+                    continue
+                if value is None:
+                    weight_vector.registerScalarFeatureWeights(label, weight, bias)
+                else:
+                    weight_vector.registerCategorialFeatureWeights(label, value, weight, bias)
+        return weight_vector
+
+    # Persistence
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(pickle.dumps(self.__state, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "WorldSnapshot":
+        return cls(pickle.loads(zlib.decompress(data)))
+
+    def save(self, filepath: str) -> None:
+        # Written next to the target and renamed, an interrupted save keeps
+        # the previous snapshot
+        temporary = f"{filepath}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(self.to_bytes())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, filepath)
+
+    @classmethod
+    def load(cls, filepath: str) -> "WorldSnapshot":
+        with open(filepath, "rb") as file:
+            return cls.from_bytes(file.read())
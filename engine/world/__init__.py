@@ -1,2 +1,4 @@
 from .world import World
 from .location import Location
+from .template import WorldTemplate
+from .pathfinding import LandmarkPathfinder
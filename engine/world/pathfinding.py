@@ -0,0 +1,391 @@
+import heapq
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy
+
+from .location import Location
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+START = -1
+TARGET = -2
+
+
+def movement_cost(locationS: Location, locationT: Location) -> float:
+    # Symmetric, so distances from a landmark are also distances to it. Along
+    # a path it adds the min_time_inside of every intermediate location plus
+    # one per step, the halves of both ends being the same for every path.
+    return (locationS.min_time_inside + locationT.min_time_inside) / 2 + 1
+
+
+class Corridor:
+    def __init__(self, locationS: int, locationT: int, interior: List[Location], prefix: List[float], cost: float) -> None:
+        # interior runs from locationS to locationT, prefix[i] is the cost
+        # from locationS to interior[i]
+        self.locationS = locationS
+        self.locationT = locationT
+        self.interior = interior
+        self.prefix = prefix
+        self.cost = cost
+
+    def between(self, origin: int) -> List[Location]:
+        return self.interior if origin == self.locationS else self.interior[::-1]
+
+
+class LandmarkPathfinder:
+    # A* over a reduced graph with ALT (landmark and triangle inequality)
+    # lower bounds. Chains of is_path locations with two neighbours are
+    # collapsed into corridor edges; only the remaining core locations are
+    # searched and keep distances to the landmarks. Costs follow
+    # movement_cost, so paths minimise the time spent inside locations.
+    # Queries are sub-millisecond when most locations are corridors (town
+    # maps of 10k locations keep about a tenth of them as core). On maps
+    # that are nearly all core, such as grids or random geometric graphs of
+    # 10k locations, a query is a plain ALT search of a few hundred
+    # expansions and takes several milliseconds.
+
+    def __init__(self, graph: "nx.Graph", num_landmarks: int = 8) -> None:
+        if num_landmarks < 1:
+            raise Exception("A landmark pathfinder needs at least one landmark")
+        self.__num_landmarks: int = num_landmarks
+        self.__core: List[Location] = []
+        self.__index: Dict[Location, int] = {}
+        self.__adjacency: List[List[Tuple[int, float, int]]] = []
+        self.__corridors: List[Corridor] = []
+        # Interior location -> (corridor, position in its interior)
+        self.__interior: Dict[Location, Tuple[int, int]] = {}
+
+        self.__collapse(graph)
+        self.__component: List[int] = self.__components()
+        self.__landmarks: List[int] = []
+        # Core location x landmark, searched as arrays per expansion
+        self.__distances: numpy.ndarray = self.__select_landmarks()
+        # Dead end branches (e.g. houses at the end of a corridor) are only
+        # searched towards the target, the edges into them are left out of
+        # the search arrays
+        self.__tree_parent: Dict[int, Tuple[int, float, int]] = self.__strip_trees()
+        search = [
+            [
+                edge
+                for edge in edges
+                if edge[0] not in self.__tree_parent or self.__tree_parent[edge[0]][0] != node
+            ]
+            for node, edges in enumerate(self.__adjacency)
+        ]
+        self.__neighbours: List[numpy.ndarray] = [
+            numpy.array([neighbour for neighbour, _, _ in edges], dtype=numpy.int64) for edges in search
+        ]
+        self.__weights: List[numpy.ndarray] = [
+            numpy.array([weight for _, weight, _ in edges], dtype=numpy.float64) for edges in search
+        ]
+        self.__via: List[numpy.ndarray] = [
+            numpy.array([corridor for _, _, corridor in edges], dtype=numpy.int64) for edges in search
+        ]
+
+    def rebuild(self, graph: "nx.Graph") -> "LandmarkPathfinder":
+        return LandmarkPathfinder(graph, self.__num_landmarks)
+
+    @property
+    def num_landmarks(self) -> int:
+        return self.__num_landmarks
+
+    @property
+    def landmarks(self) -> List[Location]:
+        return [self.__core[landmark] for landmark in self.__landmarks]
+
+    @property
+    def num_core_locations(self) -> int:
+        return len(self.__core)
+
+    @property
+    def num_corridors(self) -> int:
+        return len(self.__corridors)
+
+    # Preprocessing
+
+    def __add_core(self, location: Location) -> int:
+        self.__index[location] = len(self.__core)
+        self.__core.append(location)
+        self.__adjacency.append([])
+        return self.__index[location]
+
+    def __collapse(self, graph: "nx.Graph") -> None:
+        def collapsible(location: Location) -> bool:
+            return location.is_path and graph.degree(location) == 2
+
+        for location in graph.nodes:
+            if not collapsible(location):
+                self.__add_core(location)
+
+        for location in list(self.__core):
+            self.__walk_corridors(graph, location, collapsible)
+
+        # Rings made only of collapsible locations have no core location to
+        # start from, one of their locations is promoted
+        for location in graph.nodes:
+            if collapsible(location) and location not in self.__interior and location not in self.__index:
+                self.__add_core(location)
+                self.__walk_corridors(graph, location, collapsible)
+
+        # Parallel corridors, or a corridor beside a direct edge, join the
+        # same core locations; only the cheapest can be on a shortest path,
+        # and the search relaxes one edge per neighbour. The interiors of the
+        # others stay reachable through the ends of their corridors.
+        for node, edges in enumerate(self.__adjacency):
+            cheapest: Dict[int, Tuple[int, float, int]] = {}
+            for edge in edges:
+                if edge[0] not in cheapest or edge[1] < cheapest[edge[0]][1]:
+                    cheapest[edge[0]] = edge
+            self.__adjacency[node] = list(cheapest.values())
+
+    def __walk_corridors(self, graph: "nx.Graph", location: Location, collapsible) -> None:
+        origin = self.__index[location]
+        for neighbour in graph.adj[location]:
+            if neighbour in self.__index:
+                # Direct edges are added once, from their first end
+                if self.__index[neighbour] > origin:
+                    weight = movement_cost(location, neighbour)
+                    self.__adjacency[origin].append((self.__index[neighbour], weight, -1))
+                    self.__adjacency[self.__index[neighbour]].append((origin, weight, -1))
+                continue
+            if neighbour in self.__interior:
+                continue
+
+            interior: List[Location] = []
+            prefix: List[float] = []
+            cost = 0.0
+            previous, current = location, neighbour
+            while current not in self.__index and collapsible(current):
+                cost += movement_cost(previous, current)
+                interior.append(current)
+                prefix.append(cost)
+                following = [other for other in graph.adj[current] if other is not previous]
+                previous, current = current, following[0]
+            cost += movement_cost(previous, current)
+
+            corridor = len(self.__corridors)
+            end = self.__index[current]
+            self.__corridors.append(Corridor(origin, end, interior, prefix, cost))
+            for position, member in enumerate(interior):
+                self.__interior[member] = (corridor, position)
+            if end != origin:
+                self.__adjacency[origin].append((end, cost, corridor))
+                self.__adjacency[end].append((origin, cost, corridor))
+
+    def __components(self) -> List[int]:
+        component = [-1] * len(self.__core)
+        for start in range(len(self.__core)):
+            if component[start] != -1:
+                continue
+            component[start] = start
+            pending = [start]
+            while pending:
+                node = pending.pop()
+                for neighbour, _, _ in self.__adjacency[node]:
+                    if component[neighbour] == -1:
+                        component[neighbour] = start
+                        pending.append(neighbour)
+        return component
+
+    def __strip_trees(self) -> Dict[int, Tuple[int, float, int]]:
+        # Repeatedly removes locations with a single edge left, each keeping
+        # that edge to its parent; what remains is the cycle carrying part of
+        # the graph plus one root per tree shaped component
+        degree = [len(edges) for edges in self.__adjacency]
+        removed = [False] * len(self.__core)
+        parents: Dict[int, Tuple[int, float, int]] = {}
+        leaves = [node for node, edges in enumerate(self.__adjacency) if len(edges) == 1]
+        while leaves:
+            node = leaves.pop()
+            if degree[node] != 1:
+                continue
+            removed[node] = True
+            degree[node] = 0
+            for neighbour, weight, corridor in self.__adjacency[node]:
+                if not removed[neighbour]:
+                    parents[node] = (neighbour, weight, corridor)
+                    degree[neighbour] -= 1
+                    if degree[neighbour] == 1:
+                        leaves.append(neighbour)
+        return parents
+
+    def __dijkstra(self, source: int) -> List[float]:
+        distances = [float("inf")] * len(self.__core)
+        distances[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            for neighbour, weight, _ in self.__adjacency[node]:
+                candidate = distance + weight
+                if candidate < distances[neighbour]:
+                    distances[neighbour] = candidate
+                    heapq.heappush(heap, (candidate, neighbour))
+        return distances
+
+    def __select_landmarks(self) -> numpy.ndarray:
+        # Farthest point selection; unreachable locations count as farthest,
+        # so every component gets a landmark while there are landmarks left
+        if not self.__core:
+            return numpy.zeros((0, self.__num_landmarks))
+
+        from_first = numpy.array(self.__dijkstra(0))
+        from_first[numpy.isinf(from_first)] = -1
+        candidate = int(numpy.argmax(from_first))
+
+        rows = []
+        closest = numpy.full(len(self.__core), numpy.inf)
+        for _ in range(min(self.__num_landmarks, len(self.__core))):
+            self.__landmarks.append(candidate)
+            row = numpy.array(self.__dijkstra(candidate))
+            rows.append(row)
+            closest = numpy.minimum(closest, row)
+            candidate = int(numpy.argmax(closest))
+
+        # Locations a landmark cannot reach are in another component, where
+        # the bound is never used against a reachable location
+        distances = numpy.array(rows).T.copy()
+        distances[numpy.isinf(distances)] = 0.0
+        return distances
+
+    # Queries
+
+    def __component_of(self, location: Location) -> int:
+        if location in self.__index:
+            return self.__component[self.__index[location]]
+        if location in self.__interior:
+            corridor = self.__corridors[self.__interior[location][0]]
+            return self.__component[corridor.locationS]
+        raise Exception(f"Location {location} is not part of the pathfinding graph")
+
+    def get_path(self, origin: Location, destination: Location) -> List[Location]:
+        if self.__component_of(origin) != self.__component_of(destination):
+            raise Exception(f"No path between {origin} and {destination}")
+        if origin == destination:
+            return [origin]
+
+        distances = self.__distances
+        costs = numpy.full(len(self.__core), numpy.inf)
+        target_cost = numpy.inf
+        parents: Dict[int, Tuple[int, int, Optional[List[Location]]]] = {}
+        # Entries are (cost + bound, bound, order, location), ties go to the
+        # location closer to the target
+        heap: List[Tuple[float, float, int, int]] = []
+        order = 0
+
+        # The target is a core location or a virtual node reached from both
+        # ends of its corridor
+        exits: Dict[int, Tuple[float, List[Location]]] = {}
+        if destination in self.__index:
+            target = self.__index[destination]
+            target_distances = distances[target]
+        else:
+            target = TARGET
+            corridor_index, position = self.__interior[destination]
+            corridor = self.__corridors[corridor_index]
+            to_start, to_end = corridor.prefix[position], corridor.cost - corridor.prefix[position]
+            exits[corridor.locationS] = (to_start, corridor.interior[:position])
+            if corridor.locationT not in exits or to_end < to_start:
+                exits[corridor.locationT] = (to_end, corridor.interior[position + 1 :][::-1])
+            target_distances = numpy.minimum(
+                distances[corridor.locationS] + to_start, distances[corridor.locationT] + to_end
+            )
+
+        # The branches holding the target are entered from their parents
+        descend: Dict[int, List[Tuple[int, float, int]]] = {}
+        for end in [target] if target != TARGET else list(exits):
+            while end in self.__tree_parent:
+                parent, weight, corridor_index = self.__tree_parent[end]
+                if any(child == end for child, _, _ in descend.get(parent, ())):
+                    break
+                descend.setdefault(parent, []).append((end, weight, corridor_index))
+                end = parent
+
+        def push(node: int, cost: float, parent: int, corridor: int, between: Optional[List[Location]]) -> None:
+            nonlocal order, target_cost
+            if node == TARGET:
+                if cost >= target_cost:
+                    return
+                target_cost, bound = cost, 0.0
+            else:
+                if cost >= costs[node]:
+                    return
+                costs[node] = cost
+                bound = float(numpy.abs(distances[node] - target_distances).max())
+            parents[node] = (parent, corridor, between)
+            heapq.heappush(heap, (cost + bound, bound, order, node))
+            order += 1
+
+        if origin in self.__index:
+            push(self.__index[origin], 0.0, START, -1, None)
+        else:
+            corridor_index, position = self.__interior[origin]
+            corridor = self.__corridors[corridor_index]
+            push(corridor.locationS, corridor.prefix[position], START, -1, corridor.interior[:position][::-1])
+            push(corridor.locationT, corridor.cost - corridor.prefix[position], START, -1, corridor.interior[position + 1 :])
+            if target == TARGET and self.__interior[destination][0] == corridor_index:
+                other = self.__interior[destination][1]
+                between = corridor.interior[position + 1 : other] if position < other else corridor.interior[other + 1 : position][::-1]
+                push(TARGET, abs(corridor.prefix[other] - corridor.prefix[position]), START, -1, between)
+
+        neighbours, weights, corridors = self.__neighbours, self.__weights, self.__via
+        while heap:
+            estimate, bound, _, node = heapq.heappop(heap)
+            if node == target:
+                return self.__build_path(origin, destination, target, parents)
+            cost = estimate - bound
+            if cost > costs[node]:
+                continue
+
+            # Bounds of all the improved neighbours at once; closed locations
+            # never improve, as the bounds are consistent
+            candidates = cost + weights[node]
+            improved = candidates < costs[neighbours[node]]
+            if improved.any():
+                nodes = neighbours[node][improved]
+                costs[nodes] = candidates[improved]
+                bounds = numpy.abs(distances[nodes] - target_distances).max(axis=1)
+                for neighbour, candidate, neighbour_bound, corridor_index in zip(
+                    nodes.tolist(), candidates[improved].tolist(), bounds.tolist(), corridors[node][improved].tolist()
+                ):
+                    parents[neighbour] = (node, corridor_index, None)
+                    heapq.heappush(heap, (candidate + neighbour_bound, neighbour_bound, order, neighbour))
+                    order += 1
+
+            for child, weight, corridor_index in descend.get(node, ()):
+                push(child, cost + weight, node, corridor_index, None)
+            if node in exits:
+                to_target, between = exits[node]
+                push(TARGET, cost + to_target, node, -1, between)
+
+        raise Exception(f"No path between {origin} and {destination}")
+
+    def __build_path(
+        self,
+        origin: Location,
+        destination: Location,
+        target: int,
+        parents: Dict[int, Tuple[int, int, Optional[List[Location]]]],
+    ) -> List[Location]:
+        steps = []
+        node = target
+        while node != START:
+            parent, corridor, between = parents[node]
+            steps.append((parent, node, corridor, between))
+            node = parent
+        steps.reverse()
+
+        path = [origin]
+        for parent, node, corridor, between in steps:
+            if between is not None:
+                path.extend(between)
+            elif corridor != -1:
+                path.extend(self.__corridors[corridor].between(parent))
+            path.append(destination if node == TARGET else self.__core[node])
+        # A core origin is its own first step
+        return path[1:] if path[1] is origin else path
+
+    def path_cost(self, path: List[Location]) -> float:
+        return sum(movement_cost(locationS, locationT) for locationS, locationT in zip(path, path[1:]))
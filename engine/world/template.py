@@ -0,0 +1,146 @@
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+
+from utils.simulation_context import SimulationContext
+from ..agents.context_registry import ContextRegistry
+from ..entities import Entity, Object
+from .location import Location
+from .world import World
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+
+class ObjectTemplate:
+    def __init__(self, name: str, location: Location, attributes: Dict[str, Any]) -> None:
+        self.name: str = name
+        self.location: Location = location
+        self.attributes: Dict[str, Any] = attributes
+
+
+class WorldTemplate:
+    # Topology, objects and location features are declared and validated once.
+    # instantiate() then shares the immutable locations and graph with every
+    # new World and only creates the (mutable) objects again.
+
+    def __init__(self) -> None:
+        self.__locations: Dict[str, Location] = {}
+        self.__connections: List[Tuple[Location, Location]] = []
+        self.__objects: List[ObjectTemplate] = []
+        self.__object_names: Set[str] = set()
+        self.__graph: Optional["nx.Graph"] = None
+        self.__context_registry: Optional[ContextRegistry] = None
+
+    @property
+    def locations(self) -> List[Location]:
+        return list(self.__locations.values())
+
+    @property
+    def objects(self) -> List[ObjectTemplate]:
+        return self.__objects
+
+    @property
+    def graph(self) -> "nx.Graph":
+        self.compile()
+        assert self.__graph is not None
+        return self.__graph
+
+    def get_location(self, name: str) -> Location:
+        if name not in self.__locations:
+            raise Exception(f"Location {name} not in template")
+        return self.__locations[name]
+
+    def __check_not_compiled(self) -> None:
+        if self.__graph is not None:
+            raise Exception("Trying to change a world template after compiling it")
+
+    def add_location(self, name: str, min_time_inside: int, is_path: bool) -> Location:
+        self.__check_not_compiled()
+
+        if name in self.__locations:
+            raise Exception(f"Trying to add location {name} already in template!")
+
+        location = Location(name, min_time_inside=min_time_inside, is_path=is_path)
+        self.__locations[name] = location
+        return location
+
+    def connect(self, locationS: Location, locationT: Location) -> None:
+        self.__check_not_compiled()
+
+        for location in (locationS, locationT):
+            if self.__locations.get(location.name) is not location:
+                raise Exception(
+                    f"Trying to connect location {location} not previously added!"
+                )
+
+        self.__connections.append((locationS, locationT))
+
+    def add_object(self, name: str, location: Location, attributes: Dict[str, Any]) -> None:
+        self.__check_not_compiled()
+
+        if self.__locations.get(location.name) is not location:
+            raise Exception(f"Placing object on location {location} not in template")
+
+        if name in self.__object_names:
+            raise Exception(f"Trying to add object {name} already in template!")
+
+        self.__objects.append(ObjectTemplate(name, location, dict(attributes)))
+        self.__object_names.add(name)
+
+    def add_bed(self, name: str, location: Location) -> None:
+        self.add_object(name, location, {"bed": True, "occupied": False})
+
+    def compile(self) -> "WorldTemplate":
+        if self.__graph is not None:
+            return self
+
+        import networkx as nx
+
+        graph = nx.Graph()
+        for location in self.__locations.values():
+            graph.add_node(location)
+        for locationS, locationT in self.__connections:
+            graph.add_edge(locationS, locationT)
+
+        if len(graph) > 0 and not nx.is_connected(graph):
+            raise Exception("World template has locations that cannot be reached")
+
+        locations = self.locations
+        context_registry = ContextRegistry()
+        context_registry.registerScalarFeature("Time")
+        context_registry.registerScalarFeature("NumberNearbyAgent")
+        context_registry.registerCategoricalFeature("CurrentLocation", locations)
+        context_registry.registerCategoricalFeature("TargetLocation", locations)
+
+        self.__graph = graph
+        self.__context_registry = context_registry
+        return self
+
+    def instantiate(self, context: Optional[SimulationContext] = None) -> World:
+        self.compile()
+        assert self.__graph is not None
+
+        world = World(context)
+        world.use_topology(self.locations, self.__graph)
+
+        for template in self.__objects:
+            entity = Object(template.name)
+            for label, value in template.attributes.items():
+                entity.add_attribute(label, value)
+            world.register_entity(entity)
+            world.place_entity(entity, template.location)
+
+        return world
+
+    def create_context_registry(
+        self, world: World, target_entities: Optional[List[Entity]] = None
+    ) -> ContextRegistry:
+        # The location features are shared; entities differ between worlds
+        self.compile()
+        assert self.__context_registry is not None
+
+        if target_entities is None:
+            target_entities = world.entities
+
+        context_registry = self.__context_registry.copy()
+        context_registry.registerCategoricalFeature("TargetEntity", target_entities)
+        return context_registry
@@ -1,55 +1,108 @@
 
-from typing import Dict, List, Optional, Any
+from typing import TYPE_CHECKING, Dict, List, Optional, Any, Set, Tuple, Type
 
-import matplotlib.pyplot as plt
-import networkx as nx
-
-from utils.dependency_manager import DependencyManager
+from utils.simulation_context import SimulationContext
 from ..logger import Logger
 from ..entities import Entity
 from .location import Location
+from .pathfinding import LandmarkPathfinder
+
+if TYPE_CHECKING:
+    import networkx as nx
+    from ..agents.p_interaction import InteractionMatcher
 
 
 class EntityDetails:
     location: Optional[Location]
     time_since_last_movement: int
+    order: int
 
-    def __init__(self) -> None:
+    def __init__(self, order: int = 0) -> None:
         self.location = None
         self.time_since_last_movement = 0
+        # Position in registration order, entities at a location are listed
+        # in this order
+        self.order = order
 
     def reset_timer(self) -> None:
         self.time_since_last_movement = 0
 
 
 class World:
-    def __init__(self) -> None:
+    def __init__(self, context: Optional[SimulationContext] = None) -> None:
         self.__entities: List[Entity] = []
         self.__locations: List[Location] = []
+        # Set mirror of the locations list for constant time membership checks
+        self.__location_set: Set[Location] = set()
         self.__entity_details: Dict[Entity, EntityDetails] = {}
-        self.__locations_graph: nx.Graph = nx.Graph()
+        self.__next_order: int = 0
+        # Occupancy index: the entities at each location grouped by type, and
+        # the lists handed out per location and type filter, dropped whenever
+        # an entity enters or leaves the location
+        self.__occupants: Dict[Location, Dict[type, Dict[Entity, None]]] = {}
+        self.__occupant_lists: Dict[Location, Dict[Optional[type], List[Entity]]] = {}
+        self.__interactions: Optional["InteractionMatcher"] = None
+        # Created on first use, so networkx is only imported by worlds that
+        # build their own topology
+        self.__locations_graph: Optional["nx.Graph"] = None
+        self.__shared_topology: bool = False
+        self.__pathfinder: Optional[LandmarkPathfinder] = None
+        self.__pathfinder_stale: bool = False
         self.__time: int = 0
-        self.__logger : Logger = DependencyManager.instance().get_logger()
+        self.__context: SimulationContext = context if context is not None else SimulationContext.default()
+        self.__logger : Logger = self.__context.logger
+
+    @property
+    def context(self) -> SimulationContext:
+        return self.__context
 
     # Entity Management
     @property
     def entities(self) -> List[Entity]:
         return self.__entities
 
+    @property
+    def entity_details(self) -> Dict[Entity, EntityDetails]:
+        return self.__entity_details
+
     def register_entity(self, entity: Entity) -> None:
-        if entity in self.__entities:
+        if entity in self.__entity_details:
             raise Exception("Trying to register entity already registered!")
 
         self.__entities.append(entity)
-        self.__entity_details[entity] = EntityDetails()
+        self.__entity_details[entity] = EntityDetails(self.__next_order)
+        self.__next_order += 1
 
     def unregister_entity(self, entity: Entity) -> None:
-        if entity not in self.__entities:
+        if entity not in self.__entity_details:
             raise Exception("Trying to unregister entity not registered!")
 
+        self.__set_location(entity, None)
         self.__entities.remove(entity)
         self.__entity_details.pop(entity)
 
+    def restore_entity(
+        self, entity: Entity, location: Optional[Location], time_since_last_movement: int
+    ) -> None:
+        # Registers and places an entity of a snapshot without logging it
+        self.register_entity(entity)
+        if location is not None and location not in self.__location_set:
+            raise Exception("Restoring entity on location not yet registered...")
+
+        self.__set_location(entity, location)
+        self.__entity_details[entity].time_since_last_movement = time_since_last_movement
+
+    def restore_time(self, time: int) -> None:
+        self.__time = time
+
+    def fork(self, context: Optional[SimulationContext] = None) -> "World":
+        # The fork shares the topology, both worlds copy it before changing it
+        from ..snapshot import WorldSnapshot
+
+        snapshot = WorldSnapshot.capture(self)
+        self.__shared_topology = True
+        return snapshot.restore(context, topology=self)
+
     def show_entities(self) -> None:
         for entity in self.__entities:
             print(entity)
@@ -106,75 +159,150 @@ class World:
 
     # Location Management
 
+    def use_topology(self, locations: List[Location], graph: "nx.Graph") -> None:
+        if self.__locations:
+            raise Exception("Trying to share a topology with a world that has locations")
+
+        self.__locations = list(locations)
+        self.__location_set = set(locations)
+        self.__locations_graph = graph
+        self.__shared_topology = True
+
+    def __own_topology(self) -> None:
+        # Copy on write, a shared graph must never be changed
+        if self.__shared_topology:
+            self.__locations_graph = self.graph.copy()
+            self.__shared_topology = False
+
+    def __change_topology(self) -> None:
+        self.__own_topology()
+        self.__pathfinder_stale = True
+
+    def set_pathfinder(self, pathfinder: Optional[LandmarkPathfinder]) -> None:
+        # None goes back to plain A* without weights. A pathfinder can be
+        # shared by worlds of the same topology, it is rebuilt on first use
+        # after the topology of this world changes.
+        self.__pathfinder = pathfinder
+        self.__pathfinder_stale = False
+
+    @property
+    def pathfinder(self) -> Optional[LandmarkPathfinder]:
+        return self.__pathfinder
+
     @property
     def locations(self) -> List[Location]:
         return self.__locations
 
+    @property
+    def graph(self) -> "nx.Graph":
+        if self.__locations_graph is None:
+            import networkx as nx
+
+            self.__locations_graph = nx.Graph()
+        return self.__locations_graph
+
     def register_location(self, location: Location) -> None:
-        if location in self.__locations:
+        if location in self.__location_set:
             raise Exception("Trying to register location already registered!")
 
+        self.__change_topology()
         self.__locations.append(location)
-        self.__locations_graph.add_node(location)
+        self.__location_set.add(location)
+        self.graph.add_node(location)
 
     def unregister_location(self, location: Location) -> None:
-        if location not in self.__locations:
+        if location not in self.__location_set:
             raise Exception("Trying to unregister location not registered!")
 
-        self.__locations.append(location)
-        self.__locations_graph.remove_node(location)
+        if self.__occupants.get(location):
+            raise Exception("Trying to unregister location with entities inside!")
+
+        self.__change_topology()
+        self.__locations.remove(location)
+        self.__location_set.remove(location)
+        self.graph.remove_node(location)
 
     def register_location_connection(
         self, locationS: Location, locationT: Location
     ) -> None:
-        if locationS not in self.__locations:
+        if locationS not in self.__location_set:
             raise Exception(
                 f"Trying to connect location {locationS} not previously registered!"
             )
 
-        if locationT not in self.__locations:
+        if locationT not in self.__location_set:
             raise Exception(
                 f"Trying to connect location {locationT} not previously registered!"
             )
 
-        self.__locations_graph.add_edge(locationS, locationT)
+        self.__change_topology()
+        self.graph.add_edge(locationS, locationT)
 
     def unregister_location_connection(
         self, locationS: Location, locationT: Location
     ) -> None:
 
-        if not self.__locations_graph.has_edge(locationS, locationT):
+        if not self.graph.has_edge(locationS, locationT):
             raise Exception(
                 f"Trying to disconnect locations {locationS} and {locationT} not previously connect!"
             )
 
-        self.__locations_graph.remove_edge(locationS, locationT)
+        self.__change_topology()
+        self.graph.remove_edge(locationS, locationT)
 
     # Movement
 
     def place_entity(self, entity: Entity, location: Location) -> None:
-        if entity not in self.__entities:
+        if entity not in self.__entity_details:
             raise Exception("Placing entity not yet registered...")
 
-        if location not in self.__locations:
+        if location not in self.__location_set:
             raise Exception("Placing entity on location not yet registered...")
 
-        self.__entity_details[entity].location = location
+        self.__set_location(entity, location)
         self.__entity_details[entity].reset_timer()
 
         self.__logger.register_entry(self.time, Logger.A_ENTITYENTERSLOCATION, entity, {"destination":location.name})
 
+    def __set_location(self, entity: Entity, location: Optional[Location]) -> None:
+        details = self.__entity_details[entity]
+        if details.location is not None:
+            entities = self.__occupants[details.location][type(entity)]
+            del entities[entity]
+            if not entities:
+                del self.__occupants[details.location][type(entity)]
+            self.__occupant_lists.pop(details.location, None)
+
+        details.location = location
+        if location is not None:
+            self.__occupants.setdefault(location, {}).setdefault(type(entity), {})[entity] = None
+            self.__occupant_lists.pop(location, None)
+
     def get_entity_location(self, entity: Entity) -> Optional[Location]:
-        if entity not in self.__entities:
+        details = self.__entity_details.get(entity)
+        if details is None:
             raise Exception("Getting location of entity not yet registered...")
 
-        if entity not in self.__entity_details:
-            raise Exception("Getting location of entity not yet placed...")
-
-        return self.__entity_details[entity].location
+        return details.location
 
     def get_path_to(self, origin: Location, destination: Location) -> List[Location]:
-        path = nx.astar_path(self.__locations_graph, origin, destination)
+        profiler = self.__context.profiler
+        if profiler is not None:
+            mark = profiler.now()
+            profiler.count("path_queries")
+
+        if self.__pathfinder is not None:
+            if self.__pathfinder_stale:
+                self.__pathfinder = self.__pathfinder.rebuild(self.graph)
+                self.__pathfinder_stale = False
+            path = self.__pathfinder.get_path(origin, destination)
+        else:
+            import networkx as nx
+
+            path = nx.astar_path(self.graph, origin, destination)
+
+        if profiler is not None:
+            profiler.lap("world.get_path_to", mark)
         return path
 
     def move_entity_to_location(self, entity: Entity, destination: Location) -> None:
@@ -183,7 +311,7 @@ class World:
         if entity_location is None:
             raise Exception("Trying to move entity before placing it in the world")
 
-        if destination not in self.__locations_graph.adj[entity_location]:
+        if destination not in self.graph.adj[entity_location]:
             raise Exception("Trying to move to location not adjacent")
 
         time = self.get_time_since_last_movement(entity)
@@ -193,7 +321,7 @@ class World:
                 "Attempting to move before spending the minimum time inside a location"
             )
 
-        self.__entity_details[entity].location = destination
+        self.__set_location(entity, destination)
         self.__entity_details[entity].reset_timer()
 
         self.__logger.register_entry(self.time, Logger.A_ENTITYENTERSLOCATION, entity, {"destination":destination.name})
@@ -217,8 +345,11 @@ class World:
     # Entity Management
 
     def get_entities_at_location(
-        self, perceiver: Entity, location: Location
+        self, perceiver: Entity, location: Location, entity_type: Optional[Type[Entity]] = None
     ) -> List[Entity]:
+        profiler = self.__context.profiler
+        if profiler is not None:
+            mark = profiler.now()
 
         actor_location = self.get_entity_location(perceiver)
 
@@ -228,20 +359,70 @@ class World:
         if actor_location != location:
             raise Exception("Trying to perceive location not currently in.")
 
-        entities = []
-
-        for entity, details in self.__entity_details.items():
-            if details.location == location:
-                entities.append(entity)
+        entities = list(self.occupants(location, entity_type))
 
+        if profiler is not None:
+            profiler.lap("world.get_entities_at_location", mark)
         return entities
 
+    def occupants(self, location: Location, entity_type: Optional[Type[Entity]] = None) -> List[Entity]:
+        # Entities at the location (of entity_type only, subclasses included)
+        # in registration order. The list is shared until the occupants change
+        # and must not be modified.
+        lists = self.__occupant_lists.setdefault(location, {})
+        if entity_type not in lists:
+            lists[entity_type] = sorted(
+                (
+                    entity
+                    for group_type, entities in self.__occupants.get(location, {}).items()
+                    if entity_type is None or issubclass(group_type, entity_type)
+                    for entity in entities
+                ),
+                key=lambda entity: self.__entity_details[entity].order,
+            )
+        return lists[entity_type]
+
+    def count_occupants(self, location: Location, entity_type: Optional[Type[Entity]] = None) -> int:
+        return sum(
+            len(entities)
+            for group_type, entities in self.__occupants.get(location, {}).items()
+            if entity_type is None or issubclass(group_type, entity_type)
+        )
+
+    # Interactions
+
+    def set_interactions(self, matcher: Optional["InteractionMatcher"]) -> None:
+        self.__interactions = matcher
+
+    @property
+    def interactions(self) -> Optional["InteractionMatcher"]:
+        return self.__interactions
+
     # Utilities
 
     def plot_map(self) -> None:
-        nx.draw(self.__locations_graph, with_labels=True)
+        import matplotlib.pyplot as plt
+        import networkx as nx
+
+        nx.draw(self.graph, with_labels=True)
         plt.show()
 
+    def keyframe(self) -> Tuple[Dict[str, Optional[str]], Dict[str, Optional[Dict[str, Any]]]]:
+        # Location of every entity and active practice of every agent, in the
+        # form they are logged by ENTITY_ENTERS_LOCATION and PRACTICE_STARTS
+        from ..agents import Agent
+
+        locations: Dict[str, Optional[str]] = {}
+        practices: Dict[str, Optional[Dict[str, Any]]] = {}
+        for entity, details in self.__entity_details.items():
+            locations[entity.name] = details.location.name if details.location is not None else None
+            if isinstance(entity, Agent):
+                practice = entity.current_practice
+                practices[entity.name] = (
+                    {'practice_label': practice.label} | practice.properties() if practice is not None else None
+                )
+        return locations, practices
+
     # Time Management
 
     @property
@@ -249,15 +430,20 @@ class World:
         return self.__time
 
     def tick(self):
-        self.__time += 1
+        profiler = self.__context.profiler
+        if profiler is not None:
+            mark = profiler.now()
 
-        entities_per_location = {}
-        for entity, details in self.__entity_details.items():
-            if details.location not in entities_per_location:
-                entities_per_location[details.location] = [entity]
-            else:
-                entities_per_location[details.location].append(entity)
+        self.__time += 1
 
         for entity in self.__entities:
             self.__entity_details[entity].time_since_last_movement += 1
             entity.tick()
+
+        keyframe_every = self.__logger.keyframe_every
+        if keyframe_every and self.__time % keyframe_every == 0:
+            self.__logger.register_keyframe(self.__time, *self.keyframe())
+
+        if profiler is not None:
+            profiler.lap("world.tick", mark)
+            profiler.end_tick(self.__time)
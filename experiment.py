@@ -1,20 +1,50 @@
+import argparse
 import csv
+import json
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from datetime import datetime
 import os
 import random
-from typing import List
+import signal
+import socket
+import time
+from typing import Any, Dict, List, Optional, Set
 
 import numpy
 
-from engine.agents import Agent, ContextRegistry, MoveToLocation, WeightVector
+from analysis.metrics import create_default_metrics
+from analysis.results import build_row
+from analysis.store import ResultsBuffer, ResultsStore
+from engine.agents import Agent, ContextRegistry, Interaction, MoveToLocation, WeightVector
 from engine.agents.p_basic import Idle, Sleep
+from engine.diagnostics import MemoryDiagnostics
+from engine.ensemble import EnsembleWorld
 from engine.entities.object import Object
-from engine.logger import Logger
-from engine.world import Location, World
-from utils.dependency_manager import DependencyManager
+from engine.logger import Logger, ChunkedLogWriter, expand_salience_vector
+from engine.world import Location, World, WorldTemplate
+from utils.job_queue import JobQueue, LeaseKeeper
+from utils.profiler import Profiler
+from utils.simulation_context import SimulationContext
 
 NUM_TICKS = 24000
 NUM_TICKS_TO_LOG_COMMIT = 10000
+KEEP_RAW_LOGS = True
+NUM_TICKS_PER_KEYFRAME = 1000
+RESULTS_STORE = "results"
+
+# The agents of run_world, used by the ensemble runs
+AGENT_STARTS = [
+    ("Agent1", "House1"),
+    ("Agent2", "House2"),
+    ("Agent3", "House3"),
+    ("Agent4", "House4"),
+    ("Agent5", "House1"),
+    ("Agent6", "House1"),
+    ("Agent7", "House2"),
+    ("Agent8", "House3"),
+    ("Agent9", "House3"),
+]
 
 
 def create_bed(name: str, world: World, location: Location) -> Object:
@@ -26,40 +56,40 @@ def create_bed(name: str, world: World, location: Location) -> Object:
     return bed
 
 
-def create_random_weight_vector(context_registry: ContextRegistry) -> WeightVector:
+def create_random_weight_vector(context_registry: ContextRegistry, rng: Any = numpy.random) -> WeightVector:
     weight_vector = context_registry.createEmptyWeightVector()
 
     weight_vector.registerScalarFeatureWeights(
-        "Time", numpy.random.uniform(-1, 1), numpy.random.uniform(-1, 1)
+        "Time", rng.uniform(-1, 1), rng.uniform(-1, 1)
     )
 
     for location in context_registry.getFeatureValues("CurrentLocation"):
         weight_vector.registerCategorialFeatureWeights(
             "CurrentLocation",
             location,
-            numpy.random.uniform(-1, 1),
-            numpy.random.uniform(-1, 1),
+            rng.uniform(-1, 1),
+            rng.uniform(-1, 1),
         )
 
     for location in context_registry.getFeatureValues("TargetLocation"):
         weight_vector.registerCategorialFeatureWeights(
             "TargetLocation",
             location,
-            numpy.random.uniform(-1, 1),
-            numpy.random.uniform(-1, 1),
+            rng.uniform(-1, 1),
+            rng.uniform(-1, 1),
         )
 
     for entity in context_registry.getFeatureValues("TargetEntity"):
         weight_vector.registerCategorialFeatureWeights(
             "TargetEntity",
             entity,
-            numpy.random.uniform(-1, 1),
-            numpy.random.uniform(-1, 1),
+            rng.uniform(-1, 1),
+            rng.uniform(-1, 1),
         )
 
     weight_vector.registerScalarFeatureWeights(
-        "NumberNearbyAgent", numpy.random.uniform(
-            -1, 1), numpy.random.uniform(-1, 1)
+        "NumberNearbyAgent", rng.uniform(
+            -1, 1), rng.uniform(-1, 1)
     )
 
     return weight_vector
@@ -69,126 +99,150 @@ def create_base_agent(
     name: str,
     world: World,
     starting: Location,
+    agents_name: Set[str],
 ) -> Agent:
 
     agent = Agent(name, world)
+    agents_name.add(name)
     world.register_entity(agent)
     world.place_entity(agent, starting)
     return agent
 
 
-def add_random_weights_to_practices(agent: Agent, context: ContextRegistry) -> None:
+def add_random_weights_to_practices(agent: Agent, context: ContextRegistry, interactions: bool = False) -> None:
+    rng = agent.world.context.rng
+
     agent.add_weight_vector(
-        MoveToLocation, create_random_weight_vector(context))
+        MoveToLocation, create_random_weight_vector(context, rng))
+
+    agent.add_weight_vector(Sleep, create_random_weight_vector(context, rng))
 
-    agent.add_weight_vector(Sleep, create_random_weight_vector(context))
+    agent.add_weight_vector(Idle, create_random_weight_vector(context, rng))
 
-    agent.add_weight_vector(Idle, create_random_weight_vector(context))
+    # Drawn last, so runs without interactions keep their random stream
+    if interactions:
+        agent.add_weight_vector(Interaction, create_random_weight_vector(context, rng))
 
 
-def run_world():
+WORLD_TEMPLATE: Optional[WorldTemplate] = None
 
-    logger = DependencyManager.instance().get_logger()
 
-    w1 = World()
+def build_world_template() -> WorldTemplate:
+    template = WorldTemplate()
 
     # Add Locations
-    house1 = Location("House1", min_time_inside=10, is_path=False)
-    house2 = Location("House2", min_time_inside=10, is_path=False)
-    house3 = Location("House3", min_time_inside=10, is_path=False)
-    house4 = Location("House4", min_time_inside=8, is_path=False)
-    square = Location("Square", min_time_inside=50, is_path=False)
-    path1 = Location("Path1", min_time_inside=1, is_path=True)
-    path2 = Location("Path2", min_time_inside=2, is_path=True)
-    path3 = Location("Path3", min_time_inside=2, is_path=True)
-    path4 = Location("Path4", min_time_inside=5, is_path=True)
-    path5 = Location("Path5", min_time_inside=10, is_path=True)
-    workplace1 = Location("Workplace 1", min_time_inside=10, is_path=False)
-    workplace2 = Location("Workplace 2", min_time_inside=10, is_path=False)
-
-    w1.register_location(house1)
-    w1.register_location(house2)
-    w1.register_location(house3)
-    w1.register_location(house4)
-    w1.register_location(workplace1)
-    w1.register_location(workplace2)
-    w1.register_location(square)
-    w1.register_location(path1)
-    w1.register_location(path2)
-    w1.register_location(path3)
-    w1.register_location(path4)
-    w1.register_location(path5)
-
-    w1.register_location_connection(house1, path1)
-    w1.register_location_connection(house2, path2)
-    w1.register_location_connection(house3, path2)
-    w1.register_location_connection(path1, square)
-    w1.register_location_connection(path2, square)
-    w1.register_location_connection(path3, square)
-    w1.register_location_connection(path3, path4)
-    w1.register_location_connection(path4, house4)
-    w1.register_location_connection(path3, workplace1)
-    w1.register_location_connection(path5, square)
-    w1.register_location_connection(path5, workplace2)
+    house1 = template.add_location("House1", min_time_inside=10, is_path=False)
+    house2 = template.add_location("House2", min_time_inside=10, is_path=False)
+    house3 = template.add_location("House3", min_time_inside=10, is_path=False)
+    house4 = template.add_location("House4", min_time_inside=8, is_path=False)
+    workplace1 = template.add_location("Workplace 1", min_time_inside=10, is_path=False)
+    workplace2 = template.add_location("Workplace 2", min_time_inside=10, is_path=False)
+    square = template.add_location("Square", min_time_inside=50, is_path=False)
+    path1 = template.add_location("Path1", min_time_inside=1, is_path=True)
+    path2 = template.add_location("Path2", min_time_inside=2, is_path=True)
+    path3 = template.add_location("Path3", min_time_inside=2, is_path=True)
+    path4 = template.add_location("Path4", min_time_inside=5, is_path=True)
+    path5 = template.add_location("Path5", min_time_inside=10, is_path=True)
+
+    template.connect(house1, path1)
+    template.connect(house2, path2)
+    template.connect(house3, path2)
+    template.connect(path1, square)
+    template.connect(path2, square)
+    template.connect(path3, square)
+    template.connect(path3, path4)
+    template.connect(path4, house4)
+    template.connect(path3, workplace1)
+    template.connect(path5, square)
+    template.connect(path5, workplace2)
 
     # Create Beds
-    create_bed("Bed 1", w1, house1)
-    create_bed("Bed 2", w1, house2)
-    create_bed("Bed 3", w1, house3)
-    create_bed("Bed 4", w1, house4)
-    create_bed("Bed 5", w1, house3)
-    create_bed("Bed 6", w1, house4)
-    create_bed("Bed 7", w1, house2)
-    create_bed("Bed 8", w1, house2)
-    create_bed("Bed 9", w1, house1)
+    template.add_bed("Bed 1", house1)
+    template.add_bed("Bed 2", house2)
+    template.add_bed("Bed 3", house3)
+    template.add_bed("Bed 4", house4)
+    template.add_bed("Bed 5", house3)
+    template.add_bed("Bed 6", house4)
+    template.add_bed("Bed 7", house2)
+    template.add_bed("Bed 8", house2)
+    template.add_bed("Bed 9", house1)
+
+    return template.compile()
+
+
+def get_world_template() -> WorldTemplate:
+    # Built once per process and shared by every run
+    global WORLD_TEMPLATE
+    if WORLD_TEMPLATE is None:
+        WORLD_TEMPLATE = build_world_template()
+    return WORLD_TEMPLATE
+
+
+def run_world(num_ticks: int = NUM_TICKS, context: Optional[SimulationContext] = None) -> Dict[str, float]:
+
+    if context is None:
+        context = SimulationContext.default()
+    logger = context.logger
+
+    # Metrics are computed online from the logged events
+    agents_name: Set[str] = set()
+    metrics = create_default_metrics(agents_name)
+    for metric in metrics:
+        logger.add_sink(metric)
+
+    template = get_world_template()
+    w1 = template.instantiate(context)
+    house1, house2, house3, house4 = [template.get_location(f"House{i}") for i in range(1, 5)]
 
     # Create Agent 1
-    agent_1 = create_base_agent(name="Agent1", world=w1, starting=house1)
-    agent_2 = create_base_agent(name="Agent2", world=w1, starting=house2)
-    agent_3 = create_base_agent(name="Agent3", world=w1, starting=house3)
-    agent_4 = create_base_agent(name="Agent4", world=w1, starting=house4)
-    agent_5 = create_base_agent(name="Agent5", world=w1, starting=house1)
-    agent_6 = create_base_agent(name="Agent6", world=w1, starting=house1)
-    agent_7 = create_base_agent(name="Agent7", world=w1, starting=house2)
-    agent_8 = create_base_agent(name="Agent8", world=w1, starting=house3)
-    agent_9 = create_base_agent(name="Agent9", world=w1, starting=house3)
+    agent_1 = create_base_agent(name="Agent1", world=w1, starting=house1, agents_name=agents_name)
+    agent_2 = create_base_agent(name="Agent2", world=w1, starting=house2, agents_name=agents_name)
+    agent_3 = create_base_agent(name="Agent3", world=w1, starting=house3, agents_name=agents_name)
+    agent_4 = create_base_agent(name="Agent4", world=w1, starting=house4, agents_name=agents_name)
+    agent_5 = create_base_agent(name="Agent5", world=w1, starting=house1, agents_name=agents_name)
+    agent_6 = create_base_agent(name="Agent6", world=w1, starting=house1, agents_name=agents_name)
+    agent_7 = create_base_agent(name="Agent7", world=w1, starting=house2, agents_name=agents_name)
+    agent_8 = create_base_agent(name="Agent8", world=w1, starting=house3, agents_name=agents_name)
+    agent_9 = create_base_agent(name="Agent9", world=w1, starting=house3, agents_name=agents_name)
     agents = [agent_1, agent_2, agent_3, agent_4,
               agent_5, agent_6, agent_7, agent_8, agent_9]
 
     # Define Features
-    context_registry = ContextRegistry()
-    context_registry.registerScalarFeature("Time")
-    context_registry.registerScalarFeature("NumberNearbyAgent")
-    context_registry.registerCategoricalFeature(
-        "CurrentLocation", w1.locations
-    )
-    context_registry.registerCategoricalFeature(
-        "TargetLocation", w1.locations
-    )
-    context_registry.registerCategoricalFeature(
-        "TargetEntity", w1.entities
-    )
-
-    add_random_weights_to_practices(agent_1, context_registry)
-    add_random_weights_to_practices(agent_2, context_registry)
-    add_random_weights_to_practices(agent_3, context_registry)
-    add_random_weights_to_practices(agent_4, context_registry)
-    add_random_weights_to_practices(agent_5, context_registry)
-    add_random_weights_to_practices(agent_6, context_registry)
-    add_random_weights_to_practices(agent_7, context_registry)
-    add_random_weights_to_practices(agent_8, context_registry)
-    add_random_weights_to_practices(agent_9, context_registry)
+    context_registry = template.create_context_registry(w1)
+    interactions = context.config.get("interactions", False)
+
+    add_random_weights_to_practices(agent_1, context_registry, interactions)
+    add_random_weights_to_practices(agent_2, context_registry, interactions)
+    add_random_weights_to_practices(agent_3, context_registry, interactions)
+    add_random_weights_to_practices(agent_4, context_registry, interactions)
+    add_random_weights_to_practices(agent_5, context_registry, interactions)
+    add_random_weights_to_practices(agent_6, context_registry, interactions)
+    add_random_weights_to_practices(agent_7, context_registry, interactions)
+    add_random_weights_to_practices(agent_8, context_registry, interactions)
+    add_random_weights_to_practices(agent_9, context_registry, interactions)
 
     # w1.plot_map()
 
+    # Memory reports (and tracemalloc diffs) every memory_every ticks
+    memory_every = context.config.get("memory_every")
+    diagnostics = None
+    if memory_every:
+        diagnostics = MemoryDiagnostics(w1)
+        diagnostics.start_tracing()
+
     # Simulate
     print("Starting Simulation...")
     start = datetime.now()
-    for i in range(NUM_TICKS):
+    for i in range(num_ticks):
         w1.tick()
+        if diagnostics is not None and (i + 1) % memory_every == 0:
+            print(json.dumps(diagnostics.report()))
+            print("\n".join(diagnostics.trace()))
         if i % NUM_TICKS_TO_LOG_COMMIT == 0:
             logger.commit()
     logger.commit()
+    if diagnostics is not None:
+        diagnostics.stop_tracing()
     print("Simulation ended")
 
     end = datetime.now()
@@ -196,10 +250,299 @@ def run_world():
     total_miliseconds = delta.total_seconds() * 1000 + delta.microseconds / 1000
 
     print(f"Total simulation took {total_miliseconds/1000} seconds")
-    print(f"Average tick took {total_miliseconds/NUM_TICKS} miliseconds")
+    print(f"Average tick took {total_miliseconds/num_ticks} miliseconds")
+
+    agent_practices = []
+    for agent in agents:
+        agent_practices.append(
+            {
+                practice.label: expand_salience_vector(
+                    practice.label, weight_vector.schema(), weight_vector.to_array()
+                )
+                for practice, weight_vector in agent.get_practice_and_weights().items()
+            }
+        )
 
-if __name__ == "__main__":
+    return build_row(agent_practices, metrics)
+
+def run_ensemble(size: int, num_ticks: int = NUM_TICKS, rng: Any = numpy.random) -> List[Dict[str, float]]:
+    # Simulates size worlds in lockstep, each with its own metrics
+    template = get_world_template()
 
-    while True:
-        DependencyManager.instance().add_logger(Logger(f"logs/{ datetime.now().strftime('%Y_%m_%d_%H_%M_%S_%f')}_{random.randint(0,9999)}.db"))
-        run_world()
+    loggers = []
+    metrics_per_world = []
+    for _ in range(size):
+        logger = Logger(None)
+        metrics = create_default_metrics({name for name, _ in AGENT_STARTS})
+        for metric in metrics:
+            logger.add_sink(metric)
+        loggers.append(logger)
+        metrics_per_world.append(metrics)
+
+    agents = [(name, template.get_location(location)) for name, location in AGENT_STARTS]
+    ensemble = EnsembleWorld(template, agents, size, rng, loggers)
+
+    start = datetime.now()
+    for i in range(num_ticks):
+        ensemble.tick()
+    seconds = (datetime.now() - start).total_seconds()
+    print(f"Ensemble of {size} worlds took {seconds} seconds")
+
+    rows = []
+    for world, metrics in enumerate(metrics_per_world):
+        agent_practices = []
+        for agent in range(len(agents)):
+            agent_practices.append(
+                {
+                    label: expand_salience_vector(label, ensemble.schema, weights)
+                    for label, weights in ensemble.weight_vectors(world, agent).items()
+                }
+            )
+        rows.append(build_row(agent_practices, metrics))
+
+    return rows
+
+
+def execute_ensemble(seed: int, num_ticks: int, size: int) -> List[Dict[str, float]]:
+    return run_ensemble(size, num_ticks, numpy.random.RandomState(seed))
+
+
+def execute_run(seed: int, num_ticks: int, profile: bool = False, memory_every: Optional[int] = None, interactions: bool = False) -> Dict[str, float]:
+    if KEEP_RAW_LOGS:
+        log = f"logs/run_{seed}{ChunkedLogWriter.EXTENSION}"
+        # The chunked writer appends to an existing log, a seed run again
+        # (e.g. a retried job) starts its log again instead of merging into it
+        if os.path.exists(log):
+            os.remove(log)
+        logger = Logger(log, keyframe_every=NUM_TICKS_PER_KEYFRAME)
+    else:
+        logger = Logger(None)
+
+    profiler = None
+    if profile:
+        profiler = Profiler(dump_every=NUM_TICKS_TO_LOG_COMMIT, dump_file=f"logs/profile_{seed}.jsonl")
+
+    config: Dict[str, Any] = {}
+    if memory_every:
+        config["memory_every"] = memory_every
+    if interactions:
+        config["interactions"] = True
+    try:
+        row = run_world(num_ticks, SimulationContext.from_seed(logger, seed, config, profiler))
+    finally:
+        # A failed run still leaves a readable log of the ticks it ran
+        logger.close()
+
+    if profiler is not None:
+        print(profiler.report())
+    return row
+
+
+def ignore_interrupts() -> None:
+    # Workers finish their current run; the parent decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_experiments(
+    runs: Optional[int],
+    duration: Optional[float],
+    workers: int,
+    base_seed: int,
+    num_ticks: int,
+    ensemble: int = 1,
+    profile: bool = False,
+    memory_every: Optional[int] = None,
+    interactions: bool = False,
+) -> None:
+    start = time.monotonic()
+    submitted = 0
+    completed = 0
+    stopping = False
+    pending: Dict[Future, int] = {}
+    # Rows are appended in batches; the buffer is flushed on the way out,
+    # interrupted or not
+    results = ResultsBuffer(ResultsStore(RESULTS_STORE))
+
+    def should_submit() -> bool:
+        if stopping:
+            return False
+        if runs is not None and submitted >= runs:
+            return False
+        if duration is not None and time.monotonic() - start >= duration:
+            return False
+        return True
+
+    with results, ProcessPoolExecutor(max_workers=workers, initializer=ignore_interrupts) as executor:
+        while True:
+            while len(pending) < workers and should_submit():
+                seed = base_seed + submitted
+                if ensemble > 1:
+                    # One job simulates a whole ensemble; seeds stay unique
+                    # because submitted counts worlds
+                    size = ensemble if runs is None else min(ensemble, runs - submitted)
+                    pending[executor.submit(execute_ensemble, seed, num_ticks, size)] = seed
+                    submitted += size
+                else:
+                    pending[executor.submit(execute_run, seed, num_ticks, profile, memory_every, interactions)] = seed
+                    submitted += 1
+
+            if not pending:
+                break
+
+            try:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            except KeyboardInterrupt:
+                print(f"Interrupted, waiting for {len(pending)} running simulations...")
+                stopping = True
+                continue
+
+            for future in done:
+                seed = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exception:
+                    print(f"Run with seed {seed} failed: {exception!r}")
+                    continue
+                rows = result if isinstance(result, list) else [result]
+                results.add(rows)
+                completed += len(rows)
+
+                elapsed = time.monotonic() - start
+                print(f"Run {completed} (seed {seed}) done, {completed / elapsed:.3f} runs/second")
+
+    elapsed = time.monotonic() - start
+    print(f"Finished {completed} runs in {elapsed:.1f} seconds ({completed / elapsed:.3f} runs/second)")
+
+
+def enqueue_runs(queue_path: str, runs: int, base_seed: int, num_ticks: int, ensemble: int = 1, interactions: bool = False) -> None:
+    # One job per run, or per ensemble of up to `ensemble` worlds
+    specs = []
+    seed = base_seed
+    while seed < base_seed + runs:
+        size = min(ensemble, base_seed + runs - seed)
+        specs.append({"seed": seed, "ticks": num_ticks, "ensemble": size, "interactions": interactions})
+        seed += size
+
+    queue = JobQueue(queue_path)
+    ids = queue.enqueue(specs)
+    queue.close()
+    print(f"Enqueued {len(ids)} jobs ({runs} runs, seeds {base_seed} to {base_seed + runs - 1})")
+
+
+def execute_job(spec: Dict[str, Any]) -> Dict[str, Any]:
+    seed, num_ticks, size = spec["seed"], spec["ticks"], spec.get("ensemble", 1)
+    if size > 1:
+        return {"rows": execute_ensemble(seed, num_ticks, size), "host": socket.gethostname(), "log": None}
+
+    log = os.path.abspath(f"logs/run_{seed}{ChunkedLogWriter.EXTENSION}") if KEEP_RAW_LOGS else None
+    row = execute_run(seed, num_ticks, interactions=spec.get("interactions", False))
+    return {"rows": [row], "host": socket.gethostname(), "log": log}
+
+
+def run_queue_worker(queue_path: str, poll_interval: float = 5.0) -> None:
+    # Claims jobs until none is left unfinished; jobs running elsewhere may
+    # still come back to the queue, so their end is waited for
+    queue = JobQueue(queue_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+
+    try:
+        while True:
+            job = queue.claim(worker)
+            if job is None:
+                if not queue.has_unfinished():
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            try:
+                with LeaseKeeper(queue, job.id, worker):
+                    result = execute_job(job.spec)
+            except KeyboardInterrupt:
+                queue.release(job.id, worker)
+                break
+            except Exception as exception:
+                print(f"Job {job.id} (seed {job.spec['seed']}) failed: {exception!r}")
+                queue.fail(job.id, worker, repr(exception))
+                continue
+
+            if queue.complete(job.id, worker, result):
+                print(f"Job {job.id} (seed {job.spec['seed']}) done by {worker}")
+            else:
+                print(f"Job {job.id} (seed {job.spec['seed']}) lost its lease, result discarded")
+    finally:
+        queue.close()
+
+
+def run_queue_workers(queue_path: str, workers: int) -> None:
+    processes = [multiprocessing.Process(target=run_queue_worker, args=(queue_path,)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print(f"Interrupted, waiting for {len(processes)} workers to give their jobs back...")
+        for process in processes:
+            process.join()
+
+    queue = JobQueue(queue_path)
+    print(f"Queue: {queue.counts()}")
+    queue.close()
+
+
+def collect_results(queue_path: str) -> None:
+    # Rows of finished jobs not collected yet go to the results store
+    queue = JobQueue(queue_path)
+    collected = []
+    rows = []
+    for job_id, _, result in queue.results(uncollected=True):
+        rows.extend(result["rows"])
+        collected.append(job_id)
+    # The rows are stored before the jobs are marked, a crash in between
+    # collects them again rather than losing them
+    ResultsStore(RESULTS_STORE).append(rows)
+    queue.mark_collected(collected)
+
+    for job_id, spec, error in queue.failures():
+        print(f"Job {job_id} (seed {spec['seed']}) failed: {error}")
+    print(f"Collected {len(collected)} jobs into {RESULTS_STORE}, queue: {queue.counts()}")
+    queue.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=None, help="number of worlds to simulate (default: until interrupted)")
+    parser.add_argument("--duration", type=float, default=None, help="stop submitting new runs after this many seconds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=None, help="seed of the first run; run i uses seed + i")
+    parser.add_argument("--ticks", type=int, default=NUM_TICKS)
+    parser.add_argument("--ensemble", type=int, default=1, help="number of worlds every worker simulates in lockstep")
+    parser.add_argument("--profile", action="store_true", help="time the phases of every tick and dump the counters to logs/profile_<seed>.jsonl")
+    parser.add_argument("--memory-every", type=int, default=None, help="print a memory report and tracemalloc diff every this many ticks")
+    parser.add_argument("--interactions", action="store_true", help="give the agents an Interaction practice with the agents at their location")
+    parser.add_argument("--queue", default=None, help="SQLite job queue shared by the runners, used with --enqueue, --worker or --collect")
+    parser.add_argument("--enqueue", action="store_true", help="add --runs runs to the queue and exit")
+    parser.add_argument("--worker", action="store_true", help="run --workers processes that execute jobs of the queue until it is drained")
+    parser.add_argument("--collect", action="store_true", help="append the rows of finished jobs to the results file")
+    args = parser.parse_args()
+
+    if args.interactions and args.ensemble > 1:
+        parser.error("--interactions is not supported by ensembles")
+
+    if args.queue is not None:
+        if args.worker:
+            run_queue_workers(args.queue, args.workers)
+        elif args.collect:
+            collect_results(args.queue)
+        elif args.enqueue:
+            if args.runs is None:
+                parser.error("--enqueue needs --runs")
+            base_seed = args.seed if args.seed is not None else random.randrange(2**31)
+            enqueue_runs(args.queue, args.runs, base_seed, args.ticks, args.ensemble, args.interactions)
+        else:
+            parser.error("--queue needs --enqueue, --worker or --collect")
+    else:
+        base_seed = args.seed if args.seed is not None else random.randrange(2**31)
+        print(f"Base seed {base_seed}")
+
+        run_experiments(args.runs, args.duration, args.workers, base_seed, args.ticks, args.ensemble, args.profile, args.memory_every, args.interactions)
@@ -1,26 +1,85 @@
-
-import pandas
-from scipy.stats import pearsonr
-from typing import Dict, Tuple
-
-if __name__ == "__main__":
-
-    data = pandas.read_csv("output_2022_04_07_14_41_08_016012_1370.csv")
-
-    features = data.columns.values.tolist()[:-14]
-    metrics = data.columns.values.tolist()[-14:]
-
-    for metric in metrics:
-        print(metric)
-
-    data_features = data[features]
-
-    correlation_pairs : Dict[Tuple, Tuple] = {}
-    
-    for feature in features:
-        for metric in metrics:
-            correlation_pairs[(feature, metric)] = pearsonr(data[feature], data[metric])
-        
-    for entry in correlation_pairs.items():
-        if abs(entry[1][0]) > 0.9:
-            print(f"{entry[1][0]} + {entry[1][1]} : {entry[0][0]} => {entry[0][1]}")
\ No newline at end of file
+import argparse
+import os
+from typing import List, Union
+
+import pandas
+from analysis.correlation import correlation_chunks, strong_correlations, StreamingCorrelation
+from analysis.store import ResultsStore, is_results_store, split_columns
+
+
+def read_chunks(results: str, rows_per_chunk: int, start: int = 0):
+    # Results stores are memory mapped, CSV files are parsed chunk by chunk;
+    # the first start rows are skipped
+    if is_results_store(results):
+        store = ResultsStore(results)
+        if len(store) < start:
+            raise Exception(f"Results store {results} has fewer rows than were already folded in")
+        return store.frames(rows_per_chunk, start=start)
+    return pandas.read_csv(results, chunksize=rows_per_chunk, skiprows=range(1, start + 1))
+
+
+def read_results(results: str) -> Union[ResultsStore, pandas.DataFrame]:
+    # Results stores are read column block by column block when correlated,
+    # CSV files are parsed whole; --streaming bounds the memory of those
+    if is_results_store(results):
+        return ResultsStore(results)
+    return pandas.read_csv(results)
+
+
+def stream_files(files: List[str], state_file: str, rows_per_chunk: int) -> StreamingCorrelation:
+    # Results files only ever grow, so the rows of every file folded into
+    # the saved accumulators are counted and the next run starts after them
+    correlation = None
+
+    if state_file is not None and os.path.isfile(state_file):
+        correlation = StreamingCorrelation.load(state_file)
+
+    for results_file in files:
+        source = os.path.abspath(results_file)
+        consumed = correlation.consumed(source) if correlation is not None else 0
+        for data in read_chunks(results_file, rows_per_chunk, consumed):
+            if correlation is None:
+                correlation = StreamingCorrelation(*split_columns(data.columns.values.tolist()))
+
+            ignored = set(data.columns) - set(correlation.features) - set(correlation.metrics)
+            if ignored:
+                print(f"Ignoring {len(ignored)} columns of {results_file} not present in the first results file")
+
+            correlation.update_frame(data)
+            consumed += len(data)
+            correlation.mark_consumed(source, consumed)
+
+        if state_file is not None and correlation is not None:
+            correlation.save(state_file)
+
+    if correlation is None:
+        raise Exception("No result rows to correlate")
+
+    return correlation
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("results", nargs="*", default=["output_2022_04_07_14_41_08_016012_1370.csv"])
+    parser.add_argument("--chunk-size", type=int, default=1024, help="number of feature columns correlated at once")
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--streaming", action="store_true", help="read the results files in row chunks and keep running accumulators")
+    parser.add_argument("--rows-per-chunk", type=int, default=10000)
+    parser.add_argument("--state", default=None, help="accumulator file; rows of the results files already folded into it are skipped")
+    args = parser.parse_args()
+
+    if args.streaming or len(args.results) > 1 or args.state is not None:
+        correlation = stream_files(args.results, args.state, args.rows_per_chunk)
+        metrics = correlation.metrics
+        chunks = correlation.chunks(args.chunk_size)
+    else:
+        data = read_results(args.results[0])
+        features, metrics = split_columns(list(data.columns))
+
+        chunks = correlation_chunks(data, features, metrics, args.chunk_size)
+
+    for metric in metrics:
+        print(metric)
+
+    for feature, metric, r, p in strong_correlations(chunks, metrics, args.threshold):
+        print(f"{r} + {p} : {feature} => {metric}")
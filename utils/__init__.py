@@ -1 +1,3 @@
-from .dependency_manager import DependencyManager
\ No newline at end of file
+from .dependency_manager import DependencyManager
+from .simulation_context import SimulationContext
+from .profiler import Profiler
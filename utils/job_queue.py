@@ -0,0 +1,209 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    spec TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    collected INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class Job:
+    def __init__(self, id: int, spec: Dict[str, Any], attempts: int) -> None:
+        self.id = id
+        self.spec = spec
+        self.attempts = attempts
+
+    def __repr__(self) -> str:
+        return f"Job({self.id}, {self.spec}, attempts={self.attempts})"
+
+
+class JobQueue:
+    # Jobs in a SQLite file, so runners on any machine that sees the file can
+    # share it without a server. A claim is a lease: a runner that stops
+    # renewing it (crashed, killed, disconnected) loses the job, which goes
+    # back to the queue until max_attempts claims have been made. Leases use
+    # the wall clock, so the clocks of the machines must agree.
+
+    def __init__(self, filepath: str, lease_seconds: float = 600.0, max_attempts: int = 3, timeout: float = 60.0) -> None:
+        self.__filepath: str = filepath
+        self.__lease_seconds: float = lease_seconds
+        self.__max_attempts: int = max_attempts
+        # Transactions are explicit; the rollback journal (not WAL) keeps the
+        # file usable from shared directories
+        self.__connection = sqlite3.connect(filepath, timeout=timeout, isolation_level=None)
+        self.__connection.executescript(SCHEMA)
+
+    @property
+    def filepath(self) -> str:
+        return self.__filepath
+
+    @property
+    def lease_seconds(self) -> float:
+        return self.__lease_seconds
+
+    def __transaction(self) -> "_Transaction":
+        return _Transaction(self.__connection)
+
+    def enqueue(self, specs: Iterable[Dict[str, Any]]) -> List[int]:
+        now = time.time()
+        ids = []
+        with self.__transaction() as cursor:
+            for spec in specs:
+                cursor.execute(
+                    "INSERT INTO jobs (spec, status, created, updated) VALUES (?, ?, ?, ?)",
+                    (json.dumps(spec), PENDING, now, now),
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def claim(self, worker: str) -> Optional[Job]:
+        now = time.time()
+        with self.__transaction() as cursor:
+            # Expired leases of jobs out of attempts are not retried
+            cursor.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, "lease expired", now, RUNNING, now, self.__max_attempts),
+            )
+            row = cursor.execute(
+                "SELECT id, spec, attempts FROM jobs WHERE status = ? OR (status = ? AND lease_until < ?) ORDER BY id LIMIT 1",
+                (PENDING, RUNNING, now),
+            ).fetchone()
+            if row is None:
+                return None
+
+            id, spec, attempts = row
+            cursor.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = ?, updated = ? WHERE id = ?",
+                (RUNNING, worker, now + self.__lease_seconds, attempts + 1, now, id),
+            )
+        return Job(id, json.loads(spec), attempts + 1)
+
+    def __update_owned(self, job_id: int, worker: str, assignments: str, values: Tuple[Any, ...]) -> bool:
+        # Only the runner holding the lease may change a running job
+        with self.__transaction() as cursor:
+            cursor.execute(
+                f"UPDATE jobs SET {assignments}, updated = ? WHERE id = ? AND worker = ? AND status = ?",
+                values + (time.time(), job_id, worker, RUNNING),
+            )
+            return cursor.rowcount == 1
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        return self.__update_owned(job_id, worker, "lease_until = ?", (time.time() + self.__lease_seconds,))
+
+    def complete(self, job_id: int, worker: str, result: Any) -> bool:
+        return self.__update_owned(job_id, worker, "status = ?, result = ?, lease_until = NULL", (DONE, json.dumps(result)))
+
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        with self.__transaction() as cursor:
+            row = cursor.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                raise Exception(f"Unknown job {job_id}")
+            status = PENDING if row[0] < self.__max_attempts else FAILED
+            cursor.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated = ? WHERE id = ? AND worker = ? AND status = ?",
+                (status, error, time.time(), job_id, worker, RUNNING),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, job_id: int, worker: str) -> bool:
+        # Gives a job back without counting the attempt (e.g. on shutdown)
+        return self.__update_owned(job_id, worker, "status = ?, attempts = attempts - 1, lease_until = NULL", (PENDING,))
+
+    def counts(self) -> Dict[str, int]:
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for status, count in self.__connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        return counts
+
+    def has_unfinished(self) -> bool:
+        counts = self.counts()
+        return counts[PENDING] + counts[RUNNING] > 0
+
+    def failures(self) -> List[Tuple[int, Dict[str, Any], str]]:
+        return [
+            (id, json.loads(spec), error)
+            for id, spec, error in self.__connection.execute(
+                "SELECT id, spec, error FROM jobs WHERE status = ? ORDER BY id", (FAILED,)
+            )
+        ]
+
+    def results(self, uncollected: bool = False) -> Iterator[Tuple[int, Dict[str, Any], Any]]:
+        query = "SELECT id, spec, result FROM jobs WHERE status = ?"
+        if uncollected:
+            query += " AND collected = 0"
+        for id, spec, result in self.__connection.execute(query + " ORDER BY id", (DONE,)).fetchall():
+            yield id, json.loads(spec), json.loads(result)
+
+    def mark_collected(self, job_ids: Iterable[int]) -> None:
+        with self.__transaction() as cursor:
+            cursor.executemany("UPDATE jobs SET collected = 1 WHERE id = ?", [(id,) for id in job_ids])
+
+    def close(self) -> None:
+        self.__connection.close()
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, so two runners can never
+    # read the same pending job and both claim it
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        self.__connection = connection
+
+    def __enter__(self) -> sqlite3.Cursor:
+        self.__cursor = self.__connection.cursor()
+        self.__cursor.execute("BEGIN IMMEDIATE")
+        return self.__cursor
+
+    def __exit__(self, exception_type, exception, traceback) -> None:
+        if exception_type is None:
+            self.__cursor.execute("COMMIT")
+        else:
+            self.__cursor.execute("ROLLBACK")
+
+
+class LeaseKeeper:
+    # Renews the lease of a job from a background thread while it runs; the
+    # thread has its own connection, as SQLite connections are per thread
+    def __init__(self, queue: JobQueue, job_id: int, worker: str) -> None:
+        self.__filepath: str = queue.filepath
+        self.__lease_seconds: float = queue.lease_seconds
+        self.__job_id: int = job_id
+        self.__worker: str = worker
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def __run(self) -> None:
+        queue = JobQueue(self.__filepath, lease_seconds=self.__lease_seconds)
+        try:
+            while not self.__stop.wait(self.__lease_seconds / 3):
+                if not queue.heartbeat(self.__job_id, self.__worker):
+                    break
+        finally:
+            queue.close()
+
+    def __enter__(self) -> "LeaseKeeper":
+        self.__thread.start()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback) -> None:
+        self.__stop.set()
+        self.__thread.join()
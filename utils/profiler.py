@@ -0,0 +1,90 @@
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+
+class Profiler:
+    # Opt-in instrumentation of the simulation loop. Phases are timed with
+    # lap(), which closes the phase started at `since` and returns the time
+    # to use as the start of the next one. Phase times are inclusive, so a
+    # nested phase (e.g. world.get_entities_at_location inside agent.generate)
+    # is also part of the time of its parent.
+
+    now = staticmethod(time.perf_counter)
+
+    def __init__(self, dump_every: Optional[int] = None, dump_file: Optional[str] = None) -> None:
+        self.__dump_every: Optional[int] = dump_every
+        self.__dump_file: Optional[str] = dump_file
+        self.reset()
+
+    def reset(self) -> None:
+        self.__times: Dict[str, float] = {}
+        self.__calls: Dict[str, int] = {}
+        self.__counters: Dict[str, int] = {}
+        self.__tick_counters: Dict[str, int] = {}
+        self.__max_per_tick: Dict[str, int] = {}
+        self.__ticks: int = 0
+
+    def lap(self, phase: str, since: float) -> float:
+        now = time.perf_counter()
+        self.__times[phase] = self.__times.get(phase, 0.0) + (now - since)
+        self.__calls[phase] = self.__calls.get(phase, 0) + 1
+        return now
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        self.__tick_counters[counter] = self.__tick_counters.get(counter, 0) + amount
+
+    def end_tick(self, tick: int) -> None:
+        for counter, value in self.__tick_counters.items():
+            self.__counters[counter] = self.__counters.get(counter, 0) + value
+            if value > self.__max_per_tick.get(counter, 0):
+                self.__max_per_tick[counter] = value
+        self.__tick_counters = {}
+        self.__ticks += 1
+
+        if self.__dump_every is not None and self.__ticks % self.__dump_every == 0:
+            self.dump(tick)
+
+    @property
+    def ticks(self) -> int:
+        return self.__ticks
+
+    def summary(self) -> Dict[str, Any]:
+        ticks = max(self.__ticks, 1)
+        return {
+            "ticks": self.__ticks,
+            "phases": {
+                phase: {
+                    "seconds": seconds,
+                    "calls": self.__calls[phase],
+                    "us_per_call": seconds * 1e6 / self.__calls[phase],
+                }
+                for phase, seconds in sorted(self.__times.items(), key=lambda item: -item[1])
+            },
+            "counters": {
+                counter: {
+                    "total": total,
+                    "per_tick": total / ticks,
+                    "max_per_tick": self.__max_per_tick.get(counter, 0),
+                }
+                for counter, total in sorted(self.__counters.items())
+            },
+        }
+
+    def report(self) -> str:
+        summary = self.summary()
+        lines: List[str] = [f"Profile of {summary['ticks']} ticks"]
+        for phase, stats in summary["phases"].items():
+            lines.append(f"  {phase:<36} {stats['seconds']:>10.4f}s {stats['calls']:>10} calls {stats['us_per_call']:>10.2f}us/call")
+        for counter, stats in summary["counters"].items():
+            lines.append(f"  {counter:<36} {stats['total']:>10} total {stats['per_tick']:>10.2f}/tick {stats['max_per_tick']:>8} max")
+        return "\n".join(lines)
+
+    def dump(self, tick: int) -> None:
+        if self.__dump_file is None:
+            print(f"Tick {tick}")
+            print(self.report())
+            return
+
+        with open(self.__dump_file, "a", encoding="utf-8") as file:
+            file.write(json.dumps({"tick": tick} | self.summary()) + "\n")
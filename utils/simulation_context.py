@@ -0,0 +1,56 @@
+from typing import Any, Dict, Optional
+
+import numpy
+
+from engine.logger import Logger
+from .dependency_manager import DependencyManager
+from .profiler import Profiler
+
+
+class SimulationContext:
+    def __init__(
+        self,
+        logger: Logger,
+        rng: Any = None,
+        config: Optional[Dict[str, Any]] = None,
+        profiler: Optional[Profiler] = None,
+    ) -> None:
+        self.__logger: Logger = logger
+        # Anything exposing the numpy.random API (choice, uniform, ...)
+        self.__rng: Any = rng if rng is not None else numpy.random
+        self.__config: Dict[str, Any] = config if config is not None else {}
+        # None disables the instrumentation of the simulation loop
+        self.__profiler: Optional[Profiler] = profiler
+        if profiler is not None:
+            logger.set_profiler(profiler)
+
+    @classmethod
+    def from_seed(
+        cls,
+        logger: Logger,
+        seed: int,
+        config: Optional[Dict[str, Any]] = None,
+        profiler: Optional[Profiler] = None,
+    ) -> "SimulationContext":
+        return cls(logger, numpy.random.RandomState(seed), config, profiler)
+
+    @classmethod
+    def default(cls) -> "SimulationContext":
+        # Fallback for code that still configures the global DependencyManager
+        return cls(DependencyManager.instance().get_logger())
+
+    @property
+    def logger(self) -> Logger:
+        return self.__logger
+
+    @property
+    def rng(self) -> Any:
+        return self.__rng
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self.__config
+
+    @property
+    def profiler(self) -> Optional[Profiler]:
+        return self.__profiler